@@ -1,77 +1,378 @@
 import os
 import re
+import json
 import hashlib
-from PIL import Image
+import unicodedata
 import google.generativeai as genai  # 統一標準導入方式
 
+import phash
+import metrics
+import image_preprocess
+from quiz_bank import CATEGORIES, validate_quiz
+from result_cache import get_result_cache
+
 # ==========================================
 # 1. 初始化設定
 # ==========================================
 # 從環境變數讀取 API Key (建議使用截圖中那組健康的 "0302" Key)
 API_KEY = os.environ.get("GEMINI_API_KEY")
+# 固定使用 1.5-flash 模型，穩定且快速
+MODEL_NAME = "gemini-3-flash-preview"
 
 if API_KEY:
     genai.configure(api_key=API_KEY)
-    # 固定使用 1.5-flash 模型，穩定且快速
-    MODEL_NAME = "gemini-3-flash-preview"
     model = genai.GenerativeModel(MODEL_NAME)
 else:
     # 防止 API Key 缺失導致整個程式崩潰
     model = None
     print("警告：未設定 GEMINI_API_KEY 環境變數")
 
+# 🤖 提示詞
+RECOGNIZE_PROMPT = "請辨識圖片中的物品名稱與材質，用繁體中文回答。格式：這是一個(物品)，材質是(材質)。"
+RECOGNIZE_NO_MODEL = "辨識失敗：API 未初始化，請檢查 API Key 設定。"
+RECOGNIZE_BUSY = "AI 辨識暫時忙碌中: {}"
+# 沒有 API 時的示範題目，以及 AI 回傳格式不符時的保底題目
+NO_MODEL_QUIZ = ("如何回收？", "(A)資源回收 (B)一般垃圾", "A", "請依規定處理。")
+FALLBACK_QUIZ = ("關於此物品的回收方式？", "(A)清洗後丟回收桶 (B)直接丟垃圾桶", "A", "正確的回收流程能減少環境負擔。")
+# 掃描時辨識 + 出題合併成一次 API 請求 (JSON 輸出)；設為 0 改回兩次請求
+GEMINI_FUSED_SCAN = os.environ.get("GEMINI_FUSED_SCAN", "1") != "0"
+# 掃描時另外請 AI 出題的話用串流模式 (結果頁可以先顯示題目)；設為 0 等整個回應
+GEMINI_STREAM_QUIZ = os.environ.get("GEMINI_STREAM_QUIZ", "1") != "0"
+
 # 🎮 遊戲平衡設定
 XP_REWARD_CORRECT = 50
 XP_REWARD_WRONG = 10
+XP_REWARD_BATCH_ITEM = 10  # 批次掃描不出題，每個辨識出來的物品給的經驗值
 XP_PER_LEVEL = 50
 
 # ==========================================
 # 2. 功能函數
 # ==========================================
 
+@metrics.timed('reborn_image_hash_seconds', "計算圖片 sha256 的時間")
 def get_image_hash(image_path):
-    """計算圖片 Hash 以防止重複上傳獲得經驗值"""
+    """
+    計算圖片 Hash 以防止重複上傳獲得經驗值 (分段讀取，不會整個檔案載入記憶體)
+    image_path 也可以是已開啟的檔案，讀完會回到開頭
+    """
+    if not isinstance(image_path, (str, os.PathLike)):
+        image_path.seek(0)
+        digest = hashlib.file_digest(image_path, "sha256").hexdigest()
+        image_path.seek(0)
+        return digest
     with open(image_path, "rb") as f:
-        return hashlib.sha256(f.read()).hexdigest()
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+@metrics.timed('reborn_perceptual_hash_seconds', "計算感知雜湊的時間")
+def get_perceptual_hash(image_path):
+    """計算圖片的感知雜湊，重新存檔或縮放過的同一張照片也會很接近"""
+    return phash.phash(image_path)
 
 def get_level(xp):
     """根據經驗值計算等級"""
     return (xp or 0) // XP_PER_LEVEL
 
-def recognize_item(image_path):
-    """呼叫 AI 辨識圖片中的回收物"""
+def normalize_item_description(item_description):
+    """出題快取用：統一全形半形、空白與結尾標點，同一個物品對到同一個 key"""
+    text = unicodedata.normalize('NFKC', item_description or '')
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip('。.!！ ')
+
+def recognize_cache_key(image_hash):
+    """辨識結果的快取 key"""
+    return f"{MODEL_NAME}:{image_hash}"
+
+def quiz_cache_key(item_description):
+    """題目的快取 key"""
+    return f"{MODEL_NAME}:{normalize_item_description(item_description)}"
+
+@metrics.timed('reborn_recognize_seconds', "QA.recognize_item 的時間 (含快取)")
+def recognize_item(image_path, image_hash=None):
+    """
+    呼叫 AI 辨識圖片中的回收物 (image_path 也可以是已開啟的檔案)
+    同一張照片 (sha256 相同) 的結果會被快取，不會再呼叫 API
+    """
+    cache_key = recognize_cache_key(image_hash or get_image_hash(image_path))
+    cached = get_result_cache().get('recognize', cache_key)
+    if cached is not None:
+        return cached
+    
     if not model:
-        return "辨識失敗：API 未初始化，請檢查 API Key 設定。"
+        return RECOGNIZE_NO_MODEL
     
     try:
-        img = Image.open(image_path)
-        # 設定辨識指令
-        prompt = "請辨識圖片中的物品名稱與材質，用繁體中文回答。格式：這是一個(物品)，材質是(材質)。"
-        response = model.generate_content([prompt, img])
-        return response.text.strip()
+        # 先縮小、轉正並重新壓縮，不把整張原圖傳出去
+        img = image_preprocess.prepare_for_model(image_path)
+        response = model.generate_content([RECOGNIZE_PROMPT, img.as_part()])
+        result = response.text.strip()
+        get_result_cache().set('recognize', cache_key, result)
+        return result
     except Exception as e:
         # 捕捉如 404 或 429 (流量限制) 等錯誤
-        return f"AI 辨識暫時忙碌中: {str(e)}"
+        return RECOGNIZE_BUSY.format(e)
 
-def generate_recycling_quiz(item_description):
-    """根據辨識結果生成回收問答題"""
-    if not model:
-        return "如何回收？", "(A)資源回收 (B)一般垃圾", "A", "請依規定處理。"
+def is_recognize_failure(item_result):
+    """辨識結果是不是 RECOGNIZE_NO_MODEL / RECOGNIZE_BUSY 這類失敗訊息 (不能拿來出題、給經驗值)"""
+    return item_result == RECOGNIZE_NO_MODEL or item_result.startswith(RECOGNIZE_BUSY.format(''))
+
+def chunk_text(chunk):
+    """串流回應其中一段的文字 (最後一段可能只有結束原因、沒有文字)"""
+    try:
+        return chunk.text
+    except ValueError:
+        return ''
+
+def build_quiz_prompt(item_description):
+    """出題的提示詞"""
+    return f"針對【{item_description}】出一個回收知識選擇題。格式必須嚴格遵守：\nQUESTION_START 題目 QUESTION_END \nOPTIONS_START (A)選項 (B)選項 OPTIONS_END \nANSWER_START 答案字母 ANSWER_END \nEXPLANATION_START 解析 EXPLANATION_END"
+
+# 題目的四個段落 (順序與 parse_quiz 返回的 tuple 相同)
+QUIZ_SECTIONS = (
+    ('question', re.compile(r'QUESTION_START(.*?)QUESTION_END', re.S)),
+    ('options', re.compile(r'OPTIONS_START(.*?)OPTIONS_END', re.S)),
+    ('answer', re.compile(r'ANSWER_START\s*([A-D])\s*ANSWER_END', re.I)),
+    ('explanation', re.compile(r'EXPLANATION_START(.*?)EXPLANATION_END', re.S)),
+)
+
+def _section_value(name, match):
+    value = match.group(1).strip()
+    return value.upper() if name == 'answer' else value
+
+@metrics.timed('reborn_quiz_parse_seconds', "解析 AI 回傳題目的時間")
+def parse_quiz(text):
+    """
+    使用正則表達式解析 AI 回傳的固定格式
+    返回: (題目, 選項, 答案, 解析)，格式不符時丟出 ValueError
+    """
+    try:
+        return tuple(_section_value(name, pattern.search(text)) for name, pattern in QUIZ_SECTIONS)
+    except AttributeError:
+        raise ValueError("題目格式不符")
+
+class QuizStreamParser:
+    """
+    串流出題時邊收邊解析：某一段的結束標記 (例如 QUESTION_END) 一出現，
+    feed() 就返回那一段，不用等整個回應
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.sections = {}
+
+    def feed(self, chunk):
+        """加入新收到的文字，返回這次完成的段落 [(名稱, 內容), ...]"""
+        self.text += chunk
+        finished = []
+        for name, pattern in QUIZ_SECTIONS:
+            if name not in self.sections:
+                match = pattern.search(self.text)
+                if match:
+                    self.sections[name] = _section_value(name, match)
+                    finished.append((name, self.sections[name]))
+        return finished
 
-    prompt = f"針對【{item_description}】出一個回收知識選擇題。格式必須嚴格遵守：\nQUESTION_START 題目 QUESTION_END \nOPTIONS_START (A)選項 (B)選項 OPTIONS_END \nANSWER_START 答案字母 ANSWER_END \nEXPLANATION_START 解析 EXPLANATION_END"
+    def result(self):
+        """回應結束後的完整題目，格式不符時丟出 ValueError"""
+        if len(self.sections) < len(QUIZ_SECTIONS):
+            raise ValueError("題目格式不符")
+        return tuple(self.sections[name] for name, _ in QUIZ_SECTIONS)
+
+@metrics.timed('reborn_quiz_generate_seconds', "QA.generate_recycling_quiz 的時間 (含快取)")
+def generate_recycling_quiz(item_description, on_section=None):
+    """
+    根據辨識結果生成回收問答題
+    同一個物品描述的題目會被快取 (保底題目不會)
+    有 on_section 時用串流模式，每完成一段就呼叫 on_section(名稱, 內容)
+    """
+    cache_key = quiz_cache_key(item_description)
+    cached = get_result_cache().get('quiz', cache_key)
+    if cached is not None:
+        return tuple(cached)
+    
+    if not model:
+        return NO_MODEL_QUIZ
     
     try:
-        response = model.generate_content(prompt)
-        text = response.text
-        # 使用正則表達式解析 AI 回傳的固定格式
-        q = re.search(r'QUESTION_START(.*?)QUESTION_END', text, re.S).group(1).strip()
-        o = re.search(r'OPTIONS_START(.*?)OPTIONS_END', text, re.S).group(1).strip()
-        a = re.search(r'ANSWER_START\s*([A-D])\s*ANSWER_END', text, re.I).group(1).upper()
-        e = re.search(r'EXPLANATION_START(.*?)EXPLANATION_END', text, re.S).group(1).strip()
-        return q, o, a, e
+        if on_section is None:
+            response = model.generate_content(build_quiz_prompt(item_description))
+            quiz = parse_quiz(response.text)
+        else:
+            parser = QuizStreamParser()
+            for chunk in model.generate_content(build_quiz_prompt(item_description), stream=True):
+                for name, value in parser.feed(chunk_text(chunk)):
+                    on_section(name, value)
+            quiz = parser.result()
+        get_result_cache().set('quiz', cache_key, list(quiz))
+        return quiz
     except Exception:
         # 萬一 AI 回傳格式不符，提供一組保底題目防止 500 錯誤
-        return "關於此物品的回收方式？", "(A)清洗後丟回收桶 (B)直接丟垃圾桶", "A", "正確的回收流程能減少環境負擔。"
+        return FALLBACK_QUIZ
+
+
+# ==========================================
+# 3. 辨識 + 出題一次完成 (JSON 輸出)
+# ==========================================
+# 類別代碼與 web_app/題目.py 相同 (見 quiz_bank.CATEGORIES)
+SCAN_PROMPT = (
+    "你是一個專業的資源回收分類助理。請辨識圖片中主要的物品，用繁體中文回答物品名稱與材質，"
+    "並把它分類為以下其中一項 (圖片模糊、沒有物品或不屬於這些類別時用 unknown)：\n"
+    + "\n".join(f"- {code} ({name})" for code, (name, _) in CATEGORIES.items())
+    + "\n如果是壓扁的寶特瓶，依然是 plastic_bottle；手拿著物品時請忽略手部。\n"
+    "接著針對這個物品出一個回收知識選擇題：options 為 \"(A)選項 (B)選項 ...\" 的格式，"
+    "answer 為正確答案的字母，explanation 為解析。"
+)
+SCAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "item": {"type": "string"},
+        "material": {"type": "string"},
+        "category": {"type": "string", "enum": list(CATEGORIES)},
+        "quiz": {
+            "type": "object",
+            "properties": {
+                "question": {"type": "string"},
+                "options": {"type": "string"},
+                "answer": {"type": "string", "enum": ["A", "B", "C", "D"]},
+                "explanation": {"type": "string"},
+            },
+            "required": ["question", "options", "answer", "explanation"],
+        },
+    },
+    "required": ["item", "material", "category", "quiz"],
+}
+SCAN_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": SCAN_SCHEMA,
+    "temperature": 0.0,
+}
+
+def scan_cache_key(image_hash):
+    """辨識 + 出題結果的快取 key"""
+    return f"{MODEL_NAME}:scan:{image_hash}"
+
+def build_scan_repair_prompt(text):
+    """JSON 格式不符時的重試提示詞 (只送文字、不再送圖片)"""
+    return f"以下是一段格式錯誤的 JSON，請依照指定的 schema 修正後只回傳 JSON，不要改變內容：\n{text[:2000]}"
 
+def _parse_item(data):
+    """驗證一個物品 {'item', 'material', 'category'}，不符時丟出 ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("物品格式不符")
+    item, material, category = data.get('item'), data.get('material'), data.get('category')
+    if not all(isinstance(v, str) and v.strip() for v in (item, material)) or len(item) + len(material) > 100:
+        raise ValueError("物品或材質不符")
+    if category not in CATEGORIES:
+        raise ValueError(f"不認識的類別: {category!r}")
+    item, material = item.strip(), material.strip()
+    return {
+        'item_result': f"這是一個{item}，材質是{material}。",
+        'item': item,
+        'material': material,
+        'category': category,
+    }
 
+@metrics.timed('reborn_scan_parse_seconds', "解析 AI 回傳的辨識 + 出題 JSON 的時間")
+def parse_scan(text):
+    """
+    驗證辨識 + 出題的 JSON
+    返回: {'item_result', 'item', 'material', 'category', 'quiz'}，
+    辨識的部分不符時丟出 ValueError；只有題目不符時 quiz 為 None (改用題庫或另外出題)
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        raise ValueError("不是 JSON")
+    result = _parse_item(data)
+    result['quiz'] = None
+    quiz = data.get('quiz')
+    if isinstance(quiz, dict):
+        fields = [quiz.get(k) for k in ('question', 'options', 'answer', 'explanation')]
+        if all(isinstance(v, str) for v in fields):
+            fields = [v.strip() for v in fields]
+            try:
+                validate_quiz(*fields)
+            except ValueError:
+                pass
+            else:
+                result['quiz'] = fields
+    return result
+
+
+# ==========================================
+# 4. 批次辨識 (一次請求送好幾張照片)
+# ==========================================
+# 每張照片最多列出幾個物品
+BATCH_MAX_ITEMS_PER_IMAGE = int(os.environ.get("BATCH_MAX_ITEMS_PER_IMAGE", "10"))
 
+_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {key: SCAN_SCHEMA["properties"][key] for key in ("item", "material", "category")},
+    "required": ["item", "material", "category"],
+}
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "images": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    "items": {"type": "array", "items": _ITEM_SCHEMA},
+                },
+                "required": ["index", "items"],
+            },
+        },
+    },
+    "required": ["images"],
+}
+BATCH_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": BATCH_SCHEMA,
+    "temperature": 0.0,
+}
+
+def batch_cache_key(image_hash):
+    """批次辨識 (一張照片裡所有物品) 的快取 key"""
+    return f"{MODEL_NAME}:batch:{image_hash}"
+
+def build_batch_contents(parts):
+    """一次辨識好幾張照片的請求內容：說明 + 「照片 1」圖片 +「照片 2」圖片 ..."""
+    contents = [
+        f"以下有 {len(parts)} 張照片。請列出每張照片中所有的回收物 (同一張照片可能有好幾個物品，"
+        f"最多 {BATCH_MAX_ITEMS_PER_IMAGE} 個)，用繁體中文回答物品名稱與材質，並分類為以下其中一項：\n"
+        + "\n".join(f"- {code} ({name})" for code, (name, _) in CATEGORIES.items())
+        + "\nindex 為照片編號 (從 1 開始)，每張照片都要回答；看不出任何物品時 items 為空陣列。"
+    ]
+    for i, part in enumerate(parts, 1):
+        contents += [f"照片 {i}：", part]
+    return contents
+
+@metrics.timed('reborn_batch_parse_seconds', "解析 AI 回傳的批次辨識 JSON 的時間")
+def parse_batch(text, count):
+    """
+    驗證批次辨識的 JSON
+    返回: {照片位置 (從 0 開始): [物品, ...]}，物品格式與 parse_scan 相同 (沒有 quiz)；
+    格式不符的照片不會出現在結果裡 (由呼叫端重試)，整個不是 JSON 時丟出 ValueError
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        raise ValueError("不是 JSON")
+    images = data.get('images') if isinstance(data, dict) else None
+    if not isinstance(images, list):
+        raise ValueError("JSON 格式不符")
+    results = {}
+    for entry in images:
+        if not isinstance(entry, dict):
+            continue
+        index, items = entry.get('index'), entry.get('items')
+        if not isinstance(index, int) or not 1 <= index <= count or index - 1 in results:
+            continue
+        if not isinstance(items, list) or len(items) > BATCH_MAX_ITEMS_PER_IMAGE:
+            continue
+        try:
+            results[index - 1] = [_parse_item(item) for item in items]
+        except ValueError:
+            continue
+    return results
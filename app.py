@@ -1,24 +1,77 @@
 import os
+import json
+import time
 import hashlib
 from PIL import Image
 import pillow_heif
 import google.generativeai as genai
-from flask import Flask, render_template, request, url_for, send_from_directory, session, jsonify
+from flask import Flask, render_template, request, url_for, session, jsonify, redirect, abort, Response, stream_with_context, g
+
+import QA
+import auth
+import batch_scan
+import leaderboard
+import metrics
+import rate_limit
+import render_cache
+import scan_jobs
+import sessions
+import static_assets
+import upload_serving
+from upload_storage import get_upload_storage
+from upload_ingest import make_request_class, ingest_file, MAX_UPLOAD_BYTES
 
 # 支援 iPhone HEIC
 pillow_heif.register_heif_opener()
 
 app = Flask(__name__)
-app.secret_key = os.environ.get("FLASK_SECRET_KEY", "reborn-v4-key-999")
+# 沒有設定 FLASK_SECRET_KEY 時用 data/secret_key (第一次啟動時隨機產生)
+app.secret_key = sessions.load_secret_key()
+# session 內容存在伺服器 (data/sessions.db)，cookie 只放 session id
+sessions.init_app(app)
+
+# 上傳檔案依 sha256 分資料夾存放，超過保存期限或容量預算時自動清理 (upload_storage.py)
+storage = get_upload_storage()
+UPLOAD_FOLDER = storage.root
+thumbnails = upload_serving.ThumbnailCache(storage)
+
+# 上傳檔案邊收邊寫入 UPLOAD_FOLDER 並計算 sha256，超過上限在讀取前就拒絕
+# (批次掃描一次可以有 BATCH_MAX_FILES 張)
+app.request_class = make_request_class(UPLOAD_FOLDER, endpoint_limits={
+    'scan_batch': batch_scan.BATCH_MAX_FILES * MAX_UPLOAD_BYTES + 64 * 1024})
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 64 * 1024  # 加上表單欄位的空間
+# 前面有 nginx / Apache 時改由它們送檔案 (X-Sendfile)
+app.config['USE_X_SENDFILE'] = os.environ.get("UPLOAD_X_SENDFILE") == '1'
+
+# url_for('static', ...) 指向 static_assets.py 建置的指紋檔案 (可快取一年)
+static_assets.init_app(app)
+
+# 首頁與結果頁依參數快取整頁輸出，附 ETag (render_cache.py)
+render_cache.init_app(app)
+pages = render_cache.get_render_cache()
 
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# 每個請求的時間與狀態碼，/metrics 輸出 (metrics.py)
+HTTP_SECONDS = metrics.histogram('reborn_http_request_seconds', "每個請求的處理時間", ('endpoint',))
+HTTP_REQUESTS = metrics.counter('reborn_http_requests_total', "請求次數", ('endpoint', 'status'))
+SCAN_STAGE = metrics.histogram('reborn_scan_stage_seconds', "/scan 收件各步驟的時間", ('stage',))
 
-# 模擬資料庫
-daily_usage = {}
-uploaded_hashes = set()
-DAILY_LIMIT = 10
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'not_found'
+        HTTP_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
+# 重複圖片由 auth.reserve_image_for_user 在共用的 dedup_index 預留；
+# 每日次數與每分鐘請求數由 rate_limit.py 記錄 (所有 worker 共用，先扣、失敗的掃描退還)
+DAILY_LIMIT = rate_limit.UPLOAD_DAILY_LIMIT
+limiter = rate_limit.get_rate_limiter()
 
 # 模擬經驗值與圖表數據 (實際應用建議存入資料庫)
 user_stats = {
@@ -39,36 +92,298 @@ if API_KEY:
 else:
     model = None
 
+DEFAULT_USER = "環保小隊長"
+
+def current_user():
+    """目前登入的帳號 (尚未登入時使用示範帳號)"""
+    return session.get('username', DEFAULT_USER)
+
+def user_summary(user):
+    """經驗值、等級、今日剩餘上傳次數 (登入的使用者快取在 session 裡)"""
+    def load():
+        xp = auth.get_user_xp_by_username(user)
+        return {"xp": xp, "level": QA.get_level(xp),
+                "remaining_uploads": auth.get_remaining_uploads(user)}
+    if 'username' not in session:
+        return load()
+    return sessions.cached_summary(session, load)
+
+def invalidate_user_pages(user):
+    """經驗值或上傳次數改變：清掉 session 裡的摘要與快取的頁面"""
+    sessions.invalidate_summary(session)
+    pages.invalidate_user(user)
+
+def refund_uploads(user, grant_id, amount=None):
+    """退還先扣掉的每日次數 (amount 為 None 時整筆退還)"""
+    if limiter.refund(rate_limit.UPLOADS, user, grant_id, amount):
+        invalidate_user_pages(user)
+
+def render_index(**extra):
+    """首頁 (掃描頁) 共用的參數"""
+    user = current_user()
+    summary = user_summary(user)
+    return pages.respond('index.html', user,
+                         shared={"chart_data": user_stats["chart_data"],
+                                 "sessions_data": user_stats["sessions_data"]},
+                         username=user,
+                         xp=summary["xp"],
+                         level=summary["level"],
+                         remaining_uploads=summary["remaining_uploads"],
+                         daily_limit=DAILY_LIMIT,
+                         **extra)
+
 # ================= 路由設定 =================
 
 @app.route('/')
 def index():
-    user = "環保小隊長"
-    return render_template('index.html', 
-                           username=user, 
-                           xp=user_stats["xp"],
-                           level=user_stats["level"],
-                           chart_data=user_stats["chart_data"],
-                           sessions_data=user_stats["sessions_data"],
-                           remaining_uploads=DAILY_LIMIT - daily_usage.get(user, 0),
-                           daily_limit=DAILY_LIMIT)
+    return render_index()
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'GET':
+        return render_template('login.html')
+    username = request.form.get('username', '').strip()
+    ok, message = auth.login_user(username, request.form.get('password', ''))
+    if not ok:
+        return render_template('login.html', error=message), 401
+    # 登入後換新的 session id，之前的摘要也不要沿用
+    session.regenerate()
+    session.clear()
+    session['username'] = username
+    return redirect(url_for('index'))
+
+@app.route('/register', methods=['POST'])
+def register():
+    username = request.form.get('username', '').strip()
+    password = request.form.get('password', '')
+    if password != request.form.get('confirm_password', password):
+        return render_template('login.html', error="兩次輸入的密碼不一致"), 400
+    ok, message = auth.register_user(username, password)
+    if not ok:
+        return render_template('login.html', error=message), 400
+    return render_template('login.html', success=message)
+
+@app.route('/logout')
+def logout():
+    session.clear()
+    return redirect(url_for('login'))
 
 @app.route('/healthz')
 def health_check(): return "OK", 200
 
+# Prometheus 格式的指標 (所有 worker 行程加總)
+@app.route('/metrics')
+def metrics_page(): return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# 上傳檔名就是內容的 sha256：強 ETag、304、Range、長期快取 (upload_serving.py)
 @app.route('/uploads/<filename>')
-def uploaded_file(filename): return send_from_directory(UPLOAD_FOLDER, filename)
+def uploaded_file(filename): return upload_serving.send_upload(storage, filename)
+
+@app.route('/uploads/<int:size>/<filename>')
+def upload_thumbnail(size, filename): return upload_serving.send_thumbnail(thumbnails, filename, size)
 
 # 沿用之前的 scan 與 submit 邏輯...
 @app.route('/scan', methods=['GET', 'POST'])
 def scan_page():
     if request.method == 'GET':
-        # 這裡也要確保首頁參數存在，以免報錯
-        return render_template('index.html', username="環保小隊長", xp=user_stats["xp"], level=user_stats["level"], chart_data=user_stats["chart_data"], sessions_data=user_stats["sessions_data"], remaining_uploads=DAILY_LIMIT, daily_limit=DAILY_LIMIT)
+        return render_index()
     
-    # 處理 POST 辨識邏輯 (沿用之前的程式碼)
-    # ...
-    return "辨識功能正常運作中"
+    user = current_user()
+    with SCAN_STAGE.time(stage='receive'):
+        file = request.files.get('file')
+    if file is None or not file.filename:
+        return redirect(url_for('index'))
+    
+    if limiter.acquire(rate_limit.SCAN_REQUESTS, user) is None:
+        scan_jobs.SCAN_REJECTED.inc(reason='rate_limit')
+        return "掃描太頻繁，請稍後再試", 429
+    # 先扣每日次數 (檢查與扣除是同一個原子操作，同時送出好幾張也不會超過上限)，
+    # 沒有排入佇列或辨識失敗的掃描會退還
+    grant = limiter.acquire(rate_limit.UPLOADS, user)
+    if grant is None:
+        scan_jobs.SCAN_REJECTED.inc(reason='daily_limit')
+        return render_index(daily_limit_error=True)
+    invalidate_user_pages(user)
+    
+    # 上傳在解析表單時已經寫入硬碟並算好 sha256，這裡只是改成正式檔名
+    with SCAN_STAGE.time(stage='store'):
+        upload = ingest_file(file, storage)
+    if upload.size == 0:
+        refund_uploads(user, grant.id)
+        return "上傳的檔案是空的", 400
+    
+    # 檢查重複的同時預留這張照片：連續送出同一張只有第一張會排入佇列 (工作失敗時放掉)
+    with SCAN_STAGE.time(stage='dedup'):
+        duplicate = auth.reserve_image_for_user(user, upload.sha256)
+    if duplicate:
+        refund_uploads(user, grant.id)
+        scan_jobs.SCAN_REJECTED.inc(reason='duplicate')
+        return render_index(duplicate_error=True)
+    
+    # 辨識與出題交給背景 worker，這裡馬上返回工作編號
+    with SCAN_STAGE.time(stage='enqueue'):
+        job_id = scan_jobs.enqueue_scan(user, upload, grant.id)
+        scan_jobs.start_workers()
+    
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            "job_id": job_id,
+            "status_url": url_for('job_status', job_id=job_id),
+            "events_url": url_for('job_events', job_id=job_id),
+            "result_url": url_for('scan_result', job_id=job_id),
+        }), 202
+    return redirect(url_for('scan_result', job_id=job_id), code=303)
+
+@app.route('/scan/batch', methods=['POST'])
+def scan_batch():
+    """
+    批次掃描 (JSON)：表單欄位 files 一次上傳好幾張照片，辨識完才返回
+    每張照片的結果見 batch_scan.scan_batch；先扣每日次數 (不夠時扣剩下的)，
+    沒有辨識出物品的照片再退還
+    """
+    user = current_user()
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if not files:
+        return jsonify({"error": "沒有上傳任何照片"}), 400
+    if len(files) > batch_scan.BATCH_MAX_FILES:
+        return jsonify({"error": f"一次最多 {batch_scan.BATCH_MAX_FILES} 張"}), 413
+    if limiter.acquire(rate_limit.SCAN_REQUESTS, user) is None:
+        scan_jobs.SCAN_REJECTED.inc(reason='rate_limit')
+        return jsonify({"error": "掃描太頻繁，請稍後再試"}), 429
+    grant = limiter.acquire(rate_limit.UPLOADS, user, len(files), partial=True)
+    if grant is None:
+        scan_jobs.SCAN_REJECTED.inc(reason='daily_limit')
+        return jsonify({"error": "今日掃描次數已用完"}), 429
+    
+    with SCAN_STAGE.time(stage='store'):
+        uploads = [ingest_file(f, storage) for f in files]
+    result = batch_scan.scan_batch(user, uploads, grant.amount)
+    if result['uploads'] < grant.amount:
+        refund_uploads(user, grant.id, grant.amount - result['uploads'])
+    invalidate_user_pages(user)
+    result['remaining_uploads'] = auth.get_remaining_uploads(user)
+    return jsonify(result)
+
+def load_job(job_id):
+    """
+    讀取目前使用者的工作 (別人的工作當作不存在)
+    失敗的掃描由 worker 退還每日次數；worker 在退還前當掉時這裡補退 (FLAG_REFUNDED 保證只退一次)
+    """
+    job = scan_jobs.get_scan_queue().get(job_id)
+    user = current_user()
+    if job is None or job['username'] != user:
+        abort(404)
+    if job['stage'] == 'failed':
+        scan_jobs.refund_failed(job)
+        invalidate_user_pages(user)
+    return job
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    return jsonify(scan_jobs.public_status(load_job(job_id)))
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """SSE：工作狀態每變化一次送一筆 (包括出題途中的題目、選項)，結束 (或 60 秒) 後關閉"""
+    job = load_job(job_id)
+    queue = scan_jobs.get_scan_queue()
+    
+    def events(job):
+        since = -1
+        deadline = time.monotonic() + 60
+        while job is not None:
+            if job['updated_at'] > since:
+                since = job['updated_at']
+                yield f"data: {json.dumps(scan_jobs.public_status(job), ensure_ascii=False)}\n\n"
+                if job['stage'] in ('done', 'failed'):
+                    return
+            else:
+                yield ": keep-alive\n\n"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            job = queue.wait(job_id, since, timeout=min(remaining, 15))
+    
+    return Response(stream_with_context(events(job)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/result/<job_id>')
+def scan_result(job_id):
+    job = load_job(job_id)
+    user = current_user()
+    if job['stage'] == 'failed':
+        if job['error'] == 'duplicate':
+            return render_index(duplicate_error=True)
+        if job['error'] == 'invalid_image':
+            return "無法讀取圖片，請上傳 JPG / PNG / HEIC 照片", 400
+        if job['error'] == 'recognition_failed':
+            return "AI 辨識暫時忙碌中，這次不扣掃描次數，請稍後再試", 503
+        return "辨識失敗，請稍後再試", 500
+    if job['stage'] != 'done':
+        # 還在辨識或出題：先送出頁面，辨識結果、題目、選項由 SSE 一段一段補上
+        status = scan_jobs.public_status(job)
+        return render_template('result.html',
+                               pending=True,
+                               status=job['stage'],
+                               username=user,
+                               job_id=job_id,
+                               image_file=job['payload']['filename'],
+                               item_result=status.get('item_result', ''),
+                               question=status.get('question', ''),
+                               options=status.get('options', ''))
+    
+    # 完成的工作內容不會再變，整頁可以快取
+    result = job['result']
+    return pages.respond('result.html', user,
+                         username=user,
+                         job_id=job_id,
+                         image_file=job['payload']['filename'],
+                         item_result=result['item_result'],
+                         question=result['question'],
+                         options=result['options'])
+
+@app.route('/submit_answer', methods=['POST'])
+def submit_answer():
+    data = request.get_json(silent=True) or {}
+    job = load_job(str(data.get('job_id', '')))
+    if job['stage'] != 'done':
+        return jsonify({"error": "找不到題目，請重新掃描"}), 400
+    if not scan_jobs.get_scan_queue().set_flag(job['id'], scan_jobs.FLAG_ANSWERED):
+        return jsonify({"error": "這一題已經作答過了"}), 400
+    quiz = job['result']
+    
+    user = current_user()
+    answer = str(data.get('answer', '')).upper()
+    correct = answer == quiz['answer']
+    gained_xp = QA.XP_REWARD_CORRECT if correct else QA.XP_REWARD_WRONG
+    
+    new_total = auth.update_user_xp_by_username(user, gained_xp)
+    invalidate_user_pages(user)
+    new_level = QA.get_level(new_total)
+    return jsonify({
+        "correct": correct,
+        "gained_xp": gained_xp,
+        "correct_answer": quiz['answer'],
+        "explanation": quiz['explanation'],
+        "leveled_up": new_level > QA.get_level(new_total - gained_xp),
+        "new_level": new_level,
+        "xp": new_total,
+    })
+
+@app.route('/leaderboard')
+def leaderboard_page():
+    """排行榜 (JSON)：前 n 名，以及目前使用者的名次與前後的人"""
+    board = leaderboard.get_leaderboard()
+    user = current_user()
+    n = max(1, min(request.args.get('n', 10, type=int), 100))
+    def entries(rows):
+        return [{"rank": rank, "username": name, "xp": xp, "level": QA.get_level(xp)} for rank, name, xp in rows]
+    return jsonify({
+        "top": entries(board.top(n)),
+        "rank": board.rank(user),
+        "around": entries(board.around(user)),
+        "players": len(board),
+    })
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,214 @@
+"""
+圖片素材處理 - 去背 (白底 / 灰白棋盤格轉透明)、邊緣柔化、裁切
+
+取代 remove_white.py 的逐像素迴圈與 web_app/ 裡的 PowerShell 腳本：
+整張圖轉成 NumPy 陣列一次處理，不在 Python 裡一個一個像素跑。
+
+去背模式：
+- white：R、G、B 都大於 threshold 的像素變透明 (remove_white.py 的作法，threshold=250)
+- neutral：亮度大於 threshold 且 R、G、B 彼此相差小於 tolerance 的像素變透明
+  (smart_clean.ps1 的作法，白色與淺灰色的棋盤格都會被去掉)
+
+用法:
+    python asset_tools.py key static/cat.png --mode white --threshold 250
+    python asset_tools.py key static --mode neutral --feather 1.5 --autocrop -o build/
+    python asset_tools.py crop static/cat.png --bottom 0.5 -o static/cat_only.png
+"""
+
+import os
+import sys
+import glob
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+KEY_MODES = ('white', 'neutral')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# (R, G, B, A) = (255, 255, 255, 0) 當成一個 uint32 的值
+_TRANSPARENT_WHITE = np.uint32(int.from_bytes(bytes((255, 255, 255, 0)), sys.byteorder))
+# 每次處理的列數 (1000 多像素寬時約 512KB，放得進 L2 快取)
+_BLOCK_ROWS = 128
+
+
+def _background_level(block: np.ndarray, mode: str, threshold: int, tolerance: int, soft: int):
+    """
+    一段像素 (H x W x 4) 的背景判斷
+    返回: (完全是背景的遮罩, 背景程度 0~255；沒有漸層時為 None)
+    """
+    r, g, b = block[..., 0], block[..., 1], block[..., 2]
+    # 逐一比較三個通道 (比 rgb.min(axis=2) 快很多：不用在最後一個維度上跳著讀)
+    low = np.minimum(np.minimum(r, g), b)
+    if soft > 0:
+        level = np.clip((low.astype(np.int16) - threshold) * (255.0 / soft), 0, 255).astype(np.uint8)
+        background = level == 255
+    else:
+        level = None
+        background = low > threshold
+    if mode == 'neutral':
+        colorful = (np.maximum(np.maximum(r, g), b) - low) >= tolerance
+        background &= ~colorful
+        if level is not None:
+            level[colorful] = 0
+    return background, level
+
+
+def key_background(img: Image.Image, mode: str = 'neutral', threshold: int = 210,
+                   tolerance: int = 15, soft: int = 0, feather: float = 0) -> Image.Image:
+    """
+    把白色 / 淺灰色背景變透明，返回 RGBA 圖片
+
+    soft：亮度在 threshold ~ threshold+soft 之間的像素只變半透明 (漸層)，
+          避免抗鋸齒的邊緣留下一圈白邊
+    feather：透明區域邊緣的模糊半徑 (像素)，只會讓邊緣更透明，不會讓背景變不透明
+    """
+    if mode not in KEY_MODES:
+        raise ValueError(f"未知的去背模式: {mode}")
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    rgba = np.asarray(img)
+    # 每個像素當成一個 uint32，一次寫入四個通道
+    pixels = rgba.view(np.uint32)[..., 0]
+    out = np.empty_like(pixels)
+    keep = np.empty(pixels.shape, np.uint8) if soft > 0 or feather > 0 else None
+
+    # 一次處理幾十列，中間結果留在 CPU 快取裡
+    for y in range(0, rgba.shape[0], _BLOCK_ROWS):
+        rows = slice(y, y + _BLOCK_ROWS)
+        background, level = _background_level(rgba[rows], mode, threshold, tolerance, soft)
+        # 完全是背景的像素統一成 (255, 255, 255, 0)，與 remove_white.py 相同
+        out[rows] = np.where(background, _TRANSPARENT_WHITE, pixels[rows])
+        if keep is not None:
+            keep[rows] = 255 - level if level is not None else np.where(background, 0, 255)
+
+    result = out.view(np.uint8).reshape(rgba.shape)
+    if keep is not None:
+        if feather > 0:
+            blurred = Image.fromarray(keep).filter(ImageFilter.GaussianBlur(feather))
+            keep = np.minimum(keep, np.asarray(blurred))
+        # alpha * keep / 255 (四捨五入)
+        result[..., 3] = (result[..., 3].astype(np.uint16) * keep + 127) // 255
+    return Image.fromarray(result, 'RGBA')
+
+
+def autocrop(img: Image.Image, padding: int = 0) -> Image.Image:
+    """裁掉四周完全透明的部分 (保留 padding 像素的邊)"""
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    bbox = img.getchannel('A').getbbox()
+    if bbox is None:
+        return img
+    left, top, right, bottom = bbox
+    return img.crop((max(left - padding, 0), max(top - padding, 0),
+                     min(right + padding, img.width), min(bottom + padding, img.height)))
+
+
+def crop_fraction(img: Image.Image, left: float = 0.0, top: float = 0.0,
+                  right: float = 1.0, bottom: float = 1.0) -> Image.Image:
+    """依比例裁切 (例如 bottom=0.5 只保留上半部)"""
+    return img.crop((int(img.width * left), int(img.height * top),
+                     int(img.width * right), int(img.height * bottom)))
+
+
+def save_image(img: Image.Image, path: str):
+    """先寫到暫存檔再改名，處理到一半失敗也不會弄壞原本的檔案"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    ext = os.path.splitext(path)[1].lower()
+    fmt = Image.registered_extensions().get(ext, 'PNG')
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.asset-', suffix=ext)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            img.save(f, fmt)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# === 命令列 ===
+
+def _collect(inputs: List[str]) -> List[str]:
+    """展開輸入：檔案直接使用，資料夾取出裡面的圖片"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(item, name))
+        else:
+            paths.extend(sorted(glob.glob(item)) or [item])
+    return paths
+
+
+def _output_path(src: str, output: Optional[str], count: int) -> str:
+    if output is None:
+        return src
+    if count == 1 and not output.endswith(os.sep) and not os.path.isdir(output):
+        return output
+    return os.path.join(output, os.path.basename(src))
+
+
+def _process(task):
+    """處理一張圖 (在子行程執行)"""
+    command, src, dst, opts = task
+    with Image.open(src) as img:
+        img.load()
+    if command == 'key':
+        img = key_background(img, opts['mode'], opts['threshold'], opts['tolerance'],
+                             opts['soft'], opts['feather'])
+        if opts['autocrop'] is not None:
+            img = autocrop(img, opts['autocrop'])
+    else:
+        img = crop_fraction(img, opts['left'], opts['top'], opts['right'], opts['bottom'])
+    if dst.lower().endswith(('.jpg', '.jpeg')) and img.mode == 'RGBA':
+        img = img.convert('RGB')
+    save_image(img, dst)
+    return src, dst, img.size
+
+
+def run(command: str, inputs: List[str], output: Optional[str], jobs: Optional[int], **opts):
+    """對所有輸入的圖片執行同一個處理，多張圖時分散到多個 CPU 核心"""
+    paths = _collect(inputs)
+    tasks = [(command, src, _output_path(src, output, len(paths)), opts) for src in paths]
+    if len(tasks) <= 1 or jobs == 1:
+        for src, dst, size in map(_process, tasks):
+            print(f"{src} → {dst} ({size[0]}x{size[1]})")
+        return
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        for src, dst, size in pool.map(_process, tasks):
+            print(f"{src} → {dst} ({size[0]}x{size[1]})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="圖片素材處理：去背、柔化邊緣、裁切")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    key = sub.add_parser('key', help="白底 / 灰白棋盤格轉透明")
+    key.add_argument('--mode', choices=KEY_MODES, default='neutral')
+    key.add_argument('--threshold', type=int, default=210, help="亮度大於這個值才算背景 (0-255)")
+    key.add_argument('--tolerance', type=int, default=15, help="neutral 模式：R、G、B 最大差距")
+    key.add_argument('--soft', type=int, default=0, help="亮度漸層的寬度，0 = 硬切")
+    key.add_argument('--feather', type=float, default=0, help="透明邊緣的模糊半徑 (像素)")
+    key.add_argument('--autocrop', type=int, nargs='?', const=0, default=None, metavar='PADDING',
+                     help="裁掉四周透明的部分，可以指定保留的邊")
+
+    crop = sub.add_parser('crop', help="依比例裁切 (crop_cat.py 的作法)")
+    for name, default in (('left', 0.0), ('top', 0.0), ('right', 1.0), ('bottom', 1.0)):
+        crop.add_argument(f'--{name}', type=float, default=default)
+
+    for p in (key, crop):
+        p.add_argument('inputs', nargs='+', help="圖片檔案或資料夾")
+        p.add_argument('-o', '--output', help="輸出檔案或資料夾 (不指定時覆蓋原檔)")
+        p.add_argument('-j', '--jobs', type=int, default=None, help="同時處理的行程數 (預設 CPU 核心數)")
+
+    args = vars(parser.parse_args(argv))
+    run(args.pop('command'), args.pop('inputs'), args.pop('output'), args.pop('jobs'), **args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,455 @@
+"""
+非同步 Gemini 客戶端 - 包裝 QA.recognize_item 與 QA.generate_recycling_quiz
+
+- 同時最多 GEMINI_MAX_CONCURRENCY 個請求 (Semaphore)
+- 限速配合 API 每分鐘配額：每個行程一個 token bucket 把請求攤平，
+  另外每次呼叫前在 rate_limit 的 gemini_requests 視窗扣一次 (SQLite，所有行程共用)，
+  開 N 個 gunicorn worker 加上獨立的 scan_jobs.py，加總起來還是 GEMINI_RATE_PER_MINUTE
+  (get_client() 建立的客戶端才有共用配額；自己建立的客戶端沒有傳 limiter 就只有本行程的 bucket)
+- 遇到 429 時指數退避重試
+- 同一張照片 / 同一個物品如果已經有請求在路上，後來的直接等同一個結果 (single-flight)
+- scan：辨識 + 出題一次請求 (JSON 輸出)；格式不符時只送文字請 AI 修正一次，
+  還是不符才改回 recognize (之後另外出題)
+- quiz 可以用串流模式：題目、選項 ... 每收完一段就通知，不用等整個回應
+- recognize_many：好幾張照片打包成一次請求 (批次掃描)，多個包同時送出
+
+Flask 的 view 是同步的，所以每個行程開一個背景執行緒跑 event loop，
+透過 recognize_sync / quiz_sync / scan_sync 把工作交給它。
+"""
+
+import os
+import random
+import asyncio
+import functools
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import QA
+import metrics
+import rate_limit
+import image_preprocess
+from result_cache import get_result_cache
+
+# 同時進行中的 API 請求上限
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "8"))
+# API 配額：每分鐘請求數 (所有行程加總，見 rate_limit.py)，以及瞬間可以連發的數量
+GEMINI_RATE_PER_MINUTE = rate_limit.GEMINI_RATE_PER_MINUTE
+GEMINI_BURST = int(os.environ.get("GEMINI_BURST", "10"))
+# 429 最多重試幾次，第一次等待秒數 (之後每次加倍)
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "4"))
+GEMINI_BACKOFF_BASE = float(os.environ.get("GEMINI_BACKOFF_BASE", "1.0"))
+# 批次辨識：一次請求最多幾張照片、圖片加起來最多多大 (API 單一請求的內嵌資料上限是 20MB)
+GEMINI_BATCH_IMAGES = int(os.environ.get("GEMINI_BATCH_IMAGES", "8"))
+GEMINI_BATCH_BYTES = int(os.environ.get("GEMINI_BATCH_BYTES", str(16 * 1024 * 1024)))
+
+GEMINI_CALL_SECONDS = metrics.histogram('reborn_gemini_call_seconds', "每次 Gemini API 請求的時間")
+GEMINI_CALLS = metrics.counter('reborn_gemini_calls_total', "Gemini API 請求次數 (ok / rate_limited / error)",
+                               ('outcome',))
+GEMINI_COALESCED = metrics.counter('reborn_gemini_coalesced_total', "等待同一個進行中請求、沒有另外呼叫 API 的次數")
+SCAN_PARSE = metrics.counter('reborn_scan_parse_total', "辨識 + 出題 JSON 的驗證結果 (ok / no_quiz / repaired / invalid)",
+                             ('outcome',))
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """是否為 429 / 配額用完的錯誤"""
+    try:
+        from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+        if isinstance(error, (ResourceExhausted, TooManyRequests)):
+            return True
+    except ImportError:
+        pass
+    return '429' in str(error)
+
+
+class TokenBucket:
+    """權杖桶限速：平均每秒 rate 個，最多累積 burst 個"""
+
+    def __init__(self, rate_per_sec: float, burst: int):
+        self.rate = rate_per_sec
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = None
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """取得一個權杖，不夠時等待 (先來先拿)"""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is None:
+                    self._updated = now
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """收到 429 後，所有請求暫停一段時間並清空累積的權杖"""
+        loop = asyncio.get_running_loop()
+        self._blocked_until = max(self._blocked_until, loop.time() + seconds)
+        self._tokens = 0.0
+
+
+class AsyncGeminiClient:
+    """限速、重試、合併重複請求的 Gemini 客戶端"""
+
+    def __init__(self, model=None, max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 rate_per_minute: float = GEMINI_RATE_PER_MINUTE, burst: int = GEMINI_BURST,
+                 max_retries: int = GEMINI_MAX_RETRIES, backoff_base: float = GEMINI_BACKOFF_BASE,
+                 limiter: Optional[rate_limit.RateLimiter] = None):
+        self._model = model
+        # 所有行程共用的配額 (rate_limit.GEMINI_REQUESTS)；None 時只有本行程的 token bucket
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {'calls': 0, 'coalesced': 0, 'rate_limited': 0, 'errors': 0}
+        self._loop = None
+        self._thread = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def model(self):
+        # 沒有指定時跟著 QA 的設定 (測試時可以替換 QA.model)
+        return self._model if self._model is not None else QA.model
+
+    # === 呼叫 API ===
+
+    async def _acquire_quota(self):
+        """先拿本行程的權杖，再扣所有行程共用的配額 (不夠時等到最舊的一筆離開視窗)"""
+        await self._bucket.acquire()
+        if self.limiter is None:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            grant = await loop.run_in_executor(
+                None, self.limiter.acquire, rate_limit.GEMINI_REQUESTS, rate_limit.GLOBAL)
+            if grant is not None:
+                return
+            wait = self.limiter.retry_after(rate_limit.GEMINI_REQUESTS, rate_limit.GLOBAL)
+            # 加一點隨機，避免所有行程同一時間醒來一起搶
+            await asyncio.sleep(wait + 0.05 * random.random())
+
+    async def _generate(self, contents, **kwargs):
+        fn = getattr(self.model, 'generate_content_async', None)
+        if fn is not None:
+            return await fn(contents, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.model.generate_content, contents, **kwargs))
+
+    async def generate(self, contents, **kwargs):
+        """送出一次請求：先拿權杖、再佔用一個並行名額，429 時退避重試"""
+        for attempt in range(self.max_retries + 1):
+            await self._acquire_quota()
+            async with self._semaphore:
+                self.stats['calls'] += 1
+                try:
+                    with GEMINI_CALL_SECONDS.time():
+                        response = await self._generate(contents, **kwargs)
+                except Exception as e:
+                    rate_limited = is_rate_limited(e)
+                    GEMINI_CALLS.inc(outcome='rate_limited' if rate_limited else 'error')
+                    if not rate_limited or attempt == self.max_retries:
+                        self.stats['errors'] += 1
+                        raise
+                else:
+                    GEMINI_CALLS.inc(outcome='ok')
+                    return response
+            self.stats['rate_limited'] += 1
+            delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+            self._bucket.pause(delay)
+            await asyncio.sleep(delay)
+
+    async def _chunks(self, response) -> AsyncIterator[Any]:
+        if hasattr(response, '__aiter__'):
+            async for chunk in response:
+                yield chunk
+            return
+        # 同步模型的串流回應：每次取下一段都丟到執行緒池
+        loop = asyncio.get_running_loop()
+        it, end = iter(response), object()
+        while (chunk := await loop.run_in_executor(None, next, it, end)) is not end:
+            yield chunk
+
+    async def stream(self, contents, **kwargs) -> AsyncIterator[str]:
+        """
+        串流版的 generate：逐段 yield 收到的文字
+        還沒收到任何內容之前遇到 429 一樣退避重試，收到一部分之後出錯就直接丟出
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._acquire_quota()
+            received = False
+            async with self._semaphore:
+                self.stats['calls'] += 1
+                try:
+                    with GEMINI_CALL_SECONDS.time():
+                        response = await self._generate(contents, stream=True, **kwargs)
+                        async for chunk in self._chunks(response):
+                            received = True
+                            yield QA.chunk_text(chunk)
+                except Exception as e:
+                    rate_limited = is_rate_limited(e)
+                    GEMINI_CALLS.inc(outcome='rate_limited' if rate_limited else 'error')
+                    if received or not rate_limited or attempt == self.max_retries:
+                        self.stats['errors'] += 1
+                        raise
+                else:
+                    GEMINI_CALLS.inc(outcome='ok')
+                    return
+            self.stats['rate_limited'] += 1
+            delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+            self._bucket.pause(delay)
+            await asyncio.sleep(delay)
+
+    async def _single_flight(self, key: str, factory: Callable[[], Awaitable[Any]]):
+        """同一個 key 同時只會有一個請求，其他人等待同一個結果"""
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(factory())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats['coalesced'] += 1
+            GEMINI_COALESCED.inc()
+        # shield：某個等待者被取消時，不影響其他人
+        return await asyncio.shield(fut)
+
+    # === 辨識與出題 ===
+
+    async def recognize(self, image, image_hash: Optional[str] = None) -> str:
+        """非同步版的 QA.recognize_item"""
+        loop = asyncio.get_running_loop()
+        if image_hash is None:
+            image_hash = await loop.run_in_executor(None, QA.get_image_hash, image)
+        cache_key = QA.recognize_cache_key(image_hash)
+        cached = get_result_cache().get('recognize', cache_key)
+        if cached is not None:
+            return cached
+        if not self.model:
+            return QA.RECOGNIZE_NO_MODEL
+
+        async def work():
+            # 縮圖是 CPU 工作，丟到執行緒池避免卡住 event loop
+            img = await loop.run_in_executor(None, image_preprocess.prepare_for_model, image)
+            response = await self.generate([QA.RECOGNIZE_PROMPT, img.as_part()])
+            result = response.text.strip()
+            get_result_cache().set('recognize', cache_key, result)
+            return result
+
+        try:
+            return await self._single_flight('recognize:' + cache_key, work)
+        except Exception as e:
+            return QA.RECOGNIZE_BUSY.format(e)
+
+    async def quiz(self, item_description: str,
+                   on_section: Optional[Callable[[str, str], None]] = None):
+        """
+        非同步版的 QA.generate_recycling_quiz
+        有 on_section 時用串流模式，每完成一段就在執行緒池呼叫 on_section(名稱, 內容)
+        (同一個物品已經有請求在路上時，只會等到完整的題目)
+        """
+        cache_key = QA.quiz_cache_key(item_description)
+        cached = get_result_cache().get('quiz', cache_key)
+        if cached is not None:
+            return tuple(cached)
+        if not self.model:
+            return QA.NO_MODEL_QUIZ
+
+        async def work():
+            prompt = QA.build_quiz_prompt(item_description)
+            if on_section is None:
+                response = await self.generate(prompt)
+                quiz = QA.parse_quiz(response.text)
+            else:
+                loop = asyncio.get_running_loop()
+                parser = QA.QuizStreamParser()
+                async for text in self.stream(prompt):
+                    for name, value in parser.feed(text):
+                        # on_section 通常要寫資料庫，不在 event loop 裡做
+                        await loop.run_in_executor(None, on_section, name, value)
+                quiz = parser.result()
+            get_result_cache().set('quiz', cache_key, list(quiz))
+            return quiz
+
+        try:
+            return await self._single_flight('quiz:' + cache_key, work)
+        except Exception:
+            return QA.FALLBACK_QUIZ
+
+    async def _parse_scan(self, text: str) -> Dict[str, Any]:
+        """驗證 JSON，不符時只送文字請 AI 修正一次 (比重新送圖片便宜)"""
+        try:
+            result = QA.parse_scan(text)
+        except ValueError:
+            response = await self.generate(QA.build_scan_repair_prompt(text),
+                                           generation_config=QA.SCAN_GENERATION_CONFIG)
+            try:
+                result = QA.parse_scan(response.text)
+            except ValueError:
+                SCAN_PARSE.inc(outcome='invalid')
+                raise
+            SCAN_PARSE.inc(outcome='repaired')
+            return result
+        SCAN_PARSE.inc(outcome='ok' if result['quiz'] is not None else 'no_quiz')
+        return result
+
+    async def scan(self, image, image_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        辨識 + 出題一次請求
+        返回: QA.parse_scan 的結果 (quiz 可能是 None)；
+        JSON 修正後還是不符時改用 recognize，只有 'item_result' (之後另外出題)
+        """
+        loop = asyncio.get_running_loop()
+        if image_hash is None:
+            image_hash = await loop.run_in_executor(None, QA.get_image_hash, image)
+        cache_key = QA.scan_cache_key(image_hash)
+        cached = get_result_cache().get('scan', cache_key)
+        if cached is not None:
+            return cached
+        if not self.model:
+            return {'item_result': QA.RECOGNIZE_NO_MODEL}
+
+        async def work():
+            img = await loop.run_in_executor(None, image_preprocess.prepare_for_model, image)
+            response = await self.generate([QA.SCAN_PROMPT, img.as_part()],
+                                           generation_config=QA.SCAN_GENERATION_CONFIG)
+            result = await self._parse_scan(response.text)
+            get_result_cache().set('scan', cache_key, result)
+            # 兩次請求的路徑也用得到 (GEMINI_FUSED_SCAN=0 或之後改回 recognize 時)
+            get_result_cache().set('recognize', QA.recognize_cache_key(image_hash), result['item_result'])
+            if result['quiz'] is not None:
+                get_result_cache().set('quiz', QA.quiz_cache_key(result['item_result']), result['quiz'])
+            return result
+
+        try:
+            return await self._single_flight('scan:' + cache_key, work)
+        except ValueError:
+            if hasattr(image, 'seek'):
+                image.seek(0)
+            return {'item_result': await self.recognize(image, image_hash)}
+        except Exception as e:
+            return {'item_result': QA.RECOGNIZE_BUSY.format(e)}
+
+    async def _recognize_pack(self, parts: List[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+        """一次請求辨識一包照片；回答不完整的照片再單獨打包重試一次"""
+        response = await self.generate(QA.build_batch_contents(parts),
+                                       generation_config=QA.BATCH_GENERATION_CONFIG)
+        try:
+            results = QA.parse_batch(response.text, len(parts))
+        except ValueError:
+            results = {}
+        missing = [i for i in range(len(parts)) if i not in results]
+        if missing:
+            response = await self.generate(QA.build_batch_contents([parts[i] for i in missing]),
+                                           generation_config=QA.BATCH_GENERATION_CONFIG)
+            try:
+                retried = QA.parse_batch(response.text, len(missing))
+            except ValueError:
+                retried = {}
+            for j, items in retried.items():
+                results[missing[j]] = items
+        return results
+
+    async def recognize_many(self, images: Sequence[Tuple[str, Any]]) -> Dict[str, Optional[List[Dict[str, Any]]]]:
+        """
+        批次辨識：images 為 [(sha256, 圖片檔案), ...] (sha256 不重複)
+        最多 GEMINI_BATCH_IMAGES 張 / GEMINI_BATCH_BYTES 打包成一次請求，各包在限速內同時送出
+        返回: {sha256: [物品, ...]}，物品格式同 QA.parse_scan；辨識失敗的照片為 None
+        """
+        loop = asyncio.get_running_loop()
+        cache = get_result_cache()
+        results: Dict[str, Optional[List[Dict[str, Any]]]] = {}
+        todo = []
+        for image_hash, image in images:
+            cached = cache.get('batch', QA.batch_cache_key(image_hash))
+            if cached is not None:
+                results[image_hash] = cached
+            else:
+                todo.append((image_hash, image))
+        if not todo:
+            return results
+        if not self.model:
+            return dict(results, **{image_hash: None for image_hash, _ in todo})
+
+        prepared = await asyncio.gather(*(
+            loop.run_in_executor(None, image_preprocess.prepare_for_model, image) for _, image in todo))
+        packs, pack, size = [], [], 0
+        for (image_hash, _), img in zip(todo, prepared):
+            part = img.as_part()
+            if pack and (len(pack) >= GEMINI_BATCH_IMAGES or size + len(part['data']) > GEMINI_BATCH_BYTES):
+                packs.append(pack)
+                pack, size = [], 0
+            pack.append((image_hash, part))
+            size += len(part['data'])
+        packs.append(pack)
+
+        async def run(pack):
+            try:
+                found = await self._recognize_pack([part for _, part in pack])
+            except Exception:
+                found = {}
+            for i, (image_hash, _) in enumerate(pack):
+                items = found.get(i)
+                results[image_hash] = items
+                if items is not None:
+                    cache.set('batch', QA.batch_cache_key(image_hash), items)
+
+        await asyncio.gather(*(run(pack) for pack in packs))
+        return results
+
+    # === 給同步程式 (Flask view) 使用 ===
+
+    def _ensure_loop(self):
+        # 好幾個 job worker 執行緒同時第一次呼叫時只能建立一個 loop
+        # (Semaphore、權杖桶、single-flight 的 Future 都要在同一個 loop 上)
+        if self._thread is None or not self._thread.is_alive():
+            with self._loop_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name='gemini-loop', daemon=True)
+                    thread.start()
+                    self._loop, self._thread = loop, thread
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """在背景 event loop 執行 coroutine，等待並返回結果"""
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def recognize_sync(self, image, image_hash: Optional[str] = None) -> str:
+        return self.run(self.recognize(image, image_hash))
+
+    def quiz_sync(self, item_description: str,
+                  on_section: Optional[Callable[[str, str], None]] = None):
+        return self.run(self.quiz(item_description, on_section))
+
+    def scan_sync(self, image, image_hash: Optional[str] = None) -> Dict[str, Any]:
+        return self.run(self.scan(image, image_hash))
+
+    def recognize_many_sync(self, images: Sequence[Tuple[str, Any]]) -> Dict[str, Optional[List[Dict[str, Any]]]]:
+        return self.run(self.recognize_many(images))
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> AsyncGeminiClient:
+    """取得本行程共用的客戶端 (fork 之後重新建立，不沿用父行程的 event loop)"""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = AsyncGeminiClient(limiter=rate_limit.get_rate_limiter())
+                _client_pid = os.getpid()
+    return _client
@@ -4,9 +4,18 @@
 
 import os
 import json
-import hashlib
+import threading
 from typing import Optional, Dict, Any
 
+import metrics
+import leaderboard
+import rate_limit
+from credentials import get_hasher
+from user_store import get_user_store, read_users_json
+from counters import get_counter_store
+from dedup_index import get_dedup_index
+from phash import get_near_duplicate_index
+
 # 用戶資料目錄
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 USERS_DIR = os.path.join(BASE_DIR, 'users')
@@ -16,11 +25,29 @@ USERS_FILE = os.path.join(BASE_DIR, 'users.json')
 os.makedirs(USERS_DIR, exist_ok=True)
 
 def hash_password(password: str) -> str:
-    """密碼雜湊處理"""
-    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+    """密碼雜湊處理 (加鹽的 scrypt，見 credentials.py)"""
+    return get_hasher().hash(password)
+
+_store_ready = False
+_store_ready_lock = threading.Lock()
+
+def _users():
+    """
+    取得用戶儲存
+    第一次使用時，如果資料庫是空的就自動匯入舊的 users.json
+    """
+    global _store_ready
+    store = get_user_store()
+    if not _store_ready:
+        with _store_ready_lock:
+            if not _store_ready:
+                if store.is_empty():
+                    store.import_users(read_users_json(USERS_FILE))
+                _store_ready = True
+    return store
 
 def load_users() -> Dict[str, Any]:
-    """載入所有用戶資料"""
+    """載入所有用戶資料 (舊版 users.json 格式，僅供遷移使用)"""
     if not os.path.exists(USERS_FILE):
         return {}
     try:
@@ -30,10 +57,11 @@ def load_users() -> Dict[str, Any]:
         return {}
 
 def save_users(users: Dict[str, Any]):
-    """儲存所有用戶資料"""
+    """儲存所有用戶資料 (舊版 users.json 格式，僅供遷移使用)"""
     with open(USERS_FILE, 'w', encoding='utf-8') as f:
         json.dump(users, f, ensure_ascii=False, indent=2)
 
+@metrics.timed('reborn_auth_seconds', "帳號相關操作的時間", op='register')
 def register_user(username: str, password: str) -> tuple[bool, str]:
     """
     註冊新用戶
@@ -49,29 +77,21 @@ def register_user(username: str, password: str) -> tuple[bool, str]:
     if len(password) < 4:
         return False, "密碼至少需要 4 個字元"
     
-    # 檢查是否已存在
-    users = load_users()
-    if username in users:
+    # 建立新用戶 (原子操作，帳號已存在時不會覆蓋)
+    created = _users().add_user(
+        username,
+        hash_password(password),
+        __import__('datetime').datetime.now().isoformat()
+    )
+    if not created:
         return False, "此帳號已被註冊"
     
-    # 建立新用戶
-    users[username] = {
-        'password_hash': hash_password(password),
-        'created_at': __import__('datetime').datetime.now().isoformat()
-    }
-    save_users(users)
-    
-    # 建立用戶專屬資料夾
-    user_dir = get_user_dir(username)
-    os.makedirs(user_dir, exist_ok=True)
-    
-    # 初始化用戶 XP 檔案
-    xp_file = os.path.join(user_dir, 'xp.txt')
-    with open(xp_file, 'w', encoding='utf-8') as f:
-        f.write('0')
+    # 初始化用戶 XP
+    get_counter_store().seed('xp', username, 0)
     
     return True, "註冊成功！"
 
+@metrics.timed('reborn_auth_seconds', "帳號相關操作的時間", op='login')
 def login_user(username: str, password: str) -> tuple[bool, str]:
     """
     用戶登入驗證
@@ -80,14 +100,21 @@ def login_user(username: str, password: str) -> tuple[bool, str]:
     if not username or not password:
         return False, "請輸入帳號和密碼"
     
-    users = load_users()
+    user = _users().get_user(username)
+    hasher = get_hasher()
     
-    if username not in users:
+    if user is None:
+        hasher.verify(password, None)  # 一樣花時間計算，避免從回應時間看出帳號是否存在
         return False, "帳號不存在"
     
-    if users[username]['password_hash'] != hash_password(password):
+    stored = user['password_hash']
+    if not hasher.verify(password, stored):
         return False, "密碼錯誤"
     
+    # 舊的 sha256 (或舊參數) 趁知道密碼的時候換成新的雜湊
+    if hasher.needs_rehash(stored):
+        _users().update_password_hash(username, stored, hasher.hash(password))
+    
     return True, "登入成功！"
 
 def get_user_dir(username: str) -> str:
@@ -104,123 +131,100 @@ def get_user_history_file(username: str) -> str:
 
 # === 用戶專屬的 XP 和歷史紀錄函數 ===
 
+# 本行程已確認過舊檔案的帳號 (每個帳號只需檢查一次)
+_legacy_checked = set()
+
+def _import_legacy_files(username: str):
+    """第一次碰到某個帳號時，把舊的 xp.txt 與 history.txt 匯入新的儲存"""
+    if username in _legacy_checked:
+        return
+    store = get_counter_store()
+    if not store.exists('xp', username):
+        xp_file = get_user_xp_file(username)
+        try:
+            with open(xp_file, 'r', encoding='utf-8') as f:
+                store.seed('xp', username, int(f.read().strip()))
+        except (OSError, ValueError):
+            pass
+    history_file = get_user_history_file(username)
+    if os.path.exists(history_file):
+        with open(history_file, 'r', encoding='utf-8') as f:
+            hashes = [line.strip() for line in f if line.strip()]
+        get_dedup_index().add_many(username, hashes)
+    _legacy_checked.add(username)
+
 def get_user_xp_by_username(username: str) -> int:
     """讀取特定用戶的經驗值"""
-    xp_file = get_user_xp_file(username)
-    if not os.path.exists(xp_file):
-        # 確保目錄和檔案存在
-        user_dir = get_user_dir(username)
-        os.makedirs(user_dir, exist_ok=True)
-        with open(xp_file, 'w', encoding='utf-8') as f:
-            f.write('0')
-        return 0
-    try:
-        with open(xp_file, 'r', encoding='utf-8') as f:
-            return int(f.read().strip())
-    except:
-        return 0
+    _import_legacy_files(username)
+    return get_counter_store().get('xp', username)
 
+@metrics.timed('reborn_auth_seconds', "帳號相關操作的時間", op='update_xp')
 def update_user_xp_by_username(username: str, gained_xp: int) -> int:
-    """更新特定用戶的經驗值"""
-    current_xp = get_user_xp_by_username(username)
-    new_total = current_xp + gained_xp
-    xp_file = get_user_xp_file(username)
-    
-    # 確保目錄存在
-    user_dir = get_user_dir(username)
-    os.makedirs(user_dir, exist_ok=True)
-    
-    with open(xp_file, 'w', encoding='utf-8') as f:
-        f.write(str(new_total))
-    return new_total
+    """更新特定用戶的經驗值 (原子操作)，返回更新後的總經驗值"""
+    _import_legacy_files(username)
+    total = get_counter_store().incr('xp', username, gained_xp)
+    leaderboard.record(username, total)
+    return total
 
+@metrics.timed('reborn_auth_seconds', "帳號相關操作的時間", op='duplicate')
 def is_duplicate_image_for_user(username: str, img_hash: str) -> bool:
-    """檢查圖片是否在該用戶的歷史中重複"""
-    history_file = get_user_history_file(username)
-    if not os.path.exists(history_file):
-        return False
-    with open(history_file, 'r', encoding='utf-8') as f:
-        existing_hashes = {line.strip() for line in f}
-    return img_hash in existing_hashes
-
-def save_to_history_for_user(username: str, img_hash: str):
-    """儲存圖片紀錄到用戶的歷史"""
-    history_file = get_user_history_file(username)
-    
-    # 確保目錄存在
-    user_dir = get_user_dir(username)
-    os.makedirs(user_dir, exist_ok=True)
-    
-    with open(history_file, 'a', encoding='utf-8') as f:
-        f.write(img_hash + '\n')
+    """檢查圖片是否在該用戶的歷史中重複 (DEDUP_SCOPE=global 時不分帳號)"""
+    _import_legacy_files(username)
+    return get_dedup_index().contains(username, img_hash)
 
-# === 每日上傳次數限制 ===
-from datetime import datetime, date
+@metrics.timed('reborn_auth_seconds', "帳號相關操作的時間", op='reserve')
+def reserve_image_for_user(username: str, img_hash: str) -> bool:
+    """
+    收件時預留這張照片 (檢查與記錄是同一個原子操作，同時送出同一張照片只有一個會通過)
+    返回: True 表示重複；處理失敗時要呼叫 release_image_for_user 放掉
+    """
+    _import_legacy_files(username)
+    return get_dedup_index().check_and_add(username, img_hash)
 
-DAILY_UPLOAD_LIMIT = 3  # 每日最多上傳次數
+def release_image_for_user(username: str, img_hash: str):
+    """放掉預留但沒有處理成功的照片 (之後可以重新掃描)"""
+    get_dedup_index().remove(username, img_hash)
 
-def get_user_daily_upload_file(username: str) -> str:
-    """取得用戶每日上傳紀錄檔案路徑"""
-    return os.path.join(get_user_dir(username), 'daily_uploads.json')
+@metrics.timed('reborn_auth_seconds', "帳號相關操作的時間", op='near_duplicate')
+def is_near_duplicate_image_for_user(username: str, perceptual_hash: int) -> bool:
+    """檢查是否有很相似的照片 (重新存檔、縮放、轉檔過的同一張)"""
+    return get_near_duplicate_index().is_near_duplicate(username, perceptual_hash)
 
-def get_daily_upload_count(username: str) -> tuple[int, str]:
+@metrics.timed('reborn_auth_seconds', "帳號相關操作的時間", op='reserve_near_duplicate')
+def reserve_near_duplicate_for_user(username: str, perceptual_hash: int) -> bool:
     """
-    取得用戶今日的上傳次數
-    返回: (今日上傳次數, 紀錄日期)
+    預留感知雜湊 (檢查與記錄是同一個原子操作，同時送出很相似的照片只有一個會通過)
+    返回: True 表示近似重複；處理失敗時要呼叫 release_near_duplicate_for_user 放掉
     """
-    upload_file = get_user_daily_upload_file(username)
-    today = date.today().isoformat()  # 格式: 2026-01-29
-    
-    if not os.path.exists(upload_file):
-        return 0, today
-    
-    try:
-        with open(upload_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # 如果是今天的紀錄，返回次數
-        if data.get('date') == today:
-            return data.get('count', 0), today
-        else:
-            # 不是今天的紀錄，重置為 0
-            return 0, today
-    except:
-        return 0, today
+    return get_near_duplicate_index().check_and_add(username, perceptual_hash)
 
-def increment_daily_upload(username: str) -> int:
-    """
-    增加用戶今日的上傳次數
-    返回: 更新後的次數
-    """
-    upload_file = get_user_daily_upload_file(username)
-    today = date.today().isoformat()
-    
-    current_count, _ = get_daily_upload_count(username)
-    new_count = current_count + 1
-    
-    # 確保目錄存在
-    user_dir = get_user_dir(username)
-    os.makedirs(user_dir, exist_ok=True)
-    
-    data = {
-        'date': today,
-        'count': new_count
-    }
-    
-    with open(upload_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False)
-    
-    return new_count
+def release_near_duplicate_for_user(username: str, perceptual_hash: int):
+    """放掉預留但沒有處理成功的感知雜湊"""
+    get_near_duplicate_index().remove(username, perceptual_hash)
+
+@metrics.timed('reborn_auth_seconds', "帳號相關操作的時間", op='save_history')
+def save_to_history_for_user(username: str, img_hash: str):
+    """儲存圖片紀錄到用戶的歷史 (感知雜湊在辨識前就已經用 reserve_near_duplicate_for_user 記下)"""
+    _import_legacy_files(username)
+    get_dedup_index().add(username, img_hash)
+
+# === 每日上傳次數限制 ===
+# 跟 app.py 共用 rate_limit.py 的限制 (滑動 24 小時，所有 worker 共用)，扣除與退還見 app.py 的 /scan
+
+DAILY_UPLOAD_LIMIT = rate_limit.UPLOAD_DAILY_LIMIT  # 每日最多上傳次數
+
+def get_daily_upload_count(username: str) -> int:
+    """取得用戶最近 24 小時的上傳次數"""
+    return rate_limit.get_rate_limiter().used(rate_limit.UPLOADS, username)
 
 def can_upload_today(username: str) -> tuple[bool, int]:
     """
     檢查用戶今日是否還能上傳
     返回: (是否可以上傳, 已上傳次數)
     """
-    count, _ = get_daily_upload_count(username)
-    return count < DAILY_UPLOAD_LIMIT, count
+    return get_remaining_uploads(username) > 0, get_daily_upload_count(username)
 
 def get_remaining_uploads(username: str) -> int:
     """取得用戶今日剩餘的上傳次數"""
-    count, _ = get_daily_upload_count(username)
-    return max(0, DAILY_UPLOAD_LIMIT - count)
+    remaining = rate_limit.get_rate_limiter().remaining(rate_limit.UPLOADS, username)
+    return DAILY_UPLOAD_LIMIT if remaining is None else remaining
@@ -0,0 +1,122 @@
+"""
+批次掃描 - 一次上傳很多張照片 (班級、回收站一次拍一堆)，一張照片裡也可以有好幾個物品
+
+- 同一批裡內容相同或近似 (縮放、轉檔過) 的照片只算一次；以前掃描過的略過
+  (sha256 與感知雜湊在檢查時就預留，同時送出的兩批不會重複拿經驗值；沒有辨識出物品的再放掉)
+- 辨識用 AsyncGeminiClient.recognize_many：好幾張照片打包成一次請求，
+  各包在 GEMINI_MAX_CONCURRENCY / 每分鐘配額的限制內同時送出
+- 不出題：每個辨識出來的物品直接給 QA.XP_REWARD_BATCH_ITEM 經驗值
+- 每日次數由 app.py 先扣 (rate_limit，不夠時只扣剩下的)，沒有辨識出物品的照片再退還
+- 只有一個物品的照片記下類別，給本機分類器 (local_classifier) 訓練
+"""
+
+import os
+from contextlib import ExitStack
+from typing import Any, Dict, List
+
+from PIL import UnidentifiedImageError
+
+import QA
+import auth
+import metrics
+from async_client import get_client
+from local_classifier import get_label_store
+from upload_ingest import IngestedUpload
+from upload_storage import get_upload_storage
+
+# 一次最多上傳幾張
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "20"))
+
+OK = 'ok'
+DUPLICATE = 'duplicate'
+INVALID_IMAGE = 'invalid_image'
+DAILY_LIMIT = 'daily_limit'
+NO_ITEMS = 'no_items'
+FAILED = 'failed'
+
+BATCH_IMAGES = metrics.counter('reborn_batch_images_total', "批次掃描每張照片的結果", ('status',))
+
+
+def scan_batch(username: str, uploads: List[IngestedUpload], remaining: int) -> Dict[str, Any]:
+    """
+    辨識一批已存好的上傳 (remaining：這一批最多辨識幾張，也就是已經扣掉的每日次數)
+    返回: {'images': [{'filename', 'sha256', 'status', 'items'}, ...], 'uploads', 'gained_xp', 'xp'}
+    uploads 是有辨識出物品的張數，其餘 (remaining - uploads) 由呼叫端退還
+    status: ok / duplicate / invalid_image / daily_limit / no_items / failed
+    """
+    storage = get_upload_storage()
+    images = []
+    accepted = []
+    reserved = []
+
+    def release_unsuccessful():
+        # 沒有辨識出物品的照片放掉預留，之後可以重新掃描
+        for entry in reserved:
+            if entry['status'] != OK:
+                auth.release_image_for_user(username, entry['sha256'])
+        for entry, _, perceptual_hash in accepted:
+            if entry['status'] != OK:
+                auth.release_near_duplicate_for_user(username, perceptual_hash)
+
+    for upload in uploads:
+        entry = {'filename': upload.filename, 'sha256': upload.sha256, 'status': None, 'items': []}
+        images.append(entry)
+        # 同一批裡相同的照片在第二張時就已經是預留過的
+        if auth.reserve_image_for_user(username, upload.sha256):
+            entry['status'] = DUPLICATE
+            continue
+        reserved.append(entry)
+        try:
+            with upload.open() as f:
+                perceptual_hash = QA.get_perceptual_hash(f)
+        except (UnidentifiedImageError, OSError, ValueError):
+            storage.delete(upload.filename)
+            entry['status'] = INVALID_IMAGE
+            continue
+        # 要辨識的照片預留感知雜湊，同一批裡後面近似的照片就會算重複
+        if len(accepted) < remaining:
+            duplicate = auth.reserve_near_duplicate_for_user(username, perceptual_hash)
+        else:
+            duplicate = auth.is_near_duplicate_image_for_user(username, perceptual_hash)
+        if duplicate:
+            entry['status'] = DUPLICATE
+        elif len(accepted) >= remaining:
+            entry['status'] = DAILY_LIMIT
+        else:
+            accepted.append((entry, upload, perceptual_hash))
+
+    found = {}
+    if accepted:
+        try:
+            with ExitStack() as stack:
+                found = get_client().recognize_many_sync(
+                    [(upload.sha256, stack.enter_context(upload.open())) for _, upload, _ in accepted])
+        except Exception:
+            release_unsuccessful()
+            raise
+
+    recognized = []
+    gained_xp = 0
+    for entry, upload, _ in accepted:
+        items = found.get(upload.sha256)
+        if items is None:
+            entry['status'] = FAILED
+        elif not items:
+            entry['status'] = NO_ITEMS
+        else:
+            entry.update(status=OK, items=items)
+            gained_xp += QA.XP_REWARD_BATCH_ITEM * len(items)
+            recognized.append(upload.sha256)
+            if len(items) == 1:
+                get_label_store().record(upload.sha256, upload.filename, items[0]['category'])
+
+    if recognized:
+        xp = auth.update_user_xp_by_username(username, gained_xp)
+        for sha256 in recognized:
+            auth.save_to_history_for_user(username, sha256)
+    else:
+        xp = auth.get_user_xp_by_username(username)
+    release_unsuccessful()
+    for entry in images:
+        BATCH_IMAGES.inc(status=entry['status'])
+    return {'images': images, 'uploads': len(recognized), 'gained_xp': gained_xp, 'xp': xp}
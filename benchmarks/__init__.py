@@ -0,0 +1,3 @@
+"""
+效能測試腳本，請在專案根目錄用 python -m benchmarks.<名稱> 執行
+"""
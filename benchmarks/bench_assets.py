@@ -0,0 +1,77 @@
+"""
+去背速度：remove_white.py 原本的逐像素迴圈 vs asset_tools.key_background (NumPy)
+
+對 static/*.png 每張圖兩種作法各跑 --repeat 次取最快的一次 (同 timeit)，
+並確認兩種作法的結果完全相同。
+
+用法:
+    python -m benchmarks.bench_assets
+    python -m benchmarks.bench_assets --pattern 'static/images/*.png' --threshold 250
+"""
+
+import os
+import glob
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+from asset_tools import key_background
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def key_white_loop(img, threshold):
+    """remove_white.py 原本的作法：getdata() 逐像素判斷，組出新的 list 再 putdata()"""
+    img = img.convert("RGBA")
+    new_data = []
+    for item in img.getdata():
+        if item[0] > threshold and item[1] > threshold and item[2] > threshold:
+            new_data.append((255, 255, 255, 0))
+        else:
+            new_data.append(item)
+    img.putdata(new_data)
+    return img
+
+
+def _best_of(repeat, fn, *args):
+    """執行 repeat 次，返回 (最快的秒數, 結果)"""
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pattern', default=os.path.join(BASE_DIR, 'static', '*.png'))
+    parser.add_argument('--threshold', type=int, default=250)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    total_loop = total_numpy = 0.0
+    for path in sorted(glob.glob(args.pattern)):
+        with Image.open(path) as img:
+            img.load()
+
+        loop_s, expected = _best_of(args.repeat, key_white_loop, img, args.threshold)
+        numpy_s, result = _best_of(args.repeat, key_background, img, 'white', args.threshold)
+
+        same = np.array_equal(np.asarray(expected), np.asarray(result))
+        total_loop += loop_s
+        total_numpy += numpy_s
+        print(f"{os.path.basename(path):40s} {img.width:5d}x{img.height:<5d} "
+              f"迴圈 {loop_s * 1000:8.1f} ms  NumPy {numpy_s * 1000:6.1f} ms  "
+              f"{loop_s / numpy_s:6.1f}x  {'結果相同' if same else '結果不同!'}")
+        if not same:
+            raise SystemExit(1)
+
+    print(f"合計：迴圈 {total_loop:.2f} s，NumPy {total_numpy:.3f} s，快 {total_loop / total_numpy:.0f} 倍")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+非同步客戶端負載測試：100 個同時進來的掃描 (辨識 + 出題)，
+後端是 benchmarks/fake_gemini 的假模型 (有延遲與每分鐘配額)
+
+比較：
+- sync：原本的作法，每個請求一個執行緒直接呼叫 QA.recognize_item / generate_recycling_quiz
+- async：透過 AsyncGeminiClient (限速、429 退避、合併相同的請求)
+
+另外 --processes 個行程同時呼叫 API (模擬好幾個 gunicorn worker)，--window 秒內配額 --window-quota 次：
+- local：每個行程只有自己的 token bucket，加總會變成行程數倍
+- shared：加上 rate_limit 的 gemini_requests 視窗 (所有行程共用)，加總不超過配額
+
+用法:
+    python -m benchmarks.bench_async_client
+    python -m benchmarks.bench_async_client --scans 100 --images 20 --latency 0.5 --quota 120
+    python -m benchmarks.bench_async_client --processes 4 --window 5 --window-quota 20 --windows 3
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('REBORN_DATA_DIR', tempfile.mkdtemp(prefix='reborn-bench-'))
+
+import argparse
+import asyncio
+import glob
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import QA
+import async_client
+import rate_limit
+from benchmarks.fake_gemini import FakeGenerativeModel
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _make_images(tmpdir, count, variant):
+    """用範例圖做出 count 張內容不同的 JPEG"""
+    sources = sorted(glob.glob(os.path.join(BASE_DIR, 'static', '*.png')))
+    paths = []
+    for i in range(count):
+        img = Image.open(sources[i % len(sources)]).convert('RGB')
+        size = 300 + 7 * i + 3 * variant
+        path = os.path.join(tmpdir, f'{variant}_{i}.jpg')
+        img.resize((size, size)).save(path, 'JPEG', quality=90)
+        paths.append(path)
+    return paths
+
+
+def _failed(item, quiz):
+    """辨識或出題失敗 (拿到忙碌訊息或備用題目) 的掃描"""
+    return QA.is_recognize_failure(item) or tuple(quiz) == QA.FALLBACK_QUIZ
+
+
+def _report(name, results, elapsed, model, extra=''):
+    latencies = sorted(latency for latency, _ in results)
+    failed = sum(1 for _, fail in results if fail)
+    print(f"{name:>6}: {len(latencies) / elapsed:6.1f} 掃描/秒，"
+          f"p50 {statistics.median(latencies):.2f} s，p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} s，"
+          f"失敗 {failed} 次，API 呼叫 {model.calls} 次 {extra}")
+
+
+def run_sync(paths, scans, model):
+    QA.model = model
+
+    def scan(i):
+        t = time.perf_counter()
+        item = QA.recognize_item(paths[i % len(paths)])
+        quiz = QA.generate_recycling_quiz(item)
+        return time.perf_counter() - t, _failed(item, quiz)
+
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=scans) as pool:
+        results = list(pool.map(scan, range(scans)))
+    _report('sync', results, time.perf_counter() - t, model)
+
+
+def run_async(paths, scans, model, concurrency, rate, burst):
+    client = async_client.AsyncGeminiClient(model=model, max_concurrency=concurrency,
+                                            rate_per_minute=rate, burst=burst, backoff_base=0.5)
+
+    async def scan(i):
+        t = time.perf_counter()
+        item = await client.recognize(paths[i % len(paths)])
+        quiz = await client.quiz(item)
+        return time.perf_counter() - t, _failed(item, quiz)
+
+    async def main():
+        return await asyncio.gather(*(scan(i) for i in range(scans)))
+
+    t = time.perf_counter()
+    results = asyncio.run(main())
+    s = client.stats
+    _report('async', results, time.perf_counter() - t, model,
+            f"(合併 {s['coalesced']}，429 {s['rate_limited']}，錯誤 {s['errors']})")
+
+
+def _call_for(path, shared, quota, window, seconds, results):
+    """一個行程：8 個協程不停呼叫 API，seconds 秒後回報呼叫次數"""
+    limiter = rate_limit.RateLimiter(path, {rate_limit.GEMINI_REQUESTS: ((window, quota),)}) if shared else None
+    model = FakeGenerativeModel(latency=0.01)
+    client = async_client.AsyncGeminiClient(model=model, rate_per_minute=quota * 60 / window,
+                                            burst=max(1, quota // 4), limiter=limiter)
+    prompt = QA.build_quiz_prompt("這是一個寶特瓶，材質是塑膠。")
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + seconds
+
+        async def caller():
+            while loop.time() < deadline:
+                await asyncio.wait_for(client.generate(prompt), deadline - loop.time())
+
+        await asyncio.gather(*(caller() for _ in range(8)), return_exceptions=True)
+
+    asyncio.run(main())
+    results.put(model.calls)
+
+
+def run_processes(processes, quota, window, windows):
+    """好幾個行程同時呼叫，比較加總的 API 呼叫次數與配額"""
+    allowed = quota * windows
+    print(f"{processes} 個行程，{window:g} 秒 {quota} 次的配額，跑 {window * windows:g} 秒 (最多 {allowed} 次)：")
+    for shared in (False, True):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'rate_limits.db')
+            rate_limit.RateLimiter(path)  # 先建好資料表
+            results = multiprocessing.Queue()
+            workers = [multiprocessing.Process(target=_call_for,
+                                               args=(path, shared, quota, window, window * windows, results))
+                       for _ in range(processes)]
+            for p in workers:
+                p.start()
+            calls = [results.get() for _ in workers]
+            for p in workers:
+                p.join()
+        total = sum(calls)
+        print(f"  {'shared' if shared else 'local':>6}: API 呼叫 {total} 次 ({total / allowed:.0%} 配額)，"
+              f"各行程 {calls}{'' if total <= allowed else '  ← 超過配額'}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scans', type=int, default=100)
+    parser.add_argument('--images', type=int, default=20, help="不同照片的數量")
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--quota', type=int, default=120, help="假模型每分鐘配額")
+    parser.add_argument('--concurrency', type=int, default=8, help="async 同時進行的 API 請求上限")
+    parser.add_argument('--processes', type=int, default=4, help="多行程測試的行程數")
+    parser.add_argument('--window', type=float, default=5, help="多行程測試的配額視窗 (秒)")
+    parser.add_argument('--window-quota', type=int, default=20, help="多行程測試每個視窗的配額")
+    parser.add_argument('--windows', type=int, default=2, help="多行程測試跑幾個視窗")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for mode in ('sync', 'async'):
+            # 兩種模式用不同的照片與物品名稱，避免互相吃到快取
+            paths = _make_images(tmpdir, args.images, variant=int(mode == 'async'))
+            model = FakeGenerativeModel(latency=args.latency, quota_per_minute=args.quota, tag=mode)
+            if mode == 'sync':
+                run_sync(paths, args.scans, model)
+            else:
+                run_async(paths, args.scans, model, args.concurrency,
+                          rate=args.quota * 0.9, burst=20)
+    if args.processes > 1:
+        run_processes(args.processes, args.window_quota, args.window, args.windows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+批次掃描測試：一次上傳 N 張照片 vs 一張一張掃描 (假模型，有延遲)
+
+- sequential：N 次單張辨識 (AsyncGeminiClient.scan，一張一次請求)，一張做完再做下一張
+- concurrent：同樣 N 次單張請求，但同時送出 (受 GEMINI_MAX_CONCURRENCY 限制)
+- batch：POST /scan/batch 一次上傳 N 張 (另外加 2 張重複的)，每 GEMINI_BATCH_IMAGES 張打包成一次請求
+每種模式用不同的照片，不會吃到快取。
+
+用法:
+    python -m benchmarks.bench_batch_scan
+    python -m benchmarks.bench_batch_scan --images 16 --latency 0.5
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('REBORN_DATA_DIR', tempfile.mkdtemp(prefix='reborn-bench-'))
+os.environ.setdefault('GEMINI_RATE_PER_MINUTE', '60000')
+os.environ.setdefault('GEMINI_BURST', '100')
+os.environ.setdefault('CREDENTIAL_WORKERS', '0')
+os.environ.setdefault('JOB_WORKERS', '0')
+
+import argparse
+import asyncio
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+import QA
+import async_client
+import rate_limit
+from benchmarks.fake_gemini import FakeGenerativeModel
+
+
+def _photos(count, seed):
+    rng = np.random.default_rng(seed)
+    photos = []
+    for _ in range(count):
+        img = Image.fromarray(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)).resize((1024, 768))
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', quality=85)
+        photos.append(buf.getvalue())
+    return photos
+
+
+def _report(label, elapsed, images, calls):
+    print(f"  {label:12s} 總共 {elapsed:6.2f} s   每張 {elapsed / images * 1000:6.0f} ms   "
+          f"API {calls / images:.2f} 次/張 ({calls} 次)")
+
+
+def run_single(photos, latency, concurrent):
+    model = FakeGenerativeModel(latency=latency)
+    client = async_client.AsyncGeminiClient(model=model, rate_per_minute=60000, burst=1000)
+
+    async def main():
+        if concurrent:
+            return await asyncio.gather(*(client.scan(io.BytesIO(data)) for data in photos))
+        return [await client.scan(io.BytesIO(data)) for data in photos]
+
+    t = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - t
+    assert all('item' in r for r in results)
+    _report('concurrent' if concurrent else 'sequential', elapsed, len(photos), model.calls)
+
+
+def run_batch(photos, latency):
+    import app
+    QA.model = FakeGenerativeModel(latency=latency)
+    app.DAILY_LIMIT = len(photos) * 2
+    app.limiter.limits = {rate_limit.UPLOADS: ((rate_limit.DAY, len(photos) * 2),)}  # 不限制每分鐘請求數
+    client = app.app.test_client()
+    files = [(io.BytesIO(data), f'photo{i}.jpg') for i, data in enumerate(photos + photos[:2])]
+    t = time.perf_counter()
+    r = client.post('/scan/batch', data={'files': files}, content_type='multipart/form-data')
+    elapsed = time.perf_counter() - t
+    result = r.get_json()
+    assert r.status_code == 200, result
+    statuses = [image['status'] for image in result['images']]
+    assert statuses.count('ok') == len(photos) and statuses.count('duplicate') == 2, statuses
+    items = sum(len(image['items']) for image in result['images'])
+    _report('batch', elapsed, len(photos), QA.model.calls)
+    print(f"               (另外 2 張重複的略過；辨識出 {items} 個物品，+{result['gained_xp']} XP，"
+          f"扣 {result['uploads']} 次)")
+    for image in result['images']:
+        app.storage.delete(image['filename'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=16, help="不同照片的數量 (另外加 2 張重複的，總數不能超過 BATCH_MAX_FILES)")
+    parser.add_argument('--latency', type=float, default=0.5, help="假模型每次呼叫的延遲 (秒)")
+    args = parser.parse_args()
+
+    print(f"{args.images} 張照片，假模型延遲 {args.latency}s (每多一張圖 +0.05s)，"
+          f"一次請求最多 {async_client.GEMINI_BATCH_IMAGES} 張：")
+    run_single(_photos(args.images, 1), args.latency, concurrent=False)
+    run_single(_photos(args.images, 2), args.latency, concurrent=True)
+    run_batch(_photos(args.images, 3), args.latency)
+
+
+if __name__ == '__main__':
+    main()
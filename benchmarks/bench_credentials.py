@@ -0,0 +1,90 @@
+"""
+密碼雜湊測試：每個 CPU 核心每秒可以處理幾次登入
+
+量測 (--threads 個執行緒同時登入，各跑 --seconds 秒)：
+- 舊版 sha256 (沒有加鹽，只是對照組)
+- pbkdf2_sha256 / scrypt：在請求的執行緒計算 (預設，CREDENTIAL_WORKERS=0)
+- scrypt：交給行程池計算 (CREDENTIAL_WORKERS > 0)
+- scrypt：同一組帳密重複登入 (驗證成功的快取)
+同時有一個執行緒一直跑純 Python 迴圈，代表同一個行程裡其他請求還能做多少事。
+
+用法:
+    python -m benchmarks.bench_credentials
+    python -m benchmarks.bench_credentials --threads 8 --seconds 5 --workers 4
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import credentials
+from credentials import PasswordHasher
+
+
+def _run(verify, threads, seconds):
+    """返回 (每秒登入次數, 其他執行緒每秒跑了幾次迴圈)"""
+    stop = threading.Event()
+    counts = [0] * threads
+    spins = [0]
+
+    def login(i):
+        while not stop.is_set():
+            assert verify()
+            counts[i] += 1
+
+    def spin():
+        n = 0
+        while not stop.is_set():
+            n += 1
+        spins[0] = n
+
+    workers = [threading.Thread(target=login, args=(i,)) for i in range(threads)]
+    other = threading.Thread(target=spin)
+    start = time.perf_counter()
+    other.start()
+    for t in workers:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in workers + [other]:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, spins[0] / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=4, help="同時登入的執行緒數")
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="行程池大小")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    password = 'correct horse battery staple'
+    legacy = credentials.legacy_hash(password)
+    pbkdf2 = PasswordHasher('pbkdf2_sha256', workers=0, cache_ttl=0)
+    inline = PasswordHasher('scrypt', workers=0, cache_ttl=0)
+    pooled = PasswordHasher('scrypt', workers=args.workers, cache_ttl=0)
+    cached = PasswordHasher('scrypt', workers=0)
+    pbkdf2_hash, scrypt_hash = pbkdf2.hash(password), inline.hash(password)
+    pooled.verify(password, scrypt_hash)  # 先把行程池開起來
+
+    cases = [
+        ("sha256 (舊版)", lambda: inline.verify(password, legacy)),
+        (f"pbkdf2_sha256 i={pbkdf2.params['i']}", lambda: pbkdf2.verify(password, pbkdf2_hash)),
+        ("scrypt 請求執行緒計算", lambda: inline.verify(password, scrypt_hash)),
+        (f"scrypt 行程池 ({args.workers} 個行程)", lambda: pooled.verify(password, scrypt_hash)),
+        ("scrypt 重複登入 (快取)", lambda: cached.verify(password, scrypt_hash)),
+    ]
+    _, idle_spins = _run(lambda: time.sleep(0.01) or True, 1, args.seconds)
+    print(f"{cores} 核心，{args.threads} 個執行緒同時登入，scrypt {inline.params}")
+    print(f"{'':32s} {'登入/秒':>10s} {'每核心':>10s} {'其他執行緒':>10s}")
+    for label, verify in cases:
+        rate, spins = _run(verify, args.threads, args.seconds)
+        print(f"{label:32s} {rate:10.1f} {rate / cores:10.1f} {spins / idle_spins:9.0%}")
+    pooled.close()
+
+
+if __name__ == '__main__':
+    main()
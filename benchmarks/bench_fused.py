@@ -0,0 +1,99 @@
+"""
+辨識 + 出題合併成一次請求的測試 (假模型，有延遲)
+
+比較每次掃描 (不同的照片，沒有快取) 的時間與 API 呼叫次數：
+- two-call：AsyncGeminiClient.recognize，再用辨識結果 quiz (原本的作法，兩次來回)
+- fused：AsyncGeminiClient.scan，一次 JSON 請求拿到物品、材質、類別與題目
+- fused + 壞 JSON：假模型有 --invalid-json 的機率回傳截斷的 JSON，走只送文字的修正重試
+
+用法:
+    python -m benchmarks.bench_fused
+    python -m benchmarks.bench_fused --scans 200 --latency 0.5 --concurrency 8 --invalid-json 0.1
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('REBORN_DATA_DIR', tempfile.mkdtemp(prefix='reborn-bench-'))
+
+import argparse
+import asyncio
+import io
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+import QA
+import async_client
+from benchmarks.fake_gemini import FakeGenerativeModel
+
+
+def _make_images(count, variant):
+    """count 張內容不同的小 JPEG (每種模式用不同的照片，不會吃到別的模式的快取)"""
+    rng = np.random.default_rng(variant)
+    images = []
+    for _ in range(count):
+        img = Image.fromarray(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)).resize((640, 480))
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+def run(mode, images, latency, concurrency, invalid_json):
+    model = FakeGenerativeModel(latency=latency, tag=mode, invalid_json_rate=invalid_json)
+    client = async_client.AsyncGeminiClient(model=model, max_concurrency=concurrency,
+                                            rate_per_minute=60000, burst=1000)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def scan(i, data):
+        async with limit:
+            t = time.perf_counter()
+            image = io.BytesIO(data)
+            if mode == 'two-call':
+                item = await client.recognize(image)
+                # 假模型只有 7 種物品；真的辨識結果幾乎每張都不一樣 (品牌、顏色 ...)，出題快取很少命中
+                quiz = await client.quiz(f"{item} #{i}")
+            else:
+                result = await client.scan(image)
+                quiz = result.get('quiz') or await client.quiz(result['item_result'])
+            assert tuple(quiz) != QA.FALLBACK_QUIZ
+            return time.perf_counter() - t
+
+    async def main():
+        return await asyncio.gather(*(scan(i, data) for i, data in enumerate(images)))
+
+    t = time.perf_counter()
+    latencies = sorted(asyncio.run(main()))
+    elapsed = time.perf_counter() - t
+    return {
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+        'rate': len(latencies) / elapsed,
+        'calls': model.calls / len(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scans', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.5, help="假模型每次呼叫的延遲 (秒)")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--invalid-json', type=float, default=0.1, help="假模型回傳壞 JSON 的機率")
+    args = parser.parse_args()
+
+    runs = [('two-call', 0.0), ('fused', 0.0), ('fused', args.invalid_json)]
+    print(f"{args.scans} 次掃描，假模型延遲 {args.latency}s，同時 {args.concurrency} 個：")
+    baseline = None
+    for i, (mode, invalid_json) in enumerate(runs):
+        r = run(mode, _make_images(args.scans, i), args.latency, args.concurrency, invalid_json)
+        baseline = baseline or r
+        label = mode if not invalid_json else f"{mode} (壞 JSON {invalid_json:.0%})"
+        print(f"  {label:22s} p50 {r['p50']:.2f}s  p95 {r['p95']:.2f}s  {r['rate']:5.1f} 掃描/秒  "
+              f"API {r['calls']:.2f} 次/掃描  (p50 為原本的 {r['p50'] / baseline['p50']:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+排行榜測試：一百萬個使用者
+
+量測：
+- 啟動時從 counters.db 重建排行榜的時間與記憶體
+- 加經驗值 (counters.incr + 更新排行榜)
+- 前 10 名、某人的名次、某人前後各 2 名
+- 同步其他行程的 1000 筆修改 (refresh)
+對照組：直接用 SQL 查 (counters 沒有依 value 排序的索引，每次都要掃過所有人)
+
+用法:
+    python -m benchmarks.bench_leaderboard
+    python -m benchmarks.bench_leaderboard --users 100000
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('REBORN_DATA_DIR', tempfile.mkdtemp(prefix='reborn-bench-'))
+
+import argparse
+import random
+import statistics
+import time
+
+import db
+from counters import CounterStore
+from leaderboard import Leaderboard
+
+
+def _populate(store, users, rng):
+    """直接寫入資料庫 (只是準備資料)；XP 大致是長尾分布"""
+    rows = ((f'user{i:07d}', int(rng.paretovariate(1.2) * 50), i + 1) for i in range(users))
+    with db.transaction(store._conn()) as conn:
+        conn.executemany('INSERT INTO counters (scope, key, value, seq) VALUES (\'xp\', ?, ?, ?)', rows)
+
+
+def _rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _median_us(fn, args_list):
+    times = []
+    for args in args_list:
+        t = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - t) * 1e6)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--samples', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    store = CounterStore(db.db_path('bench_counters.db'))
+    t = time.perf_counter()
+    _populate(store, args.users, rng)
+    print(f"{args.users:,} 個使用者 (準備資料 {time.perf_counter() - t:.1f}s)")
+
+    rss = _rss_mb()
+    t = time.perf_counter()
+    board = Leaderboard(store, refresh_interval=3600)
+    load_s = time.perf_counter() - t
+    print(f"重建排行榜: {load_s:.2f}s，RSS 增加 {_rss_mb() - rss:.0f} MB")
+
+    names = [f'user{rng.randrange(args.users):07d}' for _ in range(args.samples)]
+
+    def gain(name):
+        board.update(name, store.incr('xp', name, 50))
+
+    results = [
+        ("加經驗值 (incr + 更新)", _median_us(gain, [(n,) for n in names])),
+        ("前 10 名", _median_us(board.top, [(10,)] * args.samples)),
+        ("名次", _median_us(board.rank, [(n,) for n in names])),
+        ("前後各 2 名", _median_us(board.around, [(n, 2) for n in names])),
+    ]
+    for label, us in results:
+        print(f"  {label:24s} {us:8.1f} µs")
+
+    # 其他行程的修改：只寫資料庫，不更新這個排行榜
+    for name in rng.sample(names, min(1000, len(names))):
+        store.incr('xp', name, 10)
+    t = time.perf_counter()
+    board.refresh(force=True)
+    print(f"  {'同步其他行程 1000 筆修改':24s} {(time.perf_counter() - t) * 1000:8.1f} ms")
+
+    conn = store._conn()
+    sql = [
+        ("SQL 前 10 名", lambda: conn.execute(
+            "SELECT key, value FROM counters WHERE scope = 'xp' ORDER BY value DESC LIMIT 10").fetchall()),
+        ("SQL 名次", lambda: conn.execute(
+            "SELECT COUNT(*) FROM counters WHERE scope = 'xp' AND value > "
+            "(SELECT value FROM counters WHERE scope = 'xp' AND key = ?)", (names[0],)).fetchone()),
+    ]
+    print("對照 (SQL，每次掃過所有人)：")
+    for label, fn in sql:
+        print(f"  {label:24s} {_median_us(fn, [()] * 5) / 1000:8.1f} ms")
+
+    # 確認結果一樣
+    expected = conn.execute("SELECT COUNT(*) FROM counters WHERE scope = 'xp' AND value > "
+                            "(SELECT value FROM counters WHERE scope = 'xp' AND key = ?)", (names[0],)).fetchone()[0]
+    assert board.rank(names[0]) == expected + 1
+
+
+if __name__ == '__main__':
+    main()
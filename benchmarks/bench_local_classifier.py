@@ -0,0 +1,182 @@
+"""
+本機分類器測試：合成的標記照片 (不是真的上傳)
+
+每個類別用程式畫出形狀、顏色、大小、位置、背景各不相同的物品，存成 JPEG：
+寶特瓶 (透明偏藍、瓶蓋、標籤)、紙杯 (白色梯形)、紙袋 (牛皮紙色、提把)、
+鋁罐 (矮圓柱、金屬色或印刷色)、玻璃瓶 (綠 / 褐、細瓶頸)、鋁箔包 (彩色方盒)、
+unknown (塑膠袋、雜物)。另外加上雜訊、旋轉、模糊，並有一部分故意畫得模稜兩可。
+
+量測：
+- 留一部分照片評估：準確率、各門檻的本機回答比例與準確率
+- 一張照片從 JPEG 到結果的時間 (classify，含解碼) 與批次 predict 的時間
+- 跟每張都問 Gemini (假模型的延遲) 比較，平均每次辨識的時間與呼叫次數
+
+合成的照片比真的照片整齊，準確率只能拿來比較參數，真正的數字要用
+`python local_classifier.py` 在實際的上傳上評估。
+
+用法:
+    python -m benchmarks.bench_local_classifier
+    python -m benchmarks.bench_local_classifier --per-class 300 --size 1600x1200
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('REBORN_DATA_DIR', tempfile.mkdtemp(prefix='reborn-bench-'))
+
+import argparse
+import io
+import statistics
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+import local_classifier
+from local_classifier import CLASSES, LocalClassifier
+
+
+def _jitter(rng, rgb, amount=25):
+    return tuple(int(np.clip(c + rng.integers(-amount, amount + 1), 0, 255)) for c in rgb)
+
+
+def _draw(category, rng, size):
+    w, h = size
+    bg = tuple(int(c) for c in rng.integers(60, 230, 3))
+    img = Image.new('RGB', size, bg)
+    draw = ImageDraw.Draw(img)
+    # 背景上的雜物
+    for _ in range(rng.integers(0, 4)):
+        x, y = rng.integers(0, w), rng.integers(0, h)
+        r = int(rng.integers(w // 30, w // 10))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=_jitter(rng, bg, 60))
+    s = rng.uniform(0.7, 1.1)
+    cx, cy = w / 2 + rng.uniform(-0.1, 0.1) * w, h / 2 + rng.uniform(-0.08, 0.08) * h
+
+    def box(bw, bh, dy=0.0):
+        return (cx - bw * w * s / 2, cy + (dy - bh / 2) * h * s, cx + bw * w * s / 2, cy + (dy + bh / 2) * h * s)
+
+    if category == 'plastic_bottle':
+        body = _jitter(rng, (190, 215, 235))
+        draw.rounded_rectangle(box(0.16, 0.7, 0.05), radius=int(0.04 * w * s), fill=body)
+        draw.rectangle(box(0.07, 0.1, -0.34), fill=_jitter(rng, (30, 90, 200), 40))
+        draw.rectangle(box(0.16, 0.14, 0.05), fill=_jitter(rng, (220, 40, 40), 60))
+    elif category == 'paper_cup':
+        x0, y0, x1, y1 = box(0.3, 0.5)
+        inset = (x1 - x0) * 0.18
+        draw.polygon([(x0, y0), (x1, y0), (x1 - inset, y1), (x0 + inset, y1)], fill=_jitter(rng, (245, 245, 240), 10))
+        draw.ellipse((x0, y0 - 8 * s, x1, y0 + 8 * s), fill=_jitter(rng, (225, 225, 220), 10))
+        draw.rectangle((x0 + inset / 2, (y0 + y1) / 2 - 10, x1 - inset / 2, (y0 + y1) / 2 + 10),
+                       fill=_jitter(rng, (120, 70, 40), 50))
+    elif category == 'paper_bag':
+        kraft = _jitter(rng, (180, 135, 85), 20)
+        x0, y0, x1, y1 = box(0.42, 0.55, 0.08)
+        draw.rectangle((x0, y0, x1, y1), fill=kraft)
+        draw.arc((x0 + (x1 - x0) * 0.25, y0 - (y1 - y0) * 0.3, x1 - (x1 - x0) * 0.25, y0 + (y1 - y0) * 0.2),
+                 180, 360, fill=_jitter(rng, (120, 85, 50), 20), width=int(6 * s) + 2)
+        draw.line((x0, y0 + 12, x1, y0 + 12), fill=_jitter(rng, (150, 110, 70), 15), width=3)
+    elif category == 'can':
+        print_color = _jitter(rng, (200, 200, 205), 20) if rng.random() < 0.5 else \
+            tuple(int(c) for c in rng.integers(0, 256, 3))
+        x0, y0, x1, y1 = box(0.22, 0.42)
+        draw.rectangle((x0, y0, x1, y1), fill=print_color)
+        for y in (y0, y1):
+            draw.ellipse((x0, y - 10 * s, x1, y + 10 * s), fill=_jitter(rng, (170, 170, 175), 15))
+        draw.rectangle((x0 + (x1 - x0) * 0.6, y0, x0 + (x1 - x0) * 0.7, y1), fill=(240, 240, 240))
+    elif category == 'glass':
+        color = _jitter(rng, (40, 110, 50) if rng.random() < 0.5 else (110, 60, 20), 20)
+        x0, y0, x1, y1 = box(0.17, 0.5, 0.15)
+        nx0, ny0, nx1, _ = box(0.06, 0.2, -0.25)
+        draw.rounded_rectangle((x0, y0, x1, y1), radius=int(0.03 * w * s), fill=color)
+        # 瓶肩與細瓶頸
+        draw.polygon([(x0, y0 + 2), (nx0, y0 - (y1 - y0) * 0.15), (nx1, y0 - (y1 - y0) * 0.15), (x1, y0 + 2)],
+                     fill=color)
+        draw.rectangle((nx0, ny0, nx1, y0 - (y1 - y0) * 0.14), fill=color)
+        draw.rectangle(box(0.02, 0.35, 0.1), fill=_jitter(rng, color, 80))
+    elif category == 'carton':
+        x0, y0, x1, y1 = box(0.26, 0.5, 0.05)
+        draw.rectangle((x0, y0, x1, y1), fill=_jitter(rng, (250, 250, 250), 10))
+        for i in range(3):
+            band = tuple(int(c) for c in rng.integers(0, 256, 3))
+            top = y0 + (y1 - y0) * (0.15 + i * 0.28)
+            draw.rectangle((x0, top, x1, top + (y1 - y0) * 0.2), fill=band)
+        draw.polygon([(x0, y0), (x1, y0), ((x0 + x1) / 2, y0 - (y1 - y0) * 0.15)], fill=_jitter(rng, (230, 230, 230)))
+    else:
+        # 揉成一團的塑膠袋或其他雜物
+        for _ in range(rng.integers(6, 14)):
+            pts = [(cx + rng.normal(0, 0.12) * w * s, cy + rng.normal(0, 0.12) * h * s) for _ in range(3)]
+            draw.polygon(pts, fill=tuple(int(c) for c in rng.integers(0, 256, 3)))
+
+    img = img.rotate(float(rng.normal(0, 8)), resample=Image.Resampling.BILINEAR, fillcolor=bg)
+    if rng.random() < 0.3:
+        img = img.filter(ImageFilter.GaussianBlur(rng.uniform(0.5, 2.5)))
+    arr = np.asarray(img, dtype=np.int16) + rng.normal(0, 8, (h, w, 3)).astype(np.int16)
+    return Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+
+
+def make_dataset(per_class, size, seed=0, ambiguous=0.1):
+    """返回 ([JPEG bytes], [類別])；ambiguous 比例的照片疊上另一個類別的物品 (模稜兩可)"""
+    rng = np.random.default_rng(seed)
+    images, labels = [], []
+    for category in CLASSES:
+        for _ in range(per_class):
+            img = _draw(category, rng, size)
+            if rng.random() < ambiguous:
+                other = CLASSES[rng.integers(len(CLASSES))]
+                img = Image.blend(img, _draw(other, rng, size), 0.5)
+            buf = io.BytesIO()
+            img.save(buf, 'JPEG', quality=85)
+            images.append(buf.getvalue())
+            labels.append(category)
+    return images, labels
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--per-class', type=int, default=150)
+    parser.add_argument('--size', default='800x600', help="照片大小 (寬x高)")
+    parser.add_argument('--threshold', type=float, default=local_classifier.LOCAL_CLASSIFIER_THRESHOLD)
+    parser.add_argument('--gemini-latency', type=float, default=0.5, help="假模型辨識一次的延遲 (秒)")
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.split('x'))
+
+    t = time.perf_counter()
+    images, labels = make_dataset(args.per_class, size)
+    print(f"{len(images)} 張合成照片 {size[0]}x{size[1]} (準備資料 {time.perf_counter() - t:.1f}s)")
+
+    t = time.perf_counter()
+    features = local_classifier.extract_many([io.BytesIO(data) for data in images])
+    feature_ms = (time.perf_counter() - t) * 1000 / len(images)
+    labels = np.array(labels)
+    train, test = local_classifier.split(labels)
+    held_out = LocalClassifier.fit(features[train], labels[train], threshold=args.threshold)
+    report = local_classifier.evaluate(held_out, features[test], labels[test])
+    report['feature_ms_per_image'] = feature_ms
+    local_classifier.print_report(report)
+
+    # 一張一張 classify (上線時的用法：含 JPEG 解碼)
+    times = []
+    answered = 0
+    for i in test:
+        t = time.perf_counter()
+        answered += held_out.classify(io.BytesIO(images[i])) is not None
+        times.append((time.perf_counter() - t) * 1000)
+    times.sort()
+    local_ms = statistics.median(times)
+    print(f"classify (含解碼) p50 {local_ms:.1f} ms，p95 {times[int(len(times) * 0.95)]:.1f} ms")
+
+    batch = [io.BytesIO(images[i]) for i in test[:64]]
+    t = time.perf_counter()
+    held_out.predict(batch)
+    print(f"predict 批次 {len(batch)} 張：{(time.perf_counter() - t) * 1000 / len(batch):.1f} ms/張")
+
+    escalation = 1 - answered / len(test)
+    gemini_ms = args.gemini_latency * 1000
+    mixed_ms = local_ms + escalation * gemini_ms
+    print(f"門檻 {args.threshold:.2f}：升級到 Gemini {escalation:.1%}")
+    print(f"  每張都問 Gemini       平均 {gemini_ms:7.0f} ms   呼叫 1.00 次/張")
+    print(f"  先本機再升級          平均 {mixed_ms:7.0f} ms   呼叫 {escalation:.2f} 次/張")
+
+
+if __name__ == '__main__':
+    main()
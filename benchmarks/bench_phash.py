@@ -0,0 +1,83 @@
+"""
+感知雜湊測試：
+1. 範例圖片縮放 / 重新壓縮後的雜湊距離 (應該很小)
+2. 100 萬筆雜湊的索引建立時間、記憶體與查詢延遲
+
+用法:
+    python -m benchmarks.bench_phash
+    python -m benchmarks.bench_phash --size 1000000 --queries 2000 --distance 6
+"""
+
+import argparse
+import glob
+import io
+import os
+import random
+import time
+
+import numpy as np
+from PIL import Image
+
+import phash
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def robustness():
+    print("== 範例圖片：原圖 vs 縮小一半 + JPEG 品質 70 ==")
+    for path in sorted(glob.glob(os.path.join(BASE_DIR, 'static', '*.png'))):
+        img = Image.open(path).convert('RGB')
+        buf = io.BytesIO()
+        img.resize((img.width // 2, img.height // 2)).save(buf, 'JPEG', quality=70)
+        buf.seek(0)
+        t = time.perf_counter()
+        original = phash.phash(path)
+        elapsed = (time.perf_counter() - t) * 1000
+        copy = phash.phash(buf)
+        print(f"{os.path.basename(path):>28}: 距離 {phash.hamming(original, copy):>2}  ({elapsed:.1f} ms)")
+
+
+def index_benchmark(size, queries, distance):
+    print(f"\n== 索引：{size:,} 筆，距離 <= {distance} ==")
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, np.iinfo(np.uint64).max, size, dtype=np.uint64, endpoint=True)
+
+    index = phash.HammingIndex()
+    t = time.perf_counter()
+    index.add_many(values.tolist(), range(size))
+    print(f"建立: {time.perf_counter() - t:.2f} s，記憶體: {index.nbytes() / 1e6:.1f} MB")
+
+    def timed(targets):
+        samples = []
+        for q in targets:
+            t = time.perf_counter()
+            index.search(q, distance)
+            samples.append(time.perf_counter() - t)
+        samples.sort()
+        return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99) - 1] * 1e6
+
+    near = []
+    for _ in range(queries):
+        q = int(values[random.randrange(size)])
+        for bit in random.sample(range(64), random.randrange(distance + 1)):
+            q ^= 1 << bit
+        near.append(q)
+    miss = [random.getrandbits(64) for _ in range(queries)]
+
+    for name, targets in (('相近 (應命中)', near), ('隨機 (不命中)', miss)):
+        p50, p99 = timed(targets)
+        print(f"{name}: p50 {p50:.0f} us，p99 {p99:.0f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--distance', type=int, default=phash.PHASH_MAX_DISTANCE)
+    args = parser.parse_args()
+    robustness()
+    index_benchmark(args.size, args.queries, args.distance)
+
+
+if __name__ == '__main__':
+    main()
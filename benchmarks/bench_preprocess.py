@@ -0,0 +1,58 @@
+"""
+圖片前處理測試：範例 PNG 與一張模擬手機照片 (4032x3024 JPEG)
+送給模型前後的大小與每個步驟的時間
+
+原本的作法是把檔案原封不動傳給 Gemini，所以「原始」欄就是要上傳的 bytes。
+
+用法:
+    python -m benchmarks.bench_preprocess
+    python -m benchmarks.bench_preprocess --max-edge 512 --format WEBP
+"""
+
+import argparse
+import glob
+import os
+import tempfile
+
+from PIL import Image
+
+import image_preprocess
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _phone_photo(tmpdir):
+    """用範例圖放大成一張手機尺寸的 JPEG，測試 draft() 縮小解碼"""
+    path = os.path.join(tmpdir, 'phone_4032x3024.jpg')
+    src = Image.open(os.path.join(BASE_DIR, 'static', 'baby.png')).convert('RGB')
+    src.resize((4032, 3024), Image.Resampling.BICUBIC).save(path, 'JPEG', quality=92)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-edge', type=int, default=image_preprocess.MODEL_MAX_EDGE)
+    parser.add_argument('--format', default=image_preprocess.MODEL_IMAGE_FORMAT)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = sorted(glob.glob(os.path.join(BASE_DIR, 'static', '*.png')))
+        paths.append(_phone_photo(tmpdir))
+
+        print(f"{'檔案':>34} {'原始KB':>8} {'送出KB':>8} {'開啟':>6} {'解碼':>6} {'縮放':>6} {'壓縮':>6} (ms)")
+        total_in = total_out = total_ms = 0
+        for path in paths:
+            prepared = image_preprocess.prepare_for_model(path, args.max_edge, args.format)
+            s = prepared.stats
+            total_in += s['bytes_in']
+            total_out += s['bytes_out']
+            total_ms += s['total_ms']
+            print(f"{os.path.basename(path)[:34]:>34} {s['bytes_in'] / 1024:8.1f} {s['bytes_out'] / 1024:8.1f} "
+                  f"{s['open_ms']:6.1f} {s['decode_ms']:6.1f} {s['resize_ms']:6.1f} {s['encode_ms']:6.1f}")
+
+        print(f"\n合計: {total_in / 1024:.0f} KB → {total_out / 1024:.0f} KB "
+              f"(省下 {100 * (1 - total_out / total_in):.0f}%)，前處理共 {total_ms:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
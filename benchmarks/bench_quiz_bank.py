@@ -0,0 +1,94 @@
+"""
+題庫抽題 vs 每次請 AI 出題 的延遲比較
+
+- 原本：QA.generate_recycling_quiz，每個新的辨識描述都要呼叫一次 API (假模型，有延遲)
+- 題庫：quiz_bank.QuizBank.pick，從 SQLite + 記憶體裡抽一題沒看過的題目，
+  題目不夠時才在背景呼叫 API 補題
+
+用法:
+    python -m benchmarks.bench_quiz_bank
+    python -m benchmarks.bench_quiz_bank --scans 5000 --users 200 --latency 0.8
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('REBORN_DATA_DIR', tempfile.mkdtemp(prefix='reborn-bench-'))
+# 補題間隔縮短，才看得出補題的效果
+os.environ.setdefault('QUIZ_BANK_REFILL_INTERVAL', '1')
+
+import time
+import random
+import argparse
+import statistics
+
+import QA
+import quiz_bank
+from benchmarks.fake_gemini import FakeGenerativeModel, ITEMS
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _describe(i):
+    """辨識結果：物品相同但描述每次略有不同 (原本的出題快取幾乎不會命中)"""
+    item, material = ITEMS[i % len(ITEMS)]
+    return f"這是一個{item}，材質是{material}。(照片 {i})"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scans', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.8, help="假模型每次呼叫的延遲 (秒)")
+    parser.add_argument('--llm-scans', type=int, default=20, help="原本的作法只跑幾次 (每次都要等 API)")
+    args = parser.parse_args()
+
+    model = FakeGenerativeModel(latency=args.latency)
+    QA.model = model
+
+    # 原本：每次掃描都請 AI 出題
+    llm_ms = []
+    for i in range(args.llm_scans):
+        t = time.perf_counter()
+        QA.generate_recycling_quiz(_describe(i))
+        llm_ms.append((time.perf_counter() - t) * 1000)
+    llm_calls = model.calls
+
+    # 題庫
+    t = time.perf_counter()
+    bank = quiz_bank.get_quiz_bank()
+    init_ms = (time.perf_counter() - t) * 1000
+    rng = random.Random(0)
+    bank_ms, categories, served = [], {}, set()
+    repeats = 0
+    start = time.perf_counter()
+    for i in range(args.scans):
+        user = f'user{rng.randrange(args.users)}'
+        category = quiz_bank.categorize(_describe(rng.randrange(10 ** 6)))
+        t = time.perf_counter()
+        qid, _ = bank.pick(user, category)
+        bank_ms.append((time.perf_counter() - t) * 1000)
+        categories[category] = categories.get(category, 0) + 1
+        if (user, qid) in served:
+            repeats += 1
+        served.add((user, qid))
+    elapsed = time.perf_counter() - start
+    # 等背景補題完成
+    while bank._refilling:
+        time.sleep(0.05)
+
+    print(f"原本 (每次呼叫 API)：{len(llm_ms)} 次，p50 {statistics.median(llm_ms):7.1f} ms，"
+          f"p99 {_percentile(llm_ms, 0.99):7.1f} ms，API 呼叫 {llm_calls} 次")
+    print(f"題庫抽題：{len(bank_ms)} 次，p50 {statistics.median(bank_ms):7.3f} ms，"
+          f"p99 {_percentile(bank_ms, 0.99):7.3f} ms，背景補題 API 呼叫 {model.calls - llm_calls} 次 "
+          f"(載入題庫 {init_ms:.0f} ms，總共 {elapsed:.2f} s)")
+    print(f"  每次掃描平均 API 呼叫：{(model.calls - llm_calls) / len(bank_ms):.4f} 次 (原本 1 次)")
+    print(f"  同一個使用者重複看到的題目：{repeats} 次 (該類別全部看完才會重新開始)")
+    print("  題庫大小：" + '，'.join(f"{c} {bank.size(c)}" for c in quiz_bank.CATEGORIES))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+串流出題測試：結果頁多快看到第一段內容 (假模型，有延遲)
+
+- 客戶端：AsyncGeminiClient.quiz 等整個回應 vs 串流 (收到 QUESTION_END 就有題目)
+- 結果頁：上傳照片後讀 /jobs/<id>/events (跟 result.html 一樣)，量從上傳到
+  看到辨識結果、題目、選項、可以作答的時間 (GEMINI_STREAM_QUIZ 開 / 關)
+  題庫清空、不用合併請求，每次掃描都要另外請 AI 出題
+
+用法:
+    python -m benchmarks.bench_quiz_stream
+    python -m benchmarks.bench_quiz_stream --scans 30 --latency 1.0
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('REBORN_DATA_DIR', tempfile.mkdtemp(prefix='reborn-bench-'))
+os.environ.setdefault('GEMINI_RATE_PER_MINUTE', '60000')
+os.environ.setdefault('GEMINI_BURST', '100')
+os.environ.setdefault('CREDENTIAL_WORKERS', '0')
+os.environ['GEMINI_FUSED_SCAN'] = '0'
+os.environ['QUIZ_BANK_MAX_PER_CATEGORY'] = '0'  # 不背景補題
+
+import argparse
+import io
+import json
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+import QA
+import async_client
+import db
+import quiz_bank
+import rate_limit
+from benchmarks.fake_gemini import FakeGenerativeModel
+
+
+def _ms(values):
+    return f"{statistics.median(values) * 1000:6.0f} ms"
+
+
+def bench_client(scans, latency):
+    client = async_client.AsyncGeminiClient(model=FakeGenerativeModel(latency=latency))
+    rows = {'blocking': [], 'stream': []}
+    for i in range(scans):
+        for mode, times in rows.items():
+            sections = {}
+            t = time.perf_counter()
+            on_section = (lambda name, _: sections.setdefault(name, time.perf_counter() - t)) \
+                if mode == 'stream' else None
+            client.quiz_sync(f"這是一個{mode}寶特瓶 #{i}，材質是塑膠。", on_section)
+            total = time.perf_counter() - t
+            times.append((sections.get('question', total), sections.get('options', total), total))
+    print(f"客戶端出題 ({scans} 次的中位數)：      題目      選項      完整")
+    for mode, times in rows.items():
+        q, o, total = zip(*times)
+        print(f"  {mode:9s}                     {_ms(q)} {_ms(o)} {_ms(total)}")
+
+
+def _photo(rng):
+    img = Image.fromarray(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)).resize((640, 480))
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=85)
+    return buf.getvalue()
+
+
+def bench_page(scans, latency):
+    os.environ['JOB_WORKERS'] = '4'
+    import app
+    QA.model = FakeGenerativeModel(latency=latency)
+    quiz_bank._bank = quiz_bank.QuizBank(db.db_path('bench_empty_bank.db'), seed_path=None)
+    app.DAILY_LIMIT = scans * 4
+    app.limiter.limits = {rate_limit.UPLOADS: ((rate_limit.DAY, scans * 4),)}  # 不限制每分鐘請求數
+    client = app.app.test_client()
+    rng = np.random.default_rng(0)
+
+    def scan(n):
+        # 假模型只有 7 種物品，物品名稱加上編號，每次都要重新出題 (不會吃到出題快取)
+        QA.model.tag = f"{n}號"
+        t = time.perf_counter()
+        r = client.post('/scan', data={'file': (io.BytesIO(_photo(rng)), 'photo.jpg')},
+                        content_type='multipart/form-data', headers={'Accept': 'application/json'})
+        urls = r.get_json()
+        seen = {}
+        events = client.get(urls['events_url'], buffered=False)
+        for chunk in events.response:
+            line = chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+            if not line.startswith('data: '):
+                continue
+            data = json.loads(line[6:])
+            now = time.perf_counter() - t
+            for key in ('item_result', 'question', 'options'):
+                if data.get(key):
+                    seen.setdefault(key, now)
+            if data['status'] in ('done', 'failed'):
+                assert data['status'] == 'done', data
+                seen['done'] = now
+                break
+        events.close()
+        app.storage.delete(app.scan_jobs.get_scan_queue().get(urls['job_id'])['payload']['filename'])
+        return seen
+
+    scan(-1)  # 暖機 (啟動 worker、建立資料庫)
+    print(f"結果頁 SSE，從上傳開始 ({scans} 次的中位數)：辨識      題目      選項      可作答")
+    for stream in (False, True):
+        QA.GEMINI_STREAM_QUIZ = stream
+        results = [scan(i + scans * stream) for i in range(scans)]
+        cols = [_ms([r[k] for r in results]) for k in ('item_result', 'question', 'options', 'done')]
+        print(f"  {'stream' if stream else 'blocking':9s}                   {' '.join(cols)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scans', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=1.0, help="假模型整個回應的時間 (秒)")
+    args = parser.parse_args()
+    bench_client(args.scans, args.latency)
+    bench_page(args.scans, args.latency)
+
+
+if __name__ == '__main__':
+    main()
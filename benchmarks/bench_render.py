@@ -0,0 +1,71 @@
+"""
+頁面輸出快取測試：已登入的使用者載入首頁，每秒可以處理幾個請求
+
+三種情況 (Flask test client，單一執行緒連續請求 --seconds 秒)：
+- 不快取：每次都跑 Jinja (RENDER_CACHE_ENTRIES=0，等於之前的作法)
+- 快取：參數一樣時直接用快取的 HTML
+- 304：瀏覽器帶 If-None-Match，不送內容
+結果頁 (/result/<id>) 也量一次。
+
+用法:
+    python -m benchmarks.bench_render
+    python -m benchmarks.bench_render --seconds 10
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('REBORN_DATA_DIR', tempfile.mkdtemp(prefix='reborn-bench-'))
+os.environ.setdefault('CREDENTIAL_WORKERS', '0')
+
+import argparse
+import time
+
+import app
+import render_cache
+import scan_jobs
+
+
+def _rps(client, url, seconds, headers=None, expect=200):
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        r = client.get(url, headers=headers)
+        assert r.status_code == expect, r.status_code
+        n += 1
+    return n / (time.perf_counter() - start), r
+
+
+def _done_job(username):
+    """直接在佇列裡放一個已完成的工作 (不用真的跑辨識)"""
+    queue = scan_jobs.get_scan_queue()
+    job_id = queue.enqueue(username, scan_jobs.RECOGNIZE, {'filename': 'x.jpg', 'sha256': None})
+    queue.advance(job_id, scan_jobs.DONE, {'item_result': '這是一個寶特瓶，材質是塑膠。',
+                                            'question': '寶特瓶要怎麼回收？', 'options': '(A)清空後回收 (B)丟垃圾',
+                                            'answer': 'A', 'explanation': '清空後回收。'})
+    return job_id
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    client = app.app.test_client()
+    client.post('/register', data={'username': 'bench_user', 'password': 'bench-pw', 'confirm_password': 'bench-pw'})
+    client.post('/login', data={'username': 'bench_user', 'password': 'bench-pw'})
+    job_id = _done_job('bench_user')
+
+    for label, url in (('首頁 /', '/'), ('結果頁 /result', f'/result/{job_id}')):
+        app.pages = render_cache.RenderCache(max_entries=0)
+        before, _ = _rps(client, url, args.seconds)
+        app.pages = render_cache.RenderCache()
+        after, r = _rps(client, url, args.seconds)
+        etag = r.headers['ETag']
+        not_modified, _ = _rps(client, url, args.seconds, {'If-None-Match': etag}, expect=304)
+        print(f"{label:14s} 不快取 {before:7.0f} req/s   快取 {after:7.0f} req/s ({after / before - 1:+.0%})   "
+              f"304 {not_modified:7.0f} req/s ({not_modified / before - 1:+.0%})  {len(r.get_data())} bytes")
+
+
+if __name__ == '__main__':
+    main()
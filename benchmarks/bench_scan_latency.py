@@ -0,0 +1,135 @@
+"""
+/scan 回應時間測試：上傳後排入佇列馬上返回，辨識與出題在背景 worker 完成
+
+用 Flask test client 連續上傳照片 (假模型，有延遲)，量：
+- /scan 本身的回應時間 (p50 / p99)
+- 從上傳到題目出好 (工作 done) 的時間
+
+用法:
+    python -m benchmarks.bench_scan_latency
+    python -m benchmarks.bench_scan_latency --scans 100 --latency 0.5 --workers 8
+    python -m benchmarks.bench_scan_latency --worker-process   # worker 另外一個行程 (同 python scan_jobs.py)
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('REBORN_DATA_DIR', tempfile.mkdtemp(prefix='reborn-bench-'))
+# 假模型不需要配合真正的配額
+os.environ.setdefault('GEMINI_RATE_PER_MINUTE', '60000')
+os.environ.setdefault('GEMINI_BURST', '100')
+
+import io
+import sys
+import subprocess
+import time
+import argparse
+import statistics
+
+import numpy as np
+from PIL import Image
+
+import QA
+import rate_limit
+from benchmarks.fake_gemini import FakeGenerativeModel
+
+
+def _make_photo(rng, size=(2000, 1500)):
+    """
+    做一張約手機照片大小的 JPEG：隨機的大色塊 (每張的感知雜湊都不同，不會被當成近似重複)
+    加上細雜訊 (檔案大小接近真的照片)
+    """
+    base = Image.fromarray(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)).resize(size, Image.BICUBIC)
+    noise = rng.integers(-12, 13, (size[1], size[0], 3))
+    pixels = np.clip(np.asarray(base, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scans', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.5, help="假模型每次呼叫的延遲 (秒)")
+    parser.add_argument('--workers', type=int, default=8, help="背景 worker 執行緒數")
+    parser.add_argument('--worker-process', action='store_true',
+                        help="worker 跑在另一個行程，網頁行程只負責收件")
+    parser.add_argument('--serve-worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    QA.model = FakeGenerativeModel(latency=args.latency)
+    if args.serve_worker:
+        import scan_jobs
+        os.nice(scan_jobs.JOB_WORKER_NICE)
+        scan_jobs.start_workers(args.workers)
+        sys.stdin.read()  # 父行程結束 (stdin 關閉) 時跟著結束
+        return
+
+    worker = None
+    if args.worker_process:
+        worker = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_scan_latency', '--serve-worker',
+                                   '--latency', str(args.latency), '--workers', str(args.workers)],
+                                  stdin=subprocess.PIPE)
+        os.environ['JOB_WORKERS'] = '0'
+    else:
+        os.environ['JOB_WORKERS'] = str(args.workers)
+    import app
+    import scan_jobs
+    app.DAILY_LIMIT = args.scans * 2
+    app.limiter.limits = {rate_limit.UPLOADS: ((rate_limit.DAY, args.scans * 2),)}  # 不限制每分鐘請求數
+
+    rng = np.random.default_rng(0)
+    # 第一張只用來暖機 (建立資料庫、啟動 worker)，不計入
+    photos = [_make_photo(rng) for _ in range(args.scans + 1)]
+    print(f"照片 {args.scans} 張 (另加 1 張暖機)，平均 {statistics.mean(map(len, photos)) / 1024:.0f} KB，"
+          f"假模型延遲 {args.latency}s，worker {args.workers} 個")
+
+    client = app.app.test_client()
+    queue = scan_jobs.get_scan_queue()
+    scan_ms, submitted = [], {}
+    try:
+        for i, data in enumerate(photos):
+            t = time.perf_counter()
+            r = client.post('/scan', data={'file': (io.BytesIO(data), f'photo{i}.jpg')},
+                            content_type='multipart/form-data',
+                            headers={'Accept': 'application/json'})
+            if i > 0:
+                scan_ms.append((time.perf_counter() - t) * 1000)
+            assert r.status_code == 202, r.status_code
+            submitted[r.get_json()['job_id']] = time.time()
+
+        # 等所有工作結束
+        finished = {}
+        deadline = time.time() + 600
+        while len(finished) < len(submitted) and time.time() < deadline:
+            for job_id in submitted:
+                if job_id not in finished:
+                    job = queue.get(job_id)
+                    if job['stage'] in ('done', 'failed'):
+                        finished[job_id] = job
+            time.sleep(0.05)
+        end_to_end = [finished[j]['updated_at'] - submitted[j] for j in finished]
+        failed = sum(1 for job in finished.values() if job['stage'] == 'failed')
+    finally:
+        if worker is not None:
+            worker.stdin.close()
+            worker.wait()
+        # 清掉測試上傳的照片
+        for job_id in submitted:
+            app.storage.delete(queue.get(job_id)['payload']['filename'])
+
+    print(f"/scan 回應   p50 {statistics.median(scan_ms):6.1f} ms  p99 {_percentile(scan_ms, 0.99):6.1f} ms  "
+          f"最大 {max(scan_ms):6.1f} ms")
+    print(f"題目完成     p50 {statistics.median(end_to_end):6.2f} s   p99 {_percentile(end_to_end, 0.99):6.2f} s   "
+          f"(完成 {len(finished)}/{len(submitted)}，失敗 {failed})")
+    if worker is None:
+        print(f"API 呼叫 {QA.model.calls} 次")
+
+
+if __name__ == '__main__':
+    main()
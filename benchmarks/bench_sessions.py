@@ -0,0 +1,93 @@
+"""
+伺服器端 session 測試：已登入的使用者載入首頁要多久
+
+量測 (Flask test client，同一個已登入的使用者重複載入 /)：
+- memory / sqlite 兩種 session 儲存
+- 使用者摘要有快取 vs 每次重新計算 (SESSION_SUMMARY_TTL=0)
+另外量 session 儲存裡有 --sessions 筆時，依 id 讀取一筆的時間。
+
+用法:
+    python -m benchmarks.bench_sessions
+    python -m benchmarks.bench_sessions --requests 5000 --sessions 1000000
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('REBORN_DATA_DIR', tempfile.mkdtemp(prefix='reborn-bench-'))
+os.environ.setdefault('CREDENTIAL_WORKERS', '0')
+
+import argparse
+import random
+import secrets
+import statistics
+import time
+
+import app
+import db
+import sessions
+
+
+def _index_us(client, n):
+    times = []
+    for _ in range(n):
+        t = time.perf_counter()
+        r = client.get('/')
+        times.append((time.perf_counter() - t) * 1e6)
+        assert r.status_code == 200
+    return statistics.median(times)
+
+
+def bench_index(store, summary_ttl, n):
+    app.app.session_interface = sessions.ServerSessionInterface(store)
+    sessions.SUMMARY_TTL = summary_ttl
+    client = app.app.test_client()
+    username = 'bench_' + secrets.token_hex(4)
+    client.post('/register', data={'username': username, 'password': 'bench-pw', 'confirm_password': 'bench-pw'})
+    client.post('/login', data={'username': username, 'password': 'bench-pw'})
+    _index_us(client, 20)  # 暖機
+    return _index_us(client, n)
+
+
+def bench_lookup(store, count, samples):
+    sids = [secrets.token_urlsafe(32) for _ in range(count)]
+    expires_at = time.time() + 3600
+    if isinstance(store, sessions.SQLiteSessionStore):
+        # 大量寫入用一個交易，只是為了準備資料快一點
+        with db.transaction(store._conn()) as conn:
+            conn.executemany('INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                             ((sid, '{"username": "u"}', expires_at) for sid in sids))
+    else:
+        for sid in sids:
+            store.save(sid, {'username': 'u'}, expires_at)
+    times = []
+    for sid in random.sample(sids, samples):
+        t = time.perf_counter()
+        store.load(sid)
+        times.append((time.perf_counter() - t) * 1e6)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--sessions', type=int, default=100000, help="量讀取時間時儲存裡的 session 數")
+    parser.add_argument('--samples', type=int, default=10000)
+    args = parser.parse_args()
+
+    sqlite_store = sessions.SQLiteSessionStore(os.path.join(os.environ['REBORN_DATA_DIR'], 'bench_sessions.db'))
+    memory_store = sessions.MemorySessionStore()
+    print(f"已登入的使用者載入首頁 ({args.requests} 次的中位數)：")
+    for label, store in (('memory', memory_store), ('sqlite', sqlite_store)):
+        for ttl, note in ((30.0, '摘要快取'), (0.0, '每次重新計算')):
+            print(f"  {label:7s} {note:10s} {bench_index(store, ttl, args.requests):8.0f} µs")
+
+    print(f"{args.sessions:,} 個 session 時依 id 讀取一筆：")
+    for label, store in (('memory', sessions.MemorySessionStore()),
+                         ('sqlite', sessions.SQLiteSessionStore(
+                             os.path.join(os.environ['REBORN_DATA_DIR'], 'bench_lookup.db')))):
+        print(f"  {label:7s} {bench_lookup(store, args.sessions, args.samples):8.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
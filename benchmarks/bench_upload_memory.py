@@ -0,0 +1,123 @@
+"""
+上傳記憶體測試：上傳越來越大的 JPEG 到 /scan，量測伺服器行程的尖峰記憶體 (VmHWM)
+
+上傳是邊收邊寫入硬碟，辨識前直接把開好的檔案交給 Pillow 並用 JPEG draft 縮小解碼，
+所以尖峰記憶體應該幾乎不隨檔案大小增加。
+
+用法:
+    python -m benchmarks.bench_upload_memory
+    python -m benchmarks.bench_upload_memory --limit-mb 48
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SIZES = [(1000, 750), (4000, 3000), (8000, 6000)]
+BOUNDARY = 'reborn-bench-boundary'
+
+
+def _serve(port, workdir):
+    os.environ['REBORN_DATA_DIR'] = os.path.join(workdir, 'data')
+    os.environ['UPLOAD_MAX_BYTES'] = str(512 * 1024 * 1024)
+    os.chdir(workdir)
+    sys.path.insert(0, BASE_DIR)
+    from werkzeug.serving import make_server
+    import app
+    make_server('127.0.0.1', port, app.app).serve_forever()
+
+
+def _peak_rss_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _make_jpeg(path, size, seed):
+    rng = np.random.default_rng(seed)
+    # 低解析度雜訊放大，讓 JPEG 檔案夠大又像真實照片
+    small = rng.integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    Image.fromarray(small).resize(size, Image.Resampling.BICUBIC).save(path, 'JPEG', quality=98)
+
+
+def _upload(port, path):
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; '
+            f'filename="{os.path.basename(path)}"\r\nContent-Type: image/jpeg\r\n\r\n').encode()
+    tail = f'\r\n--{BOUNDARY}--\r\n'.encode()
+    length = len(head) + os.path.getsize(path) + len(tail)
+
+    def body():
+        yield head
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+        yield tail
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    conn.request('POST', '/scan', body=body(), headers={
+        'Content-Type': f'multipart/form-data; boundary={BOUNDARY}',
+        'Content-Length': str(length),
+    })
+    status = conn.getresponse().status
+    conn.close()
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--limit-mb', type=float, default=16.0,
+                        help="最大與最小檔案之間，尖峰記憶體最多允許增加多少 MB")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        server = multiprocessing.get_context('spawn').Process(target=_serve, args=(port, workdir))
+        server.start()
+        try:
+            for _ in range(100):
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+
+            peaks = []
+            for seed, size in enumerate(SIZES):
+                path = os.path.join(workdir, f'photo_{size[0]}x{size[1]}.jpg')
+                _make_jpeg(path, size, seed)
+                t = time.perf_counter()
+                status = _upload(port, path)
+                elapsed = time.perf_counter() - t
+                peak = _peak_rss_mb(server.pid)
+                peaks.append(peak)
+                print(f"{size[0]}x{size[1]}: {os.path.getsize(path) / 1e6:6.1f} MB，"
+                      f"HTTP {status}，{elapsed:.2f} s，伺服器尖峰記憶體 {peak:.1f} MB")
+        finally:
+            server.terminate()
+            server.join()
+
+    growth = peaks[-1] - peaks[0]
+    ok = growth <= args.limit_mb
+    print(f"尖峰記憶體增加 {growth:.1f} MB (上限 {args.limit_mb} MB) → {'通過' if ok else '失敗'}")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
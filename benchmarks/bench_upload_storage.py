@@ -0,0 +1,124 @@
+"""
+上傳儲存測試：一百萬個檔案時，平面資料夾 vs sha256 分層 + 索引
+
+量測：
+- 寫入：暫存檔 → 改名到最終位置 (分層多了建資料夾與寫索引)
+- 查詢：隨機找一個檔案的路徑 (os.stat)
+- 清理要找出最舊的檔案：平面資料夾只能整個列出來再 stat，分層用索引查
+- 執行一次清理 (容量預算設成目前的 99%)
+
+檔案內容都是 1KB，只測檔案系統與索引的成本。
+
+用法:
+    python -m benchmarks.bench_upload_storage
+    python -m benchmarks.bench_upload_storage --files 100000 --dir /mnt/disk/tmp
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from upload_storage import LocalUploadStorage
+
+PAYLOAD = b'x' * 1024
+
+
+def _keys(n):
+    return [hashlib.sha256(i.to_bytes(8, 'little')).hexdigest() for i in range(n)]
+
+
+def _write_temp(directory, i):
+    path = os.path.join(directory, f'.upload-{i}')
+    with open(path, 'wb') as f:
+        f.write(PAYLOAD)
+    return path
+
+
+def _lookup_us(find, names, samples):
+    times = []
+    for name in random.sample(names, samples):
+        t = time.perf_counter()
+        find(name)
+        times.append((time.perf_counter() - t) * 1e6)
+    return statistics.median(times)
+
+
+def bench_writes(flat_root, storage, keys):
+    """
+    兩種寫法交錯執行，各自累計時間
+    (雲端硬碟寫入一段時間後常被限速，分開跑的話後跑的一方會吃虧)
+    """
+    os.makedirs(flat_root)
+    flat_s = sharded_s = 0.0
+    for i, key in enumerate(keys):
+        temp = _write_temp(flat_root, i)
+        t = time.perf_counter()
+        os.replace(temp, os.path.join(flat_root, key + '.jpg'))
+        flat_s += time.perf_counter() - t
+
+        temp = _write_temp(storage.root, i)
+        t = time.perf_counter()
+        storage.put_file(temp, key, '.jpg')
+        sharded_s += time.perf_counter() - t
+    return flat_s, sharded_s
+
+
+def oldest_flat(root):
+    """平面資料夾找最舊的 1000 個檔案：只能全部列出來再 stat"""
+    return sorted(os.scandir(root), key=lambda e: e.stat().st_mtime)[:1000]
+
+
+def oldest_indexed(storage):
+    return storage._conn().execute('SELECT key FROM uploads ORDER BY accessed_at LIMIT 1000').fetchall()
+
+
+def _ms(fn, *args):
+    t = time.perf_counter()
+    result = fn(*args)
+    assert len(result) == 1000
+    return (time.perf_counter() - t) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=1_000_000)
+    parser.add_argument('--samples', type=int, default=10000, help="隨機查詢次數")
+    parser.add_argument('--dir', default=None, help="測試用的資料夾 (預設系統暫存資料夾)")
+    args = parser.parse_args()
+
+    keys = _keys(args.files)
+    names = [key + '.jpg' for key in keys]
+    workdir = tempfile.mkdtemp(prefix='bench-storage-', dir=args.dir)
+    try:
+        print(f"{args.files:,} 個檔案 ({workdir})")
+        flat_root = os.path.join(workdir, 'flat')
+        storage = LocalUploadStorage(os.path.join(workdir, 'sharded'), os.path.join(workdir, 'uploads.db'),
+                                     retention_seconds=0, min_age=0, budget_bytes=1 << 62)
+        flat_s, sharded_s = bench_writes(flat_root, storage, keys)
+
+        flat_lookup = _lookup_us(lambda name: os.stat(os.path.join(flat_root, name)), names, args.samples)
+        sharded_lookup = _lookup_us(storage.local_path, names, args.samples)
+        flat_oldest = _ms(oldest_flat, flat_root)
+        sharded_oldest = _ms(oldest_indexed, storage)
+
+        for label, write_s, lookup, oldest in (('平面', flat_s, flat_lookup, flat_oldest),
+                                               ('分層', sharded_s, sharded_lookup, sharded_oldest)):
+            print(f"{label}: 寫入 {write_s:6.1f}s ({write_s / args.files * 1e6:5.1f} µs/檔)  "
+                  f"查詢 {lookup:5.1f} µs  找最舊 1000 個 {oldest:8.1f} ms")
+
+        _, total = storage.usage()
+        storage.budget_bytes = int(total * 0.99)
+        t = time.perf_counter()
+        deleted, _ = storage.enforce_retention()
+        print(f"清理: 超過預算 1%，刪除 {deleted:,} 個檔案 {time.perf_counter() - t:.1f}s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+上傳照片提供測試：結果頁載入原圖 vs 縮圖的大小與回應時間
+
+模擬一張手機照片 (4032x3024 JPEG，加上雜訊讓大小接近真實照片)，量測：
+- 原圖 / 縮圖的 bytes
+- 縮圖第一次請求 (產生縮圖) 與之後 (直接從硬碟送出) 的時間
+- 帶 If-None-Match 的 304、Range 請求的 206
+
+用法:
+    python -m benchmarks.bench_uploads
+    python -m benchmarks.bench_uploads --requests 500 --size 240
+"""
+
+import argparse
+import hashlib
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from flask import Flask
+from PIL import Image
+
+import upload_serving
+from upload_storage import LocalUploadStorage
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _phone_photo(storage):
+    """範例圖放大成手機尺寸再加雜訊，存進上傳儲存 (跟 upload_ingest.py 一樣用 sha256 當檔名)"""
+    src = Image.open(os.path.join(BASE_DIR, 'static', 'baby.png')).convert('RGB')
+    pixels = np.asarray(src.resize((4032, 3024), Image.Resampling.BICUBIC), dtype=np.int16)
+    noise = np.random.default_rng(0).integers(-12, 13, pixels.shape, dtype=np.int16)
+    photo = Image.fromarray(np.clip(pixels + noise, 0, 255).astype(np.uint8))
+    tmp = os.path.join(storage.root, 'photo.jpg')
+    photo.save(tmp, 'JPEG', quality=92)
+    with open(tmp, 'rb') as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+    return storage.put_file(tmp, sha256, '.jpg')
+
+
+def _make_app(storage):
+    app = Flask(__name__)
+    thumbnails = upload_serving.ThumbnailCache(storage)
+    app.add_url_rule('/uploads/<filename>', 'uploaded_file',
+                     lambda filename: upload_serving.send_upload(storage, filename))
+    app.add_url_rule('/uploads/<int:size>/<filename>', 'upload_thumbnail',
+                     lambda size, filename: upload_serving.send_thumbnail(thumbnails, filename, size))
+    return app
+
+
+def _timed(client, url, n, headers=None):
+    times = []
+    for _ in range(n):
+        t = time.perf_counter()
+        response = client.get(url, headers=headers)
+        response.get_data()
+        times.append((time.perf_counter() - t) * 1000)
+        response.close()
+    return statistics.median(times), response
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--size', type=int, default=480, choices=upload_serving.THUMBNAIL_SIZES)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        storage = LocalUploadStorage(os.path.join(tmpdir, 'uploads'), os.path.join(tmpdir, 'uploads.db'))
+        name = _phone_photo(storage)
+        client = _make_app(storage).test_client()
+        original_url = f'/uploads/{name}'
+        thumb_url = f'/uploads/{args.size}/{name}'
+
+        original_ms, original = _timed(client, original_url, args.requests)
+        t = time.perf_counter()
+        first = client.get(thumb_url)
+        first_ms = (time.perf_counter() - t) * 1000
+        thumb_ms, thumb = _timed(client, thumb_url, args.requests)
+        etag = thumb.headers['ETag']
+        not_modified_ms, not_modified = _timed(client, thumb_url, args.requests, {'If-None-Match': etag})
+        partial = client.get(original_url, headers={'Range': 'bytes=0-1023'})
+
+        print(f"原圖:  {len(original.get_data()) / 1024:8.1f} KB  每次 {original_ms:6.2f} ms")
+        print(f"縮圖:  {len(thumb.get_data()) / 1024:8.1f} KB  第一次 (產生) {first_ms:6.1f} ms，"
+              f"之後每次 {thumb_ms:6.2f} ms  [{first.status_code}]")
+        print(f"304:   {not_modified.status_code}  每次 {not_modified_ms:6.2f} ms  (ETag {etag[:20]}...)")
+        print(f"Range: {partial.status_code}  {len(partial.get_data())} bytes  {partial.headers.get('Content-Range')}")
+        print(f"Cache-Control: {thumb.headers.get('Cache-Control')}")
+        print(f"\n結果頁的照片: {len(original.get_data()) / len(thumb.get_data()):.0f} 倍小")
+
+
+if __name__ == '__main__':
+    main()
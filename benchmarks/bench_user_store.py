@@ -0,0 +1,68 @@
+"""
+登入延遲測試：用戶數從 10 增加到 100 萬，單次登入查詢的時間應該維持平穩
+
+用法:
+    python -m benchmarks.bench_user_store
+    python -m benchmarks.bench_user_store --sizes 10 1000 100000 --lookups 5000
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from user_store import SQLiteUserStore
+
+
+def _hash(password):
+    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+
+def _rows(n):
+    password_hash = _hash('1234')
+    for i in range(n):
+        yield (f'user{i}', password_hash, '2026-01-01T00:00:00')
+
+
+def bench_size(tmpdir, n, lookups):
+    store = SQLiteUserStore(os.path.join(tmpdir, f'users_{n}.db'))
+    t0 = time.perf_counter()
+    store.import_users(_rows(n))
+    build = time.perf_counter() - t0
+
+    names = [f'user{random.randrange(n)}' for _ in range(lookups)]
+    expected = _hash('1234')
+    samples = []
+    for name in names:
+        t = time.perf_counter()
+        user = store.get_user(name)
+        ok = user is not None and user['password_hash'] == expected
+        samples.append(time.perf_counter() - t)
+        assert ok
+    samples.sort()
+    return {
+        'users': n,
+        'build_s': build,
+        'p50_us': statistics.median(samples) * 1e6,
+        'p99_us': samples[int(len(samples) * 0.99) - 1] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000, 1000000])
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'用戶數':>10} {'建立(s)':>10} {'p50(us)':>10} {'p99(us)':>10}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in args.sizes:
+            r = bench_size(tmpdir, n, args.lookups)
+            print(f"{r['users']:>10} {r['build_s']:>10.2f} {r['p50_us']:>10.1f} {r['p99_us']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
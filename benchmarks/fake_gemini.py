@@ -0,0 +1,213 @@
+"""
+假的 Gemini 模型，給效能測試使用 (不連網、不花配額)
+
+可以設定：
+- latency：每次回應的延遲秒數 (加上 ±20% 抖動)
+- error_rate：隨機回傳 500 錯誤的機率
+- quota_per_minute：超過每分鐘配額時丟出 429 (ResourceExhausted)
+- invalid_json_rate：要求 JSON 輸出時，隨機回傳截斷的 JSON 的機率
+- image_latency：一次請求有好幾張照片時 (批次辨識)，每多一張多的延遲秒數
+- first_chunk：stream=True 時第一段在 latency 的多少比例送出，其餘文字平均分成 stream_chunks 段
+  (跟真的模型一樣：整個回應的時間不變，但開頭很快就收到)
+
+辨識結果依圖片內容決定 (同一張圖永遠是同一個物品)，
+出題依物品描述產生固定格式的題目。
+generation_config 指定 application/json 時回傳 JSON：辨識 + 出題 (QA.SCAN_GENERATION_CONFIG)，
+或每張照片 1~3 個物品 (QA.BATCH_GENERATION_CONFIG)。
+"""
+
+import asyncio
+import collections
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+ITEMS = [
+    ("寶特瓶", "塑膠"),
+    ("紙杯", "紙"),
+    ("紙袋", "紙"),
+    ("鋁罐", "鋁"),
+    ("玻璃瓶", "玻璃"),
+    ("鋁箔包", "紙與鋁箔"),
+    ("塑膠袋", "塑膠"),
+]
+# web_app/題目.py 的類別代碼
+ITEM_CATEGORIES = {
+    "寶特瓶": "plastic_bottle",
+    "紙杯": "paper_cup",
+    "紙袋": "paper_bag",
+    "鋁罐": "can",
+    "玻璃瓶": "glass",
+    "鋁箔包": "carton",
+}
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStream:
+    """stream=True 的回應：可以用 for 或 async for 逐段讀取"""
+
+    def __init__(self, chunks, delays):
+        self._chunks = chunks
+        self._delays = delays
+
+    def __iter__(self):
+        for chunk, delay in zip(self._chunks, self._delays):
+            time.sleep(delay)
+            yield FakeResponse(chunk)
+
+    async def __aiter__(self):
+        for chunk, delay in zip(self._chunks, self._delays):
+            await asyncio.sleep(delay)
+            yield FakeResponse(chunk)
+
+
+class FakeError(Exception):
+    pass
+
+
+def _rate_limit_error():
+    try:
+        from google.api_core.exceptions import ResourceExhausted
+        return ResourceExhausted("429 Resource has been exhausted (fake)")
+    except ImportError:
+        return FakeError("429 Resource has been exhausted (fake)")
+
+
+class FakeGenerativeModel:
+    """介面與 genai.GenerativeModel 相同的假模型"""
+
+    def __init__(self, model_name="fake", latency=0.5, error_rate=0.0,
+                 quota_per_minute=None, tag="", invalid_json_rate=0.0,
+                 first_chunk=0.2, stream_chunks=8, image_latency=0.05):
+        self.model_name = model_name
+        self.latency = latency
+        self.image_latency = image_latency
+        self.first_chunk = first_chunk
+        self.stream_chunks = stream_chunks
+        self.error_rate = error_rate
+        self.invalid_json_rate = invalid_json_rate
+        self.quota_per_minute = quota_per_minute
+        self.tag = tag
+        self.calls = 0
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+
+    # === 回應內容 ===
+
+    def _images(self, contents):
+        images = []
+        for part in contents if isinstance(contents, list) else [contents]:
+            if isinstance(part, dict) and 'data' in part:
+                images.append(part['data'])
+            elif hasattr(part, 'tobytes'):
+                images.append(part.tobytes())
+        return images
+
+    def _image_bytes(self, contents):
+        images = self._images(contents)
+        return images[0] if images else None
+
+    def _batch_answer(self, contents):
+        images = []
+        for i, image in enumerate(self._images(contents), 1):
+            digest = hashlib.sha256(image).digest()
+            items = [ITEMS[digest[k] % len(ITEMS)] for k in range(1 + digest[-1] % 3)]
+            images.append({"index": i, "items": [
+                {"item": self.tag + item, "material": material, "category": ITEM_CATEGORIES.get(item, "unknown")}
+                for item, material in items
+            ]})
+        return json.dumps({"images": images}, ensure_ascii=False)
+
+    def _json_answer(self, contents):
+        image = self._image_bytes(contents)
+        if image is not None:
+            item, material = ITEMS[hashlib.sha256(image).digest()[0] % len(ITEMS)]
+        else:
+            # 修正 JSON 的請求：沿用原本文字裡的物品
+            prompt = contents if isinstance(contents, str) else str(contents)
+            item, material = next(((i, m) for i, m in ITEMS if i in prompt), ITEMS[0])
+        text = json.dumps({
+            "item": self.tag + item,
+            "material": material,
+            "category": ITEM_CATEGORIES.get(item, "unknown"),
+            "quiz": {
+                "question": f"{item}應該怎麼回收？",
+                "options": "(A)清空洗淨後分類回收 (B)直接丟一般垃圾 (C)燒掉 (D)埋起來",
+                "answer": "A",
+                "explanation": "清空並洗淨後分類，才能真正被回收再利用。",
+            },
+        }, ensure_ascii=False)
+        if image is not None and self.invalid_json_rate and random.random() < self.invalid_json_rate:
+            return text[:len(text) // 2]
+        return text
+
+    def _answer(self, contents, generation_config=None):
+        if (generation_config or {}).get('response_mime_type') == 'application/json':
+            if 'images' in generation_config.get('response_schema', {}).get('properties', {}):
+                return self._batch_answer(contents)
+            return self._json_answer(contents)
+        image = self._image_bytes(contents)
+        if image is not None:
+            item, material = ITEMS[hashlib.sha256(image).digest()[0] % len(ITEMS)]
+            return f"這是一個{self.tag}{item}，材質是{material}。"
+        prompt = contents if isinstance(contents, str) else str(contents)
+        # 題庫補題會一次要好幾題 (「出 N 個」)
+        match = re.search(r'出 (\d+) 個', prompt)
+        count = int(match.group(1)) if match else 1
+        return '\n\n'.join(
+            f"QUESTION_START 關於{prompt[3:20]}，下列哪個回收方式正確？"
+            f"{f' (第 {random.randrange(10 ** 6)} 題)' if match else ''} QUESTION_END\n"
+            "OPTIONS_START (A)清空洗淨後分類回收 (B)直接丟一般垃圾 (C)燒掉 (D)埋起來 OPTIONS_END\n"
+            "ANSWER_START A ANSWER_END\n"
+            "EXPLANATION_START 清空並洗淨後分類，才能真正被回收再利用。 EXPLANATION_END"
+            for _ in range(count)
+        )
+
+    def _check(self):
+        with self._lock:
+            self.calls += 1
+            if self.quota_per_minute:
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] > 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.quota_per_minute:
+                    raise _rate_limit_error()
+                self._recent.append(now)
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeError("500 Internal error (fake)")
+
+    def _delay(self, contents=None):
+        extra = self.image_latency * max(len(self._images(contents)) - 1, 0) if contents else 0.0
+        return self.latency * random.uniform(0.8, 1.2) + extra
+
+    def _stream(self, text):
+        total = self._delay()  # 串流只用在出題 (沒有圖片)
+        size = -(-len(text) // self.stream_chunks)
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        rest = total * (1 - self.first_chunk) / max(len(chunks) - 1, 1)
+        return FakeStream(chunks, [total * self.first_chunk] + [rest] * (len(chunks) - 1))
+
+    # === 與 genai.GenerativeModel 相同的方法 ===
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self._check()
+        text = self._answer(contents, kwargs.get('generation_config'))
+        if stream:
+            return self._stream(text)
+        time.sleep(self._delay(contents))
+        return FakeResponse(text)
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        self._check()
+        text = self._answer(contents, kwargs.get('generation_config'))
+        if stream:
+            return self._stream(text)
+        await asyncio.sleep(self._delay(contents))
+        return FakeResponse(text)
@@ -0,0 +1,380 @@
+"""
+端到端壓力測試：用 gunicorn 啟動 app.py (假的 Gemini)，多個虛擬使用者同時操作
+
+每個虛擬使用者依 --mix 的比例隨機做：
+- login：註冊一個新帳號並登入 (register 另外計時)
+- index：載入首頁
+- scan：上傳一張範例圖片 (專案裡的 PNG，輪流使用)，收到工作編號
+- answer：等自己最早的一個掃描出好題目 (GET /jobs/<id>，計為 job_status)，
+  看結果頁 (result) 後作答 (answer)
+每個帳號掃描次數用完 (每日上限或範例圖片都掃過) 時自動換一個新帳號。
+
+輸出一份 JSON (可以存起來跟其他 commit 比較)：
+吞吐量、每種請求的 p50 / p95 / p99、錯誤數、gunicorn 所有行程的 RSS。
+
+用法:
+    python -m benchmarks.loadtest
+    python -m benchmarks.loadtest --users 16 --duration 60 --latency 0.5 --error-rate 0.05 --out before.json
+    python -m benchmarks.loadtest --mix login=1,index=4,scan=2,answer=2 --gunicorn-workers 4 --threads 4
+    python -m benchmarks.loadtest --compare before.json --out after.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_MIX = 'login=1,index=4,scan=2,answer=2'
+# 超過這個時間的請求當作失敗 (秒)
+REQUEST_TIMEOUT = 30
+SCANS_PER_ACCOUNT = 10
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('login', 'index', 'scan', 'answer'):
+            raise argparse.ArgumentTypeError(f"不認識的動作: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _sample_images():
+    """專案根目錄的範例 PNG (內容相同的只留一張)"""
+    images, seen = [], set()
+    for path in sorted(glob.glob(os.path.join(BASE_DIR, '*.png'))):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data not in seen:
+            seen.add(data)
+            images.append((os.path.basename(path), data))
+    return images
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# === gunicorn ===
+
+class Server:
+    """在暫存資料夾裡啟動 gunicorn (資料庫、上傳檔案都不會碰到專案裡的資料)"""
+
+    def __init__(self, args):
+        self.workdir = tempfile.mkdtemp(prefix='reborn-loadtest-')
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        env = dict(os.environ,
+                   REBORN_DATA_DIR=os.path.join(self.workdir, 'data'),
+                   UPLOAD_DIR=os.path.join(self.workdir, 'uploads'),
+                   FAKE_GEMINI_LATENCY=str(args.latency),
+                   FAKE_GEMINI_ERROR_RATE=str(args.error_rate),
+                   FAKE_GEMINI_QUOTA=str(args.quota or 0),
+                   JOB_WORKERS=str(args.job_workers),
+                   PYTHONWARNINGS='ignore::DeprecationWarning')
+        if not args.quota:
+            # 假模型沒有配額時，客戶端也不用限速
+            env.setdefault('GEMINI_RATE_PER_MINUTE', '60000')
+            env.setdefault('GEMINI_BURST', '100')
+        cmd = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{self.port}',
+               '--workers', str(args.gunicorn_workers), '--threads', str(args.threads),
+               '--timeout', '120', '--log-level', 'warning', 'benchmarks.loadtest_app:app']
+        self.proc = subprocess.Popen(cmd, cwd=BASE_DIR, env=env)
+
+    def wait_ready(self, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"gunicorn 啟動失敗 (結束代碼 {self.proc.returncode})")
+            try:
+                if requests.get(self.url + '/healthz', timeout=1).status_code == 200:
+                    return
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("gunicorn 沒有在時間內啟動")
+
+    def pids(self):
+        """master 與所有 worker 的 pid"""
+        pids = [self.proc.pid]
+        try:
+            with open(f'/proc/{self.proc.pid}/task/{self.proc.pid}/children') as f:
+                pids += [int(pid) for pid in f.read().split()]
+        except OSError:
+            pass
+        return pids
+
+    def rss_mb(self):
+        total = 0
+        for pid in self.pids():
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total += int(line.split()[1])
+            except OSError:
+                continue
+        return total / 1024
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGTERM)
+            try:
+                self.proc.wait(30)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# === 虛擬使用者 ===
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.outcomes = defaultdict(lambda: defaultdict(int))
+
+    def add(self, op, seconds, ok=True):
+        with self._lock:
+            self.latencies[op].append(seconds)
+            if not ok:
+                self.errors[op] += 1
+
+    def outcome(self, op, name):
+        with self._lock:
+            self.outcomes[op][name] += 1
+
+
+class VirtualUser:
+    def __init__(self, base_url, mix, images, recorder, stop, rng):
+        self.base = base_url
+        self.ops = list(mix)
+        self.weights = [mix[op] for op in self.ops]
+        self.images = images
+        self.rec = recorder
+        self.stop = stop
+        self.rng = rng
+        self.http = None
+        self.scans_left = 0
+        self.pending = []
+
+    def request(self, op, method, path, expect=(200,), **kwargs):
+        t = time.perf_counter()
+        try:
+            r = self.http.request(method, self.base + path, timeout=REQUEST_TIMEOUT, **kwargs)
+            r.content
+        except requests.RequestException:
+            self.rec.add(op, time.perf_counter() - t, ok=False)
+            return None
+        self.rec.add(op, time.perf_counter() - t, ok=r.status_code in expect)
+        return r
+
+    def login(self):
+        """註冊新帳號後登入 (新帳號才有完整的每日次數，也不會被判定重複)"""
+        self.http = requests.Session()
+        username = 'lt_' + uuid.uuid4().hex[:12]
+        password = 'loadtest-pw'
+        self.request('register', 'POST', '/register',
+                     data={'username': username, 'password': password, 'confirm_password': password})
+        self.request('login', 'POST', '/login', expect=(302,), allow_redirects=False,
+                     data={'username': username, 'password': password})
+        self.scans_left = min(SCANS_PER_ACCOUNT, len(self.images))
+        self.pending = []
+        self.image_order = self.rng.sample(range(len(self.images)), len(self.images))
+
+    def index(self):
+        self.request('index', 'GET', '/')
+
+    def scan(self):
+        if self.scans_left <= 0:
+            self.login()
+        name, data = self.images[self.image_order[self.scans_left - 1]]
+        self.scans_left -= 1
+        r = self.request('scan', 'POST', '/scan', expect=(202,), files={'file': (name, data, 'image/png')},
+                         headers={'Accept': 'application/json'})
+        if r is not None and r.status_code == 202:
+            self.pending.append(r.json()['job_id'])
+
+    def answer(self):
+        if not self.pending:
+            return self.scan()
+        job_id = self.pending.pop(0)
+        while not self.stop.is_set():
+            r = self.request('job_status', 'GET', f'/jobs/{job_id}')
+            if r is None or r.status_code != 200:
+                return
+            status = r.json()
+            if status['status'] == 'failed':
+                self.rec.outcome('scan', status.get('error', 'failed'))
+                return
+            if status['status'] == 'done':
+                break
+            time.sleep(0.1)
+        else:
+            return
+        self.rec.outcome('scan', 'done')
+        self.request('result', 'GET', f'/result/{job_id}')
+        self.request('answer', 'POST', '/submit_answer',
+                     json={'job_id': job_id, 'answer': self.rng.choice('ABCD')})
+
+    def run(self):
+        self.login()
+        while not self.stop.is_set():
+            getattr(self, self.rng.choices(self.ops, self.weights)[0])()
+
+
+# === 報告 ===
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarize(recorder, elapsed, rss_samples, args):
+    ops = {}
+    total = 0
+    for op, values in sorted(recorder.latencies.items()):
+        total += len(values)
+        ms = [v * 1000 for v in values]
+        ops[op] = {
+            'count': len(values),
+            'errors': recorder.errors.get(op, 0),
+            'rps': round(len(values) / elapsed, 2),
+            'p50_ms': round(_percentile(ms, 0.50), 2),
+            'p95_ms': round(_percentile(ms, 0.95), 2),
+            'p99_ms': round(_percentile(ms, 0.99), 2),
+            'max_ms': round(max(ms), 2),
+            'mean_ms': round(statistics.mean(ms), 2),
+        }
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'users': args.users, 'duration': args.duration, 'mix': args.mix,
+            'latency': args.latency, 'error_rate': args.error_rate, 'quota': args.quota,
+            'gunicorn_workers': args.gunicorn_workers, 'threads': args.threads,
+            'job_workers': args.job_workers, 'cpus': os.cpu_count(),
+        },
+        'elapsed_s': round(elapsed, 2),
+        'requests': total,
+        'errors': sum(recorder.errors.values()),
+        'throughput_rps': round(total / elapsed, 2),
+        'ops': ops,
+        'scan_outcomes': dict(recorder.outcomes.get('scan', {})),
+        'rss_mb': {
+            'start': round(rss_samples[0], 1),
+            'peak': round(max(rss_samples), 1),
+            'end': round(rss_samples[-1], 1),
+        },
+    }
+
+
+def print_summary(report, baseline=None):
+    """人看的摘要 (stderr)；有 baseline 時附上變化百分比"""
+    def delta(new, old):
+        if not old:
+            return ''
+        return f" ({(new - old) / old * 100:+.0f}%)"
+
+    base_ops = (baseline or {}).get('ops', {})
+    out = sys.stderr
+    print(f"\n{report['requests']} 個請求 / {report['elapsed_s']}s，"
+          f"{report['throughput_rps']} req/s{delta(report['throughput_rps'], (baseline or {}).get('throughput_rps'))}，"
+          f"錯誤 {report['errors']}", file=out)
+    print(f"{'請求':12s} {'次數':>7s} {'錯誤':>5s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}", file=out)
+    for op, s in report['ops'].items():
+        old = base_ops.get(op, {})
+        print(f"{op:12s} {s['count']:7d} {s['errors']:5d} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} "
+              f"{s['p99_ms']:9.1f}{delta(s['p95_ms'], old.get('p95_ms'))}", file=out)
+    rss = report['rss_mb']
+    print(f"掃描結果: {report['scan_outcomes']}", file=out)
+    print(f"RSS (gunicorn 全部行程): 開始 {rss['start']} MB，最高 {rss['peak']} MB"
+          f"{delta(rss['peak'], (baseline or {}).get('rss_mb', {}).get('peak'))}，結束 {rss['end']} MB", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=8, help="同時操作的虛擬使用者數")
+    parser.add_argument('--duration', type=float, default=30, help="測試秒數")
+    parser.add_argument('--mix', type=_parse_mix, default=_parse_mix(DEFAULT_MIX),
+                        help=f"各動作的比重 (預設 {DEFAULT_MIX})")
+    parser.add_argument('--latency', type=float, default=0.5, help="假模型每次呼叫的延遲 (秒)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="假模型回傳 500 的機率")
+    parser.add_argument('--quota', type=int, default=None, help="假模型每分鐘配額 (超過回 429)")
+    parser.add_argument('--gunicorn-workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help="每個 gunicorn worker 的執行緒數")
+    parser.add_argument('--job-workers', type=int, default=4, help="每個行程的背景 worker 執行緒數")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help="JSON 結果寫到這個檔案 (預設印到 stdout)")
+    parser.add_argument('--compare', default=None, help="跟之前存下的 JSON 比較")
+    args = parser.parse_args()
+
+    images = _sample_images()
+    server = Server(args)
+    rss_samples = []
+    try:
+        server.wait_ready()
+        recorder = Recorder()
+        stop = threading.Event()
+        users = [VirtualUser(server.url, args.mix, images, recorder, stop, random.Random(args.seed + i))
+                 for i in range(args.users)]
+        threads = [threading.Thread(target=user.run, daemon=True) for user in users]
+        print(f"gunicorn {args.gunicorn_workers} worker x {args.threads} 執行緒，虛擬使用者 {args.users} 個，"
+              f"{args.duration:.0f}s，範例圖片 {len(images)} 張，假模型延遲 {args.latency}s / 錯誤率 {args.error_rate}",
+              file=sys.stderr)
+        rss_samples.append(server.rss_mb())
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        while time.perf_counter() - start < args.duration:
+            time.sleep(0.5)
+            rss_samples.append(server.rss_mb())
+        stop.set()
+        for t in threads:
+            t.join(REQUEST_TIMEOUT)
+        elapsed = time.perf_counter() - start
+        rss_samples.append(server.rss_mb())
+    finally:
+        server.stop()
+
+    report = summarize(recorder, elapsed, rss_samples, args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_summary(report, baseline)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
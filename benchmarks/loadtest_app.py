@@ -0,0 +1,45 @@
+"""
+壓力測試用的 gunicorn 進入點：把 google.generativeai 換成假模型後載入 app.py
+
+    gunicorn -w 2 benchmarks.loadtest_app:app
+
+假模型的設定 (環境變數)：
+- FAKE_GEMINI_LATENCY：每次呼叫的延遲秒數 (預設 0.5)
+- FAKE_GEMINI_ERROR_RATE：隨機回傳 500 錯誤的機率 (預設 0)
+- FAKE_GEMINI_QUOTA：每分鐘配額，超過時丟出 429 (預設不限)
+"""
+
+import os
+import sys
+import types
+
+from benchmarks.fake_gemini import FakeGenerativeModel
+
+FAKE_GEMINI_LATENCY = float(os.environ.get("FAKE_GEMINI_LATENCY", "0.5"))
+FAKE_GEMINI_ERROR_RATE = float(os.environ.get("FAKE_GEMINI_ERROR_RATE", "0"))
+FAKE_GEMINI_QUOTA = int(os.environ.get("FAKE_GEMINI_QUOTA", "0")) or None
+
+
+def _install_fake_genai():
+    """在 app.py / QA.py import 之前放進 sys.modules，它們拿到的就是假模組"""
+    genai = types.ModuleType('google.generativeai')
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = lambda model_name='fake', **kwargs: FakeGenerativeModel(
+        model_name, latency=FAKE_GEMINI_LATENCY, error_rate=FAKE_GEMINI_ERROR_RATE,
+        quota_per_minute=FAKE_GEMINI_QUOTA)
+    try:
+        import google
+    except ImportError:
+        google = sys.modules['google'] = types.ModuleType('google')
+        google.__path__ = []
+    google.generativeai = genai
+    sys.modules['google.generativeai'] = genai
+
+
+_install_fake_genai()
+os.environ.setdefault('GEMINI_API_KEY', 'fake')
+
+from app import app
+
+# gunicorn 載入的就是這個 app
+__all__ = ['app']
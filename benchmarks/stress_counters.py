@@ -0,0 +1,85 @@
+"""
+計數器壓力測試：多個行程 × 多個執行緒同時幫同一個用戶加 XP，
+最後檢查總數一分不差
+
+- 直接模式：每次 incr 都寫進資料庫
+- 回寫模式：子行程累積在記憶體後直接 os._exit (模擬當掉、沒有寫回)，
+  由父行程重播日誌，總數也要正確
+
+用法:
+    python -m benchmarks.stress_counters
+    python -m benchmarks.stress_counters --processes 8 --threads 8 --increments 500
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from counters import CounterStore
+
+
+def _hammer(path, flush_interval, threads, increments, crash):
+    store = CounterStore(path, flush_interval=flush_interval)
+
+    def work():
+        for _ in range(increments):
+            store.incr('xp', 'hammer', 1)
+            store.incr('daily_upload', 'hammer:2026-01-01', 1)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    if crash:
+        os._exit(0)  # 不呼叫 atexit，也不寫回
+    store.flush()
+
+
+def run(mode, processes, threads, increments):
+    flush_interval = 0.0 if mode == 'direct' else 3600.0
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'counters.db')
+        CounterStore(path)  # 先建立資料表
+        ctx = multiprocessing.get_context('fork')
+        t0 = time.perf_counter()
+        procs = [
+            ctx.Process(target=_hammer,
+                        args=(path, flush_interval, threads, increments, mode == 'crash'))
+            for _ in range(processes)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - t0
+
+        # 重新開啟 (回寫模式會重播日誌)
+        store = CounterStore(path, flush_interval=flush_interval)
+        expected = processes * threads * increments
+        xp = store.get('xp', 'hammer')
+        daily = store.get('daily_upload', 'hammer:2026-01-01')
+        ok = xp == expected and daily == expected
+        ops = expected * 2 / elapsed
+        print(f"{mode:>7}: 預期 {expected}，XP {xp}，上傳 {daily}，"
+              f"{ops:,.0f} 次/秒 → {'通過' if ok else '失敗'}")
+        return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--increments', type=int, default=250)
+    args = parser.parse_args()
+
+    results = [run(mode, args.processes, args.threads, args.increments)
+               for mode in ('direct', 'buffer', 'crash')]
+    raise SystemExit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
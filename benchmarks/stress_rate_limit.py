@@ -0,0 +1,138 @@
+"""
+頻率限制壓力測試：多個行程 × 多個執行緒同時幫同一個用戶搶每日次數，
+最後檢查扣除 − 退還剛好等於資料庫裡的用量，而且沒有超過上限
+
+- single：每次扣 1 張 (/scan)，隨機退還一部分 (辨識失敗)，退還的次數要能再被搶走
+- batch：每次扣 1~5 張、不夠時扣剩下的 (/scan/batch)，再退還其中一部分
+- windows：同時有每日與每分鐘兩個視窗 (每分鐘的上限比較小)
+對照：原本 app.py 每個 worker 自己的 daily_usage，每個行程都以為自己還沒用完
+
+另外量測 remaining (讀本行程快取，不碰資料庫) 與 acquire 的時間。
+
+用法:
+    python -m benchmarks.stress_rate_limit
+    python -m benchmarks.stress_rate_limit --processes 8 --threads 8 --attempts 200 --limit 50
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from rate_limit import DAY, MINUTE, UPLOADS, RateLimiter
+
+
+def _limits(mode, limit):
+    if mode == 'windows':
+        return {UPLOADS: ((DAY, limit * 2), (MINUTE, limit))}
+    return {UPLOADS: ((DAY, limit),)}
+
+
+def _hammer(path, mode, limit, threads, attempts, results):
+    limiter = RateLimiter(path, _limits(mode, limit))
+    totals = []
+
+    def work(seed):
+        rng = random.Random(seed)
+        granted = refunded = 0
+        for _ in range(attempts):
+            amount = rng.randint(1, 5) if mode == 'batch' else 1
+            grant = limiter.acquire(UPLOADS, 'hammer', amount, partial=mode == 'batch')
+            if grant is None:
+                continue
+            granted += grant.amount
+            if rng.random() < 0.2:
+                back = rng.randint(1, grant.amount) if mode == 'batch' else None
+                if limiter.refund(UPLOADS, 'hammer', grant.id, back):
+                    refunded += grant.amount if back is None else back
+        totals.append((granted, refunded))
+
+    workers = [threading.Thread(target=work, args=(os.getpid() * 100 + i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    results.put((sum(g for g, _ in totals), sum(r for _, r in totals)))
+
+
+def run(mode, processes, threads, attempts, limit):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'rate_limits.db')
+        RateLimiter(path)  # 先建立資料表
+        ctx = multiprocessing.get_context('fork')
+        results = ctx.Queue()
+        t0 = time.perf_counter()
+        procs = [ctx.Process(target=_hammer, args=(path, mode, limit, threads, attempts, results))
+                 for _ in range(processes)]
+        for p in procs:
+            p.start()
+        totals = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - t0
+
+        limiter = RateLimiter(path, _limits(mode, limit), cache_ttl=0)
+        granted = sum(g for g, _ in totals)
+        refunded = sum(r for _, r in totals)
+        used = limiter.used(UPLOADS, 'hammer')
+        # 扣除與退還一筆都不能少算，也不能超過上限 (windows 模式是每分鐘的上限)；
+        # 最後幾次退還之後可能沒有人再搶，所以不一定剛好用滿
+        ok = granted - refunded == used <= limit
+        ops = processes * threads * attempts / elapsed
+        print(f"{mode:>8}: 上限 {limit}，扣除 {granted} − 退還 {refunded} = {granted - refunded}，"
+              f"資料庫 {used}，{ops:,.0f} 次/秒 → {'通過' if ok else '失敗'}")
+        return ok
+
+
+def per_worker_dict(processes, limit):
+    """原本的作法：每個 worker 自己記，同一個用戶輪流打到不同 worker"""
+    usage = [0] * processes
+    granted = 0
+    for i in range(processes * limit * 2):
+        worker = i % processes
+        if usage[worker] < limit:
+            usage[worker] += 1
+            granted += 1
+    print(f"{'對照':>6}: 每個 worker 各自的 daily_usage，{processes} 個 worker 讓同一個用戶掃了 {granted} 次"
+          f" (上限 {limit})")
+
+
+def latency(limit):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        limiter = RateLimiter(os.path.join(tmpdir, 'rate_limits.db'), _limits('single', limit))
+        cold = RateLimiter(limiter.path, _limits('single', limit), cache_ttl=0)
+        samples = []
+        for fn, args in ((limiter.remaining, (UPLOADS, 'u')),
+                         (cold.remaining, (UPLOADS, 'u')),
+                         (limiter.acquire, (UPLOADS, 'u'))):
+            times = []
+            for _ in range(min(limit, 500)):
+                t = time.perf_counter()
+                fn(*args)
+                times.append((time.perf_counter() - t) * 1e6)
+            samples.append(statistics.median(times))
+        print(f"remaining (快取) {samples[0]:.1f} µs，remaining (讀資料庫) {samples[1]:.1f} µs，"
+              f"acquire {samples[2]:.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--attempts', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    results = [run(mode, args.processes, args.threads, args.attempts, args.limit)
+               for mode in ('single', 'batch', 'windows')]
+    per_worker_dict(args.processes, args.limit)
+    latency(args.limit * 10)
+    raise SystemExit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""
+計數器子系統 - XP、每日上傳次數等「只會加減」的數值
+
+取代 users/<帳號>/xp.txt 與 daily_uploads.json 的「讀出來 → 加一 → 寫回去」，
+多個請求同時進來時不會再少算。
+
+兩種模式：
+- 直接模式 (預設)：每次 incr 都是一條原子的 SQL upsert，返回的是全域最新值
+- 回寫模式 (flush_interval > 0)：incr 先寫入本行程的日誌檔並累積在記憶體，
+  背景執行緒定期一次寫回資料庫。行程當掉時，下次啟動會把日誌重播回資料庫，
+  所以不會遺失任何一筆增加。
+"""
+
+import os
+import json
+import glob
+import time
+import uuid
+import atexit
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import db
+
+DEFAULT_DB_NAME = 'counters.db'
+
+# 回寫模式的寫回間隔 (秒)，0 表示直接寫入資料庫
+FLUSH_INTERVAL = float(os.environ.get("COUNTER_FLUSH_INTERVAL", "0"))
+# 日誌每筆都 fsync，連整台機器斷電也不會掉資料 (比較慢)
+JOURNAL_FSYNC = os.environ.get("COUNTER_JOURNAL_FSYNC") == "1"
+
+# SQLite 單一查詢可用的參數上限 (保守值)
+_MAX_PARAMS = 900
+
+CounterKey = Tuple[str, str]  # (scope, key)
+
+# 每次修改都把 seq 設成目前最大值 + 1 (寫入時持有資料庫的寫入鎖，所以順序就是提交順序)，
+# 其他行程用 changed_since() 只讀取新修改的計數器 (leaderboard.py)
+_UPSERT = (
+    'INSERT INTO counters (scope, key, value, seq) '
+    'VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM counters)) '
+    'ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value, seq = excluded.seq '
+    'RETURNING value'
+)
+
+
+class CounterStore:
+    """以 SQLite 為底的原子計數器"""
+
+    def __init__(self, path: str, flush_interval: float = 0.0,
+                 journal_dir: Optional[str] = None, fsync: bool = False):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.journal_dir = journal_dir or os.path.dirname(os.path.abspath(path))
+        self.fsync = fsync
+
+        # 讀取快取：{(scope, key): 資料庫中的值}，讀取時不加鎖
+        self._cache: Dict[CounterKey, int] = {}
+        # 尚未寫回資料庫的增量 (只有回寫模式會用到)
+        self._pending: Dict[CounterKey, int] = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._journal_fd = None
+        self._journal_id = None
+        self._seq = 0
+        self._flusher = None
+
+        with db.transaction(self._conn()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS counters ('
+                ' scope TEXT NOT NULL,'
+                ' key TEXT NOT NULL,'
+                ' value INTEGER NOT NULL,'
+                ' seq INTEGER NOT NULL DEFAULT 0,'
+                ' PRIMARY KEY (scope, key)'
+                ') WITHOUT ROWID'
+            )
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(counters)')]
+            if 'seq' not in columns:
+                # 舊版資料庫沒有 seq 欄位
+                conn.execute('ALTER TABLE counters ADD COLUMN seq INTEGER NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS counters_seq ON counters (seq)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS counter_journals ('
+                ' journal_id TEXT PRIMARY KEY,'
+                ' applied_seq INTEGER NOT NULL'
+                ')'
+            )
+        if flush_interval > 0:
+            self.recover()
+
+    def _conn(self):
+        return db.get_connection(self.path)
+
+    # === 讀取 ===
+
+    def get(self, scope: str, key: str) -> int:
+        """讀取單一計數器 (不存在為 0)"""
+        return self.get_many(scope, [key])[key]
+
+    def get_many(self, scope: str, keys: Iterable[str]) -> Dict[str, int]:
+        """一次讀取多個計數器，給排行榜之類的批次查詢使用"""
+        keys = list(dict.fromkeys(keys))
+        values = {k: 0 for k in keys}
+        conn = self._conn()
+        for i in range(0, len(keys), _MAX_PARAMS):
+            chunk = keys[i:i + _MAX_PARAMS]
+            marks = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f'SELECT key, value FROM counters WHERE scope = ? AND key IN ({marks})',
+                [scope] + chunk
+            )
+            for k, v in rows:
+                values[k] = v
+                self._cache[(scope, k)] = v
+        if self._pending:
+            for k in keys:
+                values[k] += self._pending.get((scope, k), 0)
+        return values
+
+    def scan(self, scope: str) -> Tuple[List[Tuple[str, int]], int]:
+        """
+        讀出某個 scope 的所有計數器 (啟動時重建排行榜)
+        返回: ([(key, value), ...], 目前最大的 seq)
+        """
+        conn = self._conn()
+        conn.execute('BEGIN')  # 同一個快照裡讀 seq 與資料
+        try:
+            seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM counters').fetchone()[0]
+            rows = conn.execute('SELECT key, value FROM counters WHERE scope = ?', (scope,)).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        return rows, seq
+
+    def changed_since(self, scope: str, seq: int) -> Tuple[List[Tuple[str, int]], int]:
+        """
+        seq 之後修改過的計數器
+        返回: ([(key, value), ...], 讀到的最大 seq)
+        """
+        rows = self._conn().execute(
+            'SELECT scope, key, value, seq FROM counters WHERE seq > ? ORDER BY seq', (seq,)
+        ).fetchall()
+        if rows:
+            seq = rows[-1][3]
+        return [(k, v) for s, k, v, _ in rows if s == scope], seq
+
+    def exists(self, scope: str, key: str) -> bool:
+        """計數器是否已經建立過"""
+        return self._conn().execute(
+            'SELECT 1 FROM counters WHERE scope = ? AND key = ?', (scope, key)
+        ).fetchone() is not None
+
+    # === 寫入 ===
+
+    def seed(self, scope: str, key: str, value: int) -> bool:
+        """計數器不存在時設定初始值 (用來匯入舊資料)，返回是否有寫入"""
+        cur = self._conn().execute(
+            'INSERT OR IGNORE INTO counters (scope, key, value, seq) '
+            'VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM counters))',
+            (scope, key, value)
+        )
+        return cur.rowcount == 1
+
+    def incr(self, scope: str, key: str, delta: int = 1) -> int:
+        """原子地增加計數器，返回增加後的值"""
+        if self.flush_interval > 0:
+            return self._incr_buffered(scope, key, delta)
+        row = self._conn().execute(_UPSERT, (scope, key, delta)).fetchone()
+        self._cache[(scope, key)] = row[0]
+        return row[0]
+
+    def incr_many(self, updates: Iterable[Tuple[str, str, int]]) -> Dict[CounterKey, int]:
+        """
+        在同一個交易裡增加多個計數器 (全部成功或全部不生效)
+        updates: [(scope, key, delta), ...]
+        返回: {(scope, key): 增加後的值}
+        """
+        results = {}
+        with db.transaction(self._conn()) as conn:
+            for scope, key, delta in updates:
+                row = conn.execute(_UPSERT, (scope, key, delta)).fetchone()
+                results[(scope, key)] = row[0]
+        self._cache.update(results)
+        return results
+
+    # === 回寫模式 ===
+
+    def _incr_buffered(self, scope, key, delta):
+        ck = (scope, key)
+        if ck not in self._cache:
+            self.get_many(scope, [key])
+        with self._lock:
+            self._ensure_journal()
+            self._seq += 1
+            record = json.dumps([self._seq, scope, key, delta], ensure_ascii=False) + '\n'
+            # O_APPEND 的單次 write，先寫日誌再更新記憶體
+            os.write(self._journal_fd, record.encode('utf-8'))
+            if self.fsync:
+                os.fsync(self._journal_fd)
+            self._pending[ck] = self._pending.get(ck, 0) + delta
+            return self._cache.get(ck, 0) + self._pending[ck]
+
+    def _ensure_journal(self):
+        """每個行程一個日誌檔 (fork 之後重開)，持有 flock 代表擁有者還活著"""
+        if self._pid == os.getpid() and self._journal_fd is not None:
+            return
+        # fork 來的子行程不能沿用父行程的日誌與尚未寫回的增量
+        self._pending = {}
+        self._pid = os.getpid()
+        self._journal_id = uuid.uuid4().hex
+        self._seq = 0
+        import fcntl  # 只有回寫模式需要 (僅 Linux/macOS)
+        path = self._journal_path(self._journal_id)
+        self._journal_fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        fcntl.flock(self._journal_fd, fcntl.LOCK_EX)
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _journal_path(self, journal_id):
+        name = os.path.basename(self.path)
+        return os.path.join(self.journal_dir, f'{name}.{journal_id}.journal')
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"計數器寫回失敗，稍後重試: {e}")
+
+    def flush(self):
+        """把本行程累積的增量寫回資料庫"""
+        with self._lock:
+            if not self._pending or self._pid != os.getpid():
+                return
+            pending, self._pending = self._pending, {}
+            seq = self._seq
+            try:
+                with db.transaction(self._conn()) as conn:
+                    self._apply(conn, pending)
+                    conn.execute(
+                        'INSERT INTO counter_journals (journal_id, applied_seq) VALUES (?, ?) '
+                        'ON CONFLICT (journal_id) DO UPDATE SET applied_seq = excluded.applied_seq',
+                        (self._journal_id, seq)
+                    )
+            except Exception:
+                # 寫回失敗就放回去，下次一起寫
+                for ck, delta in pending.items():
+                    self._pending[ck] = self._pending.get(ck, 0) + delta
+                raise
+            # 已經寫回的部分可以從日誌移除
+            os.ftruncate(self._journal_fd, 0)
+
+    def _apply(self, conn, deltas: Dict[CounterKey, int]):
+        for (scope, key), delta in deltas.items():
+            row = conn.execute(_UPSERT, (scope, key, delta)).fetchone()
+            self._cache[(scope, key)] = row[0]
+
+    def recover(self) -> int:
+        """
+        重播已經結束 (或當掉) 的行程留下的日誌
+        返回: 重播的筆數
+        """
+        import fcntl
+        replayed = 0
+        pattern = self._journal_path('*')
+        for path in glob.glob(pattern):
+            journal_id = path.rsplit('.', 2)[-2]
+            if journal_id == self._journal_id:
+                continue
+            fd = os.open(path, os.O_RDWR)
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # 擁有者還活著
+                replayed += self._replay(fd, journal_id)
+                os.unlink(path)
+            finally:
+                os.close(fd)
+        return replayed
+
+    def _replay(self, fd, journal_id) -> int:
+        with os.fdopen(os.dup(fd), 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        with db.transaction(self._conn()) as conn:
+            row = conn.execute(
+                'SELECT applied_seq FROM counter_journals WHERE journal_id = ?', (journal_id,)
+            ).fetchone()
+            applied = row[0] if row else 0
+            deltas: Dict[CounterKey, int] = {}
+            count = 0
+            for line in lines:
+                try:
+                    seq, scope, key, delta = json.loads(line)
+                except ValueError:
+                    continue  # 當掉時寫到一半的最後一行
+                if seq <= applied:
+                    continue
+                deltas[(scope, key)] = deltas.get((scope, key), 0) + delta
+                count += 1
+            self._apply(conn, deltas)
+            conn.execute('DELETE FROM counter_journals WHERE journal_id = ?', (journal_id,))
+        return count
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_counter_store() -> CounterStore:
+    """取得全域共用的計數器 (第一次呼叫時建立)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CounterStore(db.db_path(DEFAULT_DB_NAME),
+                                      flush_interval=FLUSH_INTERVAL,
+                                      fsync=JOURNAL_FSYNC)
+    return _store
+
+
+def get_counters(usernames: Iterable[str], scope: str = 'xp') -> Dict[str, int]:
+    """批次讀取多位用戶的計數器 (預設為 XP)，給排行榜使用"""
+    return get_counter_store().get_many(scope, usernames)
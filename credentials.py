@@ -0,0 +1,236 @@
+"""
+密碼雜湊 - 加鹽、有版本的 KDF，舊的 sha256 在登入時自動升級
+
+儲存格式 (salt 與 hash 為不含 = 的 base64)：
+    scrypt$n=16384,r=8,p=1$<salt>$<hash>        預設
+    pbkdf2_sha256$i=600000$<salt>$<hash>
+    64 個十六進位字元                            舊版：沒有加鹽的 sha256
+
+參數寫在雜湊裡，調高成本之後舊的雜湊照樣能驗證，
+needs_rehash() 為 True 的帳號在下次登入成功時換成新參數 (auth.login_user)。
+
+- KDF 很吃 CPU (scrypt 一次約 50ms)，預設在呼叫的執行緒計算
+  (hashlib 計算時會釋放 GIL，同一個行程的其他請求照常執行)；
+  CREDENTIAL_WORKERS 設成正數時改交給 spawn 行程池 (每個 gunicorn worker 各一個池，
+  import auth 的程式要有 if __name__ == '__main__' 保護)
+- 驗證成功的結果在記憶體快取 CREDENTIAL_CACHE_TTL 秒，同一組帳密重複登入不用再算；
+  快取的 key 是用每個行程隨機金鑰做的 HMAC，記憶體裡不會留下密碼
+"""
+
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+# 新密碼使用的演算法：scrypt 或 pbkdf2_sha256
+PASSWORD_SCHEME = os.environ.get("PASSWORD_SCHEME", "scrypt")
+PASSWORD_SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.environ.get("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.environ.get("PASSWORD_SCRYPT_P", "1"))
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get("PASSWORD_PBKDF2_ITERATIONS", "600000"))
+# 計算 KDF 的行程數 (0 = 在呼叫的執行緒計算)
+CREDENTIAL_WORKERS = int(os.environ.get("CREDENTIAL_WORKERS", "0"))
+# 驗證成功的快取：保存秒數與最多筆數
+CREDENTIAL_CACHE_TTL = float(os.environ.get("CREDENTIAL_CACHE_TTL", "300"))
+CREDENTIAL_CACHE_ENTRIES = int(os.environ.get("CREDENTIAL_CACHE_ENTRIES", "10000"))
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+SCHEMES = ('scrypt', 'pbkdf2_sha256')
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _format_params(params: Dict[str, int]) -> str:
+    return ','.join(f'{k}={v}' for k, v in params.items())
+
+
+def default_params(scheme: str) -> Dict[str, int]:
+    """目前設定的 KDF 參數"""
+    if scheme == 'scrypt':
+        return {'n': PASSWORD_SCRYPT_N, 'r': PASSWORD_SCRYPT_R, 'p': PASSWORD_SCRYPT_P}
+    if scheme == 'pbkdf2_sha256':
+        return {'i': PASSWORD_PBKDF2_ITERATIONS}
+    raise ValueError(f"不支援的密碼雜湊演算法: {scheme}")
+
+
+def derive(scheme: str, params: Dict[str, int], password: str, salt: bytes) -> bytes:
+    """計算 KDF (行程池裡執行的就是這個函式)"""
+    secret = password.encode('utf-8')
+    if scheme == 'scrypt':
+        n, r, p = params['n'], params['r'], params['p']
+        return hashlib.scrypt(secret, salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + (1 << 20), dklen=KEY_BYTES)
+    if scheme == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', secret, salt, params['i'], dklen=KEY_BYTES)
+    raise ValueError(f"不支援的密碼雜湊演算法: {scheme}")
+
+
+def parse_hash(stored: str) -> Optional[Tuple[str, Dict[str, int], bytes, bytes]]:
+    """
+    拆開儲存的雜湊
+    返回: (演算法, 參數, salt, hash)，舊版 sha256 返回 None
+    格式不對時丟出 ValueError
+    """
+    if '$' not in stored:
+        if len(stored) == 64:
+            return None
+        raise ValueError("無法辨識的密碼雜湊格式")
+    scheme, params_text, salt, key = stored.split('$')
+    if scheme not in SCHEMES:
+        raise ValueError(f"不支援的密碼雜湊演算法: {scheme}")
+    params = {k: int(v) for k, v in (item.split('=') for item in params_text.split(','))}
+    # 少了參數的話 derive 會丟 KeyError，在這裡就當成格式不對
+    if set(params) != set(default_params(scheme)):
+        raise ValueError(f"{scheme} 的參數不對: {params_text}")
+    return scheme, params, _b64decode(salt), _b64decode(key)
+
+
+def legacy_hash(password: str) -> str:
+    """舊版格式：沒有加鹽的 sha256 (只用來驗證還沒升級的帳號)"""
+    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+
+class PasswordHasher:
+    """產生與驗證密碼雜湊 (workers > 0 時 KDF 在行程池計算，驗證成功的結果快取)"""
+
+    def __init__(self, scheme: str = PASSWORD_SCHEME, params: Optional[Dict[str, int]] = None,
+                 workers: int = CREDENTIAL_WORKERS, cache_ttl: float = CREDENTIAL_CACHE_TTL,
+                 cache_entries: int = CREDENTIAL_CACHE_ENTRIES):
+        self.scheme = scheme
+        self.params = dict(params or default_params(scheme))
+        self.workers = workers
+        self.cache_ttl = cache_ttl
+        self.cache_entries = cache_entries
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._cache: 'OrderedDict[bytes, float]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_secret = secrets.token_bytes(32)
+        self.stats = {'hashed': 0, 'verified': 0, 'cache_hits': 0, 'failed': 0}
+
+    # === 計算 KDF ===
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # fork 出來的子行程 (gunicorn worker) 不能沿用父行程的行程池
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    # spawn：子行程只載入這個模組，不會複製 web 行程的執行緒與連線
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _derive(self, scheme: str, params: Dict[str, int], password: str, salt: bytes) -> bytes:
+        if self.workers <= 0:
+            return derive(scheme, params, password, salt)
+        pool = self._get_pool()
+        try:
+            return pool.submit(derive, scheme, params, password, salt).result()
+        except BrokenProcessPool:
+            # 子行程被系統砍掉 (例如記憶體不足)：下次重建，這次直接算
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None
+            return derive(scheme, params, password, salt)
+
+    def hash(self, password: str) -> str:
+        """用目前的演算法與參數產生新的雜湊"""
+        salt = secrets.token_bytes(SALT_BYTES)
+        key = self._derive(self.scheme, self.params, password, salt)
+        self.stats['hashed'] += 1
+        return f'{self.scheme}${_format_params(self.params)}${_b64encode(salt)}${_b64encode(key)}'
+
+    def verify(self, password: str, stored: Optional[str]) -> bool:
+        """
+        檢查密碼是否正確
+        stored 為 None (帳號不存在) 時照樣計算一次 KDF 再返回 False，
+        讓回應時間看不出帳號是否存在
+        """
+        if stored is None:
+            self._derive(self.scheme, self.params, password, b'\0' * SALT_BYTES)
+            self.stats['failed'] += 1
+            return False
+        try:
+            parsed = parse_hash(stored)
+        except ValueError:
+            self.stats['failed'] += 1
+            return False
+        if parsed is None:
+            ok = hmac.compare_digest(legacy_hash(password), stored)
+        else:
+            cache_key = hmac.new(self._cache_secret, f'{stored}\0{password}'.encode('utf-8'), 'sha256').digest()
+            if self._cached(cache_key):
+                self.stats['cache_hits'] += 1
+                return True
+            scheme, params, salt, key = parsed
+            ok = hmac.compare_digest(self._derive(scheme, params, password, salt), key)
+            if ok:
+                self._remember(cache_key)
+        self.stats['verified' if ok else 'failed'] += 1
+        return ok
+
+    def needs_rehash(self, stored: str) -> bool:
+        """舊版 sha256，或演算法 / 參數跟目前設定不同"""
+        try:
+            parsed = parse_hash(stored)
+        except ValueError:
+            return False
+        return parsed is None or parsed[0] != self.scheme or parsed[1] != self.params
+
+    # === 驗證成功的快取 ===
+
+    def _cached(self, cache_key: bytes) -> bool:
+        with self._cache_lock:
+            expires_at = self._cache.get(cache_key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._cache[cache_key]
+                return False
+            self._cache.move_to_end(cache_key)
+            return True
+
+    def _remember(self, cache_key: bytes):
+        if self.cache_ttl <= 0:
+            return
+        with self._cache_lock:
+            self._cache[cache_key] = time.monotonic() + self.cache_ttl
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher() -> PasswordHasher:
+    """取得全域共用的密碼雜湊器 (第一次呼叫時建立)"""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher()
+    return _hasher
@@ -1,14 +1,20 @@
+"""
+只保留 static/cat.png 的上半部 (貓的頭和尾巴，去掉杯子)，存成 static/cat_only.png
+等同於：python asset_tools.py crop static/cat.png --bottom 0.5 -o static/cat_only.png
+"""
+
+import os
+
 from PIL import Image
 
-# Open the cat image
-img = Image.open('static/cat.png')
-print('Original size:', img.size)
+from asset_tools import crop_fraction, save_image
 
-# Crop only the top portion (cat head and tail, remove the cup)
-# Keep top 50% of the image
-cropped = img.crop((0, 0, img.width, int(img.height * 0.50)))
-print('Cropped size:', cropped.size)
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
-# Save the cropped image
-cropped.save('static/cat_only.png')
-print('Saved to static/cat_only.png')
+if __name__ == '__main__':
+    with Image.open(os.path.join(BASE_DIR, 'static', 'cat.png')) as img:
+        print('Original size:', img.size)
+        cropped = crop_fraction(img, bottom=0.50)
+    print('Cropped size:', cropped.size)
+    save_image(cropped, os.path.join(BASE_DIR, 'static', 'cat_only.png'))
+    print('Saved to static/cat_only.png')
@@ -0,0 +1,72 @@
+"""
+共用的 SQLite 連線工具 - 給帳號、計數器等子系統共用
+"""
+
+import os
+import sqlite3
+import threading
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+# 所有 SQLite 資料庫預設放在 data/ 之下，可用環境變數改位置
+DATA_DIR = os.environ.get("REBORN_DATA_DIR", os.path.join(BASE_DIR, 'data'))
+
+# 多個 gunicorn worker 同時寫入時，最多等待鎖的秒數
+BUSY_TIMEOUT = 30.0
+
+_local = threading.local()
+
+
+def db_path(name: str) -> str:
+    """取得 data/ 目錄下資料庫檔案的完整路徑"""
+    if os.path.isabs(name):
+        return name
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    開啟一個新的 SQLite 連線
+    使用 WAL 模式：讀取不會被寫入擋住，多個 worker 可以同時讀
+    """
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                           check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def get_connection(path: str) -> sqlite3.Connection:
+    """
+    取得目前執行緒專用的連線 (每個執行緒、每個檔案一條)
+    fork 之後會自動重新連線，避免子行程共用父行程的連線
+    """
+    conns = getattr(_local, 'conns', None)
+    if conns is None or getattr(_local, 'pid', None) != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = connect(path)
+    return conn
+
+
+class transaction:
+    """
+    寫入交易：BEGIN IMMEDIATE 一開始就拿到寫入鎖，
+    讀取-修改-寫入 在多個行程之間也是原子的
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
@@ -0,0 +1,208 @@
+"""
+重複圖片索引 - 所有 gunicorn worker 共用、重新啟動也不會消失
+
+- SQLite 資料表以 (username, sha256) 為主鍵，查詢是 O(1) 的索引查找
+- 前面擋一層 Bloom filter：放在 mmap 共用檔案裡，每個位元用一個 byte，
+  不同行程同時設定也不會互相蓋掉。Bloom filter 說「沒有」就一定沒有，
+  大部分的新照片完全不需要查資料庫。
+- 全域模式 (DEDUP_SCOPE=global)：同一張照片換一個帳號上傳也算重複
+"""
+
+import os
+import mmap
+import hashlib
+import threading
+from datetime import datetime
+from typing import Iterable, Optional
+
+import db
+
+DEFAULT_DB_NAME = 'dedup.db'
+DEFAULT_BLOOM_NAME = 'dedup.bloom'
+
+# Bloom filter 大小 (byte 數 = 位元數)，預設 16MB，約可容納 100 萬張照片
+BLOOM_BYTES = int(os.environ.get("DEDUP_BLOOM_BYTES", str(1 << 24)))
+BLOOM_HASHES = 7
+# user: 每個帳號各自判斷；global: 跨帳號也算重複
+DEDUP_SCOPE = os.environ.get("DEDUP_SCOPE", "user")
+
+_BLOOM_MAGIC = b'RBBLOOM1'
+_HEADER_SIZE = 64
+
+
+class BloomFilter:
+    """
+    存在 mmap 檔案裡的 Bloom filter，多個行程共用
+    每個位元佔一個 byte，寫入只是把 byte 設成 1，不需要加鎖
+    """
+
+    def __init__(self, path: str, size: int = BLOOM_BYTES, hashes: int = BLOOM_HASHES,
+                 populate=None):
+        import fcntl  # 需要 Linux/macOS
+        self.path = path
+        self.hashes = hashes
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # 只有一個行程負責建立與填入舊資料，其他行程等它完成
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, _HEADER_SIZE, 0)
+                if header[:8] != _BLOOM_MAGIC:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, _HEADER_SIZE + size)
+                    self._map = mmap.mmap(fd, _HEADER_SIZE + size)
+                    self.size = size
+                    if populate is not None:
+                        for key in populate():
+                            self.add(key)
+                    self._map[:16] = _BLOOM_MAGIC + size.to_bytes(8, 'little')
+                    self._map.flush()
+                else:
+                    self.size = int.from_bytes(header[8:16], 'little')
+                    self._map = mmap.mmap(fd, _HEADER_SIZE + self.size)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _positions(self, key: bytes):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield _HEADER_SIZE + (h1 + i * h2) % self.size
+
+    def add(self, key: bytes):
+        m = self._map
+        for pos in self._positions(key):
+            m[pos] = 1
+
+    def __contains__(self, key: bytes) -> bool:
+        m = self._map
+        return all(m[pos] for pos in self._positions(key))
+
+
+def _user_key(username: str, img_hash: str) -> bytes:
+    return f"{username}\0{img_hash}".encode('utf-8')
+
+
+def _global_key(img_hash: str) -> bytes:
+    return f"\0{img_hash}".encode('utf-8')
+
+
+class DedupIndex:
+    """以 (帳號, 圖片 sha256) 為鍵的重複圖片索引"""
+
+    def __init__(self, path: str, bloom_path: Optional[str] = None,
+                 global_scope: bool = False, bloom_bytes: int = BLOOM_BYTES):
+        self.path = path
+        self.global_scope = global_scope
+        with db.transaction(self._conn()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS image_hashes ('
+                ' username TEXT NOT NULL,'
+                ' sha256 TEXT NOT NULL,'
+                ' created_at TEXT NOT NULL,'
+                ' PRIMARY KEY (username, sha256)'
+                ') WITHOUT ROWID'
+            )
+            # 全域模式用：不分帳號查詢同一張照片
+            conn.execute('CREATE INDEX IF NOT EXISTS image_hashes_sha256 ON image_hashes (sha256)')
+
+        self.bloom = None
+        if bloom_path is not None:
+            try:
+                self.bloom = BloomFilter(bloom_path, size=bloom_bytes, populate=self._all_keys)
+            except ImportError:
+                pass  # 沒有 fcntl (Windows) 就直接查資料庫
+
+    def _conn(self):
+        return db.get_connection(self.path)
+
+    def _all_keys(self):
+        for username, img_hash in self._conn().execute('SELECT username, sha256 FROM image_hashes'):
+            yield _user_key(username, img_hash)
+            yield _global_key(img_hash)
+
+    def contains(self, username: str, img_hash: str) -> bool:
+        """這張照片是否已經上傳過 (全域模式下不分帳號)"""
+        if self.global_scope:
+            if self.bloom is not None and _global_key(img_hash) not in self.bloom:
+                return False
+            return self._conn().execute(
+                'SELECT 1 FROM image_hashes WHERE sha256 = ? LIMIT 1', (img_hash,)
+            ).fetchone() is not None
+
+        if self.bloom is not None and _user_key(username, img_hash) not in self.bloom:
+            return False
+        return self._conn().execute(
+            'SELECT 1 FROM image_hashes WHERE username = ? AND sha256 = ?', (username, img_hash)
+        ).fetchone() is not None
+
+    def add(self, username: str, img_hash: str) -> bool:
+        """記錄一張照片，返回是否為該帳號的新照片"""
+        return self.add_many(username, [img_hash]) == 1
+
+    def add_many(self, username: str, img_hashes: Iterable[str]) -> int:
+        """一次記錄多張照片，返回新增的數量"""
+        img_hashes = list(img_hashes)
+        # 先設定 Bloom filter 再寫入資料庫：
+        # 就算寫到一半當掉，也只會多一個假陽性，不會漏掉重複
+        if self.bloom is not None:
+            for img_hash in img_hashes:
+                self.bloom.add(_user_key(username, img_hash))
+                self.bloom.add(_global_key(img_hash))
+        now = datetime.now().isoformat()
+        with db.transaction(self._conn()) as conn:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO image_hashes (username, sha256, created_at) VALUES (?, ?, ?)',
+                [(username, h, now) for h in img_hashes]
+            )
+            return conn.total_changes - before
+
+    def check_and_add(self, username: str, img_hash: str) -> bool:
+        """
+        原子地檢查並記錄 (兩個 worker 同時收到同一張照片，只有一個會通過)
+        收件時用來預留照片，處理失敗時再用 remove() 放掉
+        返回: True 表示重複 (這時不會記錄)
+        """
+        if self.bloom is not None:
+            self.bloom.add(_user_key(username, img_hash))
+            self.bloom.add(_global_key(img_hash))
+        with db.transaction(self._conn()) as conn:
+            if self.global_scope and conn.execute(
+                    'SELECT 1 FROM image_hashes WHERE sha256 = ? LIMIT 1', (img_hash,)
+            ).fetchone() is not None:
+                return True
+            cur = conn.execute(
+                'INSERT OR IGNORE INTO image_hashes (username, sha256, created_at) VALUES (?, ?, ?)',
+                (username, img_hash, datetime.now().isoformat())
+            )
+            return cur.rowcount == 0
+
+    def remove(self, username: str, img_hash: str) -> bool:
+        """
+        刪除一張照片的紀錄 (預留的照片沒有處理成功時)，返回是否有刪除
+        Bloom filter 的位元不會清掉，之後查詢只是多查一次資料庫
+        """
+        cur = self._conn().execute(
+            'DELETE FROM image_hashes WHERE username = ? AND sha256 = ?', (username, img_hash)
+        )
+        return cur.rowcount == 1
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_dedup_index() -> DedupIndex:
+    """取得全域共用的重複圖片索引 (第一次呼叫時建立)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = DedupIndex(db.db_path(DEFAULT_DB_NAME),
+                                    bloom_path=db.db_path(DEFAULT_BLOOM_NAME),
+                                    global_scope=(DEDUP_SCOPE == 'global'))
+    return _index
@@ -0,0 +1,116 @@
+"""
+送給 Gemini 之前的圖片前處理 - 縮小、轉正、重新壓縮
+
+辨識回收物只需要約 768px 的圖，原本卻把手機拍的幾千萬像素原圖整張傳出去。
+這裡依序做：
+1. 開啟：只讀檔頭
+2. 縮小解碼：JPEG 用 draft() 讓解碼器直接輸出 1/2、1/4、1/8 大小
+3. 解碼 + 依照 EXIF 方向轉正
+4. 縮小到最長邊 MODEL_MAX_EDGE (先用 reduce 整數倍縮小，再精細縮放)
+5. 重新壓縮成 JPEG 或 WebP
+每個步驟的時間與前後大小記錄在 stats 裡。
+"""
+
+import io
+import os
+import time
+from typing import Any, Dict
+
+from PIL import Image, ImageOps
+
+# 送給模型的圖片最長邊 (像素)
+MODEL_MAX_EDGE = int(os.environ.get("MODEL_IMAGE_MAX_EDGE", "768"))
+# JPEG 或 WEBP
+MODEL_IMAGE_FORMAT = os.environ.get("MODEL_IMAGE_FORMAT", "JPEG").upper()
+MODEL_IMAGE_QUALITY = int(os.environ.get("MODEL_IMAGE_QUALITY", "85"))
+
+_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+
+class PreparedImage:
+    """前處理完成、可以直接送給模型的圖片"""
+
+    def __init__(self, data: bytes, mime_type: str, size, stats: Dict[str, Any]):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.stats = stats
+
+    def as_part(self) -> Dict[str, Any]:
+        """generate_content 可以直接使用的圖片格式"""
+        return {'mime_type': self.mime_type, 'data': self.data}
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.stats['bytes_in'] - self.stats['bytes_out']
+
+
+def _source_size(source) -> int:
+    """原始檔案的大小 (路徑或已開啟的檔案)"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    try:
+        pos = source.tell()
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(pos)
+        return size
+    except (AttributeError, OSError):
+        return 0
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """透明背景補成白色，其他模式轉成 RGB"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def prepare_for_model(source, max_edge: int = MODEL_MAX_EDGE,
+                      fmt: str = MODEL_IMAGE_FORMAT,
+                      quality: int = MODEL_IMAGE_QUALITY) -> PreparedImage:
+    """
+    把圖片 (路徑或已開啟的檔案) 處理成適合送給模型的大小與格式
+    """
+    stats: Dict[str, Any] = {'bytes_in': _source_size(source)}
+
+    t = time.perf_counter()
+    img = Image.open(source)
+    stats['format_in'] = img.format
+    stats['size_in'] = img.size
+    stats['open_ms'] = (time.perf_counter() - t) * 1000
+
+    # 縮小解碼：只有 JPEG 支援，其他格式 draft() 不會有作用
+    t = time.perf_counter()
+    img.draft('RGB', (max_edge, max_edge))
+    img.load()
+    stats['decode_ms'] = (time.perf_counter() - t) * 1000
+    stats['size_decoded'] = img.size
+
+    t = time.perf_counter()
+    img = ImageOps.exif_transpose(img)
+    img = _flatten(img)
+    # reducing_gap：先用 reduce() 整數倍快速縮小，再縮放到目標大小
+    # (辨識用途 BICUBIC 就夠了，比 LANCZOS 快三成)
+    img.thumbnail((max_edge, max_edge), Image.Resampling.BICUBIC, reducing_gap=2.0)
+    stats['resize_ms'] = (time.perf_counter() - t) * 1000
+
+    t = time.perf_counter()
+    buf = io.BytesIO()
+    if fmt == 'WEBP':
+        img.save(buf, 'WEBP', quality=quality, method=4)
+    else:
+        fmt = 'JPEG'
+        img.save(buf, 'JPEG', quality=quality, optimize=True)
+    data = buf.getvalue()
+    stats['encode_ms'] = (time.perf_counter() - t) * 1000
+
+    stats['bytes_out'] = len(data)
+    stats['size_out'] = img.size
+    stats['total_ms'] = stats['open_ms'] + stats['decode_ms'] + stats['resize_ms'] + stats['encode_ms']
+    return PreparedImage(data, _MIME_TYPES[fmt], img.size, stats)
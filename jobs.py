@@ -0,0 +1,305 @@
+"""
+工作佇列 - 把辨識、出題這種要等 AI 的工作從請求裡拿出來，交給背景 worker
+
+- 佇列存在 SQLite (data/jobs.db)，不需要 Redis 之類的外部服務，
+  所有 gunicorn worker 共用，重新啟動也不會遺失
+- 每個工作分成好幾個階段 (stage)，一個階段做完就回到佇列等下一個階段，
+  不同工作的不同階段可以同時進行 (流水線)
+- worker 認領工作時設定租約 (lease)，worker 當掉、租約過期後別人會接手
+- 同一個行程內用 Condition 通知狀態變化，其他行程的變化靠定時查詢
+
+工作狀態 stage：
+    <第一個階段> → ... → done
+                     ↘ failed
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import db
+import metrics
+
+DEFAULT_DB_NAME = 'jobs.db'
+
+# 每個行程的 worker 執行緒數 (0 = 這個行程不處理工作，只負責收件)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "8"))
+# 認領後多久沒完成就當作 worker 已經當掉 (秒)
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "120"))
+# 同一個階段最多嘗試幾次
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# 沒有通知時多久查一次資料庫 (其他行程加入的工作)
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "0.5"))
+# 完成的工作保留多久 (秒)，預設 1 天
+JOB_RETENTION = float(os.environ.get("JOB_RETENTION", str(24 * 3600)))
+
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+_PURGE_EVERY = 500
+
+JOB_STAGE_SECONDS = metrics.histogram('reborn_job_stage_seconds', "背景工作每個階段的執行時間", ('stage',))
+JOBS = metrics.counter('reborn_jobs_total', "背景工作各階段的結果 (advanced / failed / retry)", ('stage', 'outcome'))
+
+
+class JobFailed(Exception):
+    """工作無法完成 (不會重試)，code 給前端判斷要顯示什麼"""
+
+    def __init__(self, code: str, message: str = ''):
+        super().__init__(message or code)
+        self.code = code
+
+
+class JobQueue:
+    """存在 SQLite 的工作佇列"""
+
+    def __init__(self, path: str, lease_seconds: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._changed = threading.Condition()
+        self._writes = 0
+        with db.transaction(self._conn()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY,'
+                ' username TEXT NOT NULL,'
+                ' stage TEXT NOT NULL,'
+                ' payload TEXT NOT NULL,'
+                ' result TEXT NOT NULL DEFAULT \'{}\','
+                ' error TEXT,'
+                ' attempts INTEGER NOT NULL DEFAULT 0,'
+                ' lease_until REAL NOT NULL DEFAULT 0,'
+                ' flags INTEGER NOT NULL DEFAULT 0,'
+                ' created_at REAL NOT NULL,'
+                ' updated_at REAL NOT NULL'
+                ')'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (stage, created_at)')
+
+    def _conn(self):
+        return db.get_connection(self.path)
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    # === 建立與查詢 ===
+
+    def enqueue(self, username: str, stage: str, payload: Dict[str, Any]) -> str:
+        """加入一個工作，返回工作編號"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            'INSERT INTO jobs (id, username, stage, payload, created_at, updated_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, username, stage, json.dumps(payload, ensure_ascii=False), now, now)
+        )
+        self._notify()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查詢工作
+        返回: {'id', 'username', 'stage', 'payload', 'result', 'error', 'attempts', 'updated_at'}，找不到時返回 None
+        """
+        row = self._conn().execute(
+            'SELECT id, username, stage, payload, result, error, attempts, updated_at'
+            ' FROM jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0], 'username': row[1], 'stage': row[2],
+            'payload': json.loads(row[3]), 'result': json.loads(row[4]),
+            'error': row[5], 'attempts': row[6], 'updated_at': row[7],
+        }
+
+    def wait(self, job_id: str, since: float, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        等到工作的 updated_at 比 since 新 (或逾時)，返回最新的工作內容
+        給 SSE 用：同一個行程的變化會立刻被喚醒，其他行程的最多慢 JOB_POLL_INTERVAL
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['updated_at'] > since:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            with self._changed:
+                self._changed.wait(min(remaining, JOB_POLL_INTERVAL))
+
+    # === worker 使用 ===
+
+    def claim(self, stages,
+              on_failed: Optional[Callable[[Dict[str, Any]], None]] = None) -> Optional[Dict[str, Any]]:
+        """
+        認領一個等待中的工作 (後面階段的優先，先把做到一半的完成)
+        返回工作內容，沒有工作時返回 None
+        on_failed：嘗試太多次而直接失敗的工作，提交後用工作內容呼叫
+        """
+        stages = list(stages)
+        placeholders = ','.join('?' * len(stages))
+        order = ' '.join(f'WHEN ? THEN {i}' for i in range(len(stages)))
+        while True:
+            now = time.time()
+            with db.transaction(self._conn()) as conn:
+                row = conn.execute(
+                    f'SELECT id, attempts FROM jobs WHERE stage IN ({placeholders}) AND lease_until < ?'
+                    f' ORDER BY CASE stage {order} END DESC, created_at LIMIT 1',
+                    (*stages, now, *stages)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[1] < self.max_attempts:
+                    conn.execute(
+                        'UPDATE jobs SET attempts = attempts + 1, lease_until = ? WHERE id = ?',
+                        (now + self.lease_seconds, row[0])
+                    )
+                    return self.get(row[0])
+                # 已經試太多次 (worker 一直當掉或一直出錯)，直接失敗再找下一個
+                conn.execute(
+                    'UPDATE jobs SET stage = ?, error = ?, lease_until = 0, updated_at = ? WHERE id = ?',
+                    (FAILED, 'too_many_attempts', now, row[0])
+                )
+            self._notify()
+            if on_failed is not None:
+                on_failed(self.get(row[0]))
+
+    def advance(self, job_id: str, stage: str, result: Dict[str, Any]):
+        """目前階段完成：更新結果並進入下一個階段 (釋放租約、重設嘗試次數)"""
+        self._conn().execute(
+            'UPDATE jobs SET stage = ?, result = ?, attempts = 0, lease_until = 0, updated_at = ?'
+            ' WHERE id = ?',
+            (stage, json.dumps(result, ensure_ascii=False), time.time(), job_id)
+        )
+        self._after_write()
+
+    def report_progress(self, job_id: str, stage: str, result: Dict[str, Any]):
+        """
+        階段還沒完成、先更新一部分結果 (階段不變，SSE 會收到通知)
+        工作已經不在 stage 階段 (例如租約過期被別人做完) 時不更新
+        """
+        self._conn().execute(
+            'UPDATE jobs SET result = ?, updated_at = ? WHERE id = ? AND stage = ?',
+            (json.dumps(result, ensure_ascii=False), time.time(), job_id, stage)
+        )
+        self._notify()
+
+    def fail(self, job_id: str, code: str):
+        """工作失敗，不再重試"""
+        self._conn().execute(
+            'UPDATE jobs SET stage = ?, error = ?, lease_until = 0, updated_at = ? WHERE id = ?',
+            (FAILED, code, time.time(), job_id)
+        )
+        self._after_write()
+
+    def release(self, job_id: str):
+        """暫時做不了 (例如程式錯誤)，放回佇列讓別人重試"""
+        self._conn().execute('UPDATE jobs SET lease_until = 0 WHERE id = ?', (job_id,))
+        self._notify()
+
+    def wait_for_work(self, timeout: float = JOB_POLL_INTERVAL):
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def _after_write(self):
+        self._notify()
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            self.purge()
+
+    # === 一次性標記 ===
+
+    def set_flag(self, job_id: str, flag: int) -> bool:
+        """
+        設定標記位元 (例如「已作答」)，多個行程同時呼叫只有一個會成功
+        返回: 這次有沒有成功設定
+        """
+        cur = self._conn().execute(
+            'UPDATE jobs SET flags = flags | ? WHERE id = ? AND flags & ? = 0',
+            (flag, job_id, flag)
+        )
+        return cur.rowcount == 1
+
+    def purge(self, older_than: float = JOB_RETENTION) -> int:
+        """刪除已經結束很久的工作，返回刪除筆數"""
+        cur = self._conn().execute(
+            'DELETE FROM jobs WHERE stage IN (?, ?) AND updated_at < ?',
+            (*FINISHED, time.time() - older_than)
+        )
+        return cur.rowcount
+
+
+Handler = Callable[[Dict[str, Any]], tuple]
+
+
+class WorkerPool:
+    """
+    背景 worker 執行緒
+    handlers: {階段: 函式}，函式收到工作內容，返回 (下一個階段, 新的 result)；
+    丟出 JobFailed 代表工作失敗，其他例外則放回佇列重試
+    on_failed: 工作變成 failed 之後用最新的工作內容呼叫 (例如退還額度)；
+    worker 可能在呼叫前當掉，所以要能重複呼叫 (見 JobQueue.set_flag)
+    """
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Handler], threads: int = JOB_WORKERS,
+                 on_failed: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.queue = queue
+        self.handlers = handlers
+        self.threads = threads
+        self.on_failed = on_failed
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.threads):
+            t = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        with self.queue._changed:
+            self.queue._changed.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self.queue.claim(self.handlers, self._failed)
+            if job is None:
+                self.queue.wait_for_work()
+                continue
+            self.run_one(job)
+
+    def run_one(self, job: Dict[str, Any]):
+        try:
+            with JOB_STAGE_SECONDS.time(stage=job['stage']):
+                stage, result = self.handlers[job['stage']](job)
+        except JobFailed as e:
+            JOBS.inc(stage=job['stage'], outcome='failed')
+            self.queue.fail(job['id'], e.code)
+            self._failed(self.queue.get(job['id']))
+        except Exception as e:
+            print(f"[pid {os.getpid()}] 工作 {job['id']} 在 {job['stage']} 階段發生錯誤: {e}")
+            JOBS.inc(stage=job['stage'], outcome='retry')
+            self.queue.release(job['id'])
+        else:
+            JOBS.inc(stage=job['stage'], outcome='advanced')
+            self.queue.advance(job['id'], stage, result)
+
+    def _failed(self, job: Optional[Dict[str, Any]]):
+        if self.on_failed is None or job is None:
+            return
+        try:
+            self.on_failed(job)
+        except Exception as e:
+            print(f"[pid {os.getpid()}] 工作 {job['id']} 失敗後的處理發生錯誤: {e}")
@@ -0,0 +1,149 @@
+"""
+經驗值排行榜 - 排序好的清單，名次、前 N 名、前後名次都是 O(log N)
+
+每個行程在記憶體裡放一份 SortedList [(−XP, 帳號), ...]：
+- 第一次查詢時從 counters.db 一次讀出全部 XP 重建 (一百萬人約 1.3 秒、260 MB)
+- auth.update_user_xp_by_username 加經驗值後馬上更新本行程的排行榜
+- 其他行程 (其他 gunicorn worker) 的修改：查詢時如果超過 LEADERBOARD_REFRESH_INTERVAL 秒沒同步，
+  用 counters 的 seq 只讀取之後修改過的帳號
+
+同分時名次相同 (1, 2, 2, 4)，同分的人依帳號排序。
+"""
+
+import os
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+from counters import CounterStore, get_counter_store
+
+# 多久跟資料庫同步一次其他行程的修改 (秒)
+LEADERBOARD_REFRESH_INTERVAL = float(os.environ.get("LEADERBOARD_REFRESH_INTERVAL", "1"))
+
+Entry = Tuple[int, str, int]  # (名次, 帳號, XP)
+
+
+class Leaderboard:
+    """依計數器 (預設 XP) 排名的排行榜"""
+
+    def __init__(self, store: CounterStore, scope: str = 'xp',
+                 refresh_interval: float = LEADERBOARD_REFRESH_INTERVAL):
+        self.store = store
+        self.scope = scope
+        self.refresh_interval = refresh_interval
+        self._sorted = SortedList()
+        self._values: Dict[str, int] = {}
+        self._seq = 0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """從資料庫重建整個排行榜"""
+        rows, seq = self.store.scan(self.scope)
+        values = dict(rows)
+        ordered = SortedList((-value, key) for key, value in values.items())
+        with self._lock:
+            self._values = values
+            self._sorted = ordered
+            self._seq = seq
+            self._refreshed_at = time.monotonic()
+
+    def _set(self, key: str, value: int):
+        # 呼叫前要持有 self._lock
+        old = self._values.get(key)
+        if old == value:
+            return
+        if old is not None:
+            self._sorted.remove((-old, key))
+        self._sorted.add((-value, key))
+        self._values[key] = value
+
+    def update(self, key: str, value: int):
+        """
+        本行程剛寫入的新值 (不用等同步)
+        XP 只會增加：比目前小的值代表 refresh 已經讀到其他行程更新的值，略過
+        """
+        with self._lock:
+            if value >= self._values.get(key, value):
+                self._set(key, value)
+
+    def refresh(self, force: bool = False):
+        """讀取其他行程的修改"""
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            changed, self._seq = self.store.changed_since(self.scope, self._seq)
+            for key, value in changed:
+                self._set(key, value)
+            self._refreshed_at = time.monotonic()
+
+    # === 查詢 ===
+
+    def _rank_of(self, value: int) -> int:
+        # 比這個分數高的人數 + 1
+        return self._sorted.bisect_left((-value,)) + 1
+
+    def _entries(self, start: int, stop: int) -> List[Entry]:
+        entries = []
+        rank = None
+        prev = None
+        for i, (neg, key) in enumerate(self._sorted.islice(start, stop), start):
+            if neg != prev:
+                rank = i + 1 if prev is not None else self._rank_of(-neg)
+                prev = neg
+            entries.append((rank, key, -neg))
+        return entries
+
+    def top(self, n: int = 10) -> List[Entry]:
+        """前 n 名"""
+        self.refresh()
+        with self._lock:
+            return self._entries(0, n)
+
+    def rank(self, key: str) -> Optional[int]:
+        """某個帳號的名次 (還沒有經驗值紀錄時為 None)"""
+        self.refresh()
+        with self._lock:
+            value = self._values.get(key)
+            return None if value is None else self._rank_of(value)
+
+    def around(self, key: str, count: int = 2) -> List[Entry]:
+        """某個帳號前後各 count 名 (含自己)"""
+        self.refresh()
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                return []
+            i = self._sorted.index((-value, key))
+            return self._entries(max(i - count, 0), i + count + 1)
+
+    def __len__(self):
+        return len(self._sorted)
+
+
+_board = None
+_board_pid = None
+_board_lock = threading.Lock()
+
+
+def get_leaderboard() -> Leaderboard:
+    """取得本行程的 XP 排行榜 (第一次呼叫時從資料庫建立)"""
+    global _board, _board_pid
+    if _board is None or _board_pid != os.getpid():
+        with _board_lock:
+            if _board is None:
+                _board = Leaderboard(get_counter_store())
+            elif _board_pid != os.getpid():
+                # fork 來的子行程：沿用父行程建好的排行榜 (之後靠 refresh 同步)，鎖要換新的
+                _board._lock = threading.Lock()
+            _board_pid = os.getpid()
+    return _board
+
+
+def record(key: str, value: int):
+    """本行程寫入新的 XP 後呼叫；排行榜還沒建立就不用管 (建立時會從資料庫讀到)"""
+    if _board is not None and _board_pid == os.getpid():
+        _board.update(key, value)
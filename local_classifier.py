@@ -0,0 +1,423 @@
+"""
+本機分類器 - 簡單的照片 (例如一個鋁罐) 不用呼叫 Gemini，幾十毫秒內就知道類別
+
+類別與 web_app/題目.py 相同 (quiz_bank.CATEGORIES 的七個代碼)。
+- 特徵：縮小到 64×64 後，用跟畫面邊緣顏色的差距估計哪裡是物品，
+  算物品的梯度方向直方圖 (4×4 格)、HSV 色彩直方圖、8×8 輪廓；
+  只用 Pillow + NumPy，不需要 GPU 或深度學習套件
+- 分類：k 個最近鄰 (餘弦相似度) 依相似度加權投票，信心 = 最高票類別的得票比例
+- 信心 >= LOCAL_CLASSIFIER_THRESHOLD 才直接回答，否則 (或判斷為 unknown) 交給 Gemini
+- 訓練資料來自我們自己的上傳：Gemini 辨識出類別的照片記在 data/local_labels.db (LabelStore)，
+  也可以另外提供人工標記的 CSV (路徑,類別)
+
+離線訓練與評估 (先留一部分資料評估並印出報告，再用全部資料訓練、存到 data/local_classifier.npz)：
+    python local_classifier.py
+    python local_classifier.py --labels labeled.csv --report report.json
+沒有模型檔時 get_local_classifier() 返回 None，掃描照舊全部交給 Gemini。
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+import db
+import metrics
+from quiz_bank import CATEGORIES, UNKNOWN
+
+DEFAULT_MODEL_NAME = 'local_classifier.npz'
+DEFAULT_DB_NAME = 'local_labels.db'
+
+# 信心高於這個值才不問 Gemini
+LOCAL_CLASSIFIER_THRESHOLD = float(os.environ.get("LOCAL_CLASSIFIER_THRESHOLD", "0.8"))
+# 投票的鄰居數
+LOCAL_CLASSIFIER_K = int(os.environ.get("LOCAL_CLASSIFIER_K", "7"))
+# 設為 0 關閉 (有模型檔也不使用)
+LOCAL_CLASSIFIER_ENABLED = os.environ.get("LOCAL_CLASSIFIER", "1") != "0"
+
+CLASSES = tuple(CATEGORIES)
+# 本機回答時的辨識結果文字 (跟 Gemini 的「這是一個(物品)，材質是(材質)。」同樣格式)
+CLASS_DESCRIPTIONS = {
+    'plastic_bottle': ('寶特瓶', '塑膠'),
+    'paper_cup': ('紙杯', '紙'),
+    'paper_bag': ('紙袋', '紙'),
+    'can': ('金屬罐', '鋁或鐵'),
+    'glass': ('玻璃瓶', '玻璃'),
+    'carton': ('飲料紙盒', '紙與鋁箔'),
+}
+
+_SIZE = 64
+_HUE_BINS, _SAT_BINS, _VAL_BINS = 8, 3, 3
+_CELLS, _ORIENTATIONS = 4, 8
+# 跟背景顏色差多少 (RGB 距離) 以上算是物品
+_FOREGROUND_DISTANCE = 60.0
+_COLOR_WEIGHT, _SILHOUETTE_WEIGHT = 0.5, 0.5
+
+LOCAL_PREDICTIONS = metrics.counter('reborn_local_classifier_total', "本機分類器的結果 (answered / escalated)",
+                                    ('outcome',))
+LOCAL_SECONDS = metrics.histogram('reborn_local_classifier_seconds', "本機分類一張照片的時間 (含解碼)")
+
+
+# ==========================================
+# 特徵
+# ==========================================
+
+def _unit(v: np.ndarray) -> np.ndarray:
+    return v / max(float(np.linalg.norm(v)), 1e-6)
+
+
+def _foreground(rgb: np.ndarray) -> np.ndarray:
+    """每個像素是物品 (而不是背景) 的程度 0~1：跟畫面邊緣的中位數顏色差越多越像物品"""
+    border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+    distance = np.linalg.norm(rgb - np.median(border, axis=0), axis=2)
+    return np.clip(distance / _FOREGROUND_DISTANCE, 0.0, 1.0)
+
+
+def _color_histogram(hsv: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    h = hsv[..., 0].astype(np.int32) * _HUE_BINS // 256
+    s = hsv[..., 1].astype(np.int32) * _SAT_BINS // 256
+    v = hsv[..., 2].astype(np.int32) * _VAL_BINS // 256
+    idx = (h * _SAT_BINS + s) * _VAL_BINS + v
+    hist = np.bincount(idx.ravel(), weights=weights.ravel(), minlength=_HUE_BINS * _SAT_BINS * _VAL_BINS)
+    # 開根號 (Hellinger)：面積大的顏色不會蓋過其他顏色
+    return _unit(np.sqrt(hist.astype(np.float32)))
+
+
+def _gradient_histogram(gray: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    gy, gx = np.gradient(gray)
+    magnitude = np.hypot(gx, gy) * weights
+    orientation = ((np.arctan2(gy, gx) % np.pi) / np.pi * _ORIENTATIONS).astype(np.int32) % _ORIENTATIONS
+    cell = _SIZE // _CELLS
+    cells = (np.arange(_SIZE) // cell)
+    idx = ((cells[:, None] * _CELLS + cells[None, :]) * _ORIENTATIONS + orientation).ravel()
+    hist = np.bincount(idx, weights=magnitude.ravel(), minlength=_CELLS * _CELLS * _ORIENTATIONS)
+    return _unit(np.sqrt(hist.astype(np.float32)))
+
+
+def extract_features(image) -> np.ndarray:
+    """一張照片 (路徑、檔案物件或 PIL 圖片) 的特徵向量 (float32，長度 FEATURE_DIM)"""
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    # JPEG 在解碼時直接縮小，大照片也只要幾毫秒
+    image.draft('RGB', (_SIZE * 4, _SIZE * 4))
+    image = ImageOps.exif_transpose(image).convert('RGB').resize((_SIZE, _SIZE), Image.Resampling.BILINEAR)
+    hsv = np.asarray(image.convert('HSV'))
+    gray = np.asarray(image.convert('L'), dtype=np.float32) / 255.0
+    foreground = _foreground(np.asarray(image, dtype=np.float32))
+    # 輪廓 (物品的形狀：瘦高的瓶子、矮胖的罐子、寬的紙袋)
+    silhouette = foreground.reshape(8, _SIZE // 8, 8, _SIZE // 8).mean(axis=(1, 3)).ravel()
+    # 形狀 (梯度方向) 最可靠；顏色 (鋁罐、鋁箔包的印刷五顏六色) 與輪廓 (位置會偏) 權重減半
+    return np.concatenate([
+        _gradient_histogram(gray, foreground),
+        _COLOR_WEIGHT * _color_histogram(hsv, foreground),
+        _SILHOUETTE_WEIGHT * _unit(silhouette),
+    ]).astype(np.float32)
+
+
+FEATURE_DIM = _CELLS * _CELLS * _ORIENTATIONS + _HUE_BINS * _SAT_BINS * _VAL_BINS + 64
+
+
+def extract_many(images: Sequence[Any], workers: int = 4) -> np.ndarray:
+    """多張照片的特徵 (n × FEATURE_DIM)；Pillow 解碼時會釋放 GIL，用執行緒就能同時處理"""
+    if not images:
+        return np.zeros((0, FEATURE_DIM), dtype=np.float32)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return np.stack(list(pool.map(extract_features, images)))
+
+
+# ==========================================
+# 分類器
+# ==========================================
+
+class LocalClassifier:
+    """k 個最近鄰分類器 (特徵減去平均後正規化，內積就是餘弦相似度)"""
+
+    def __init__(self, features: np.ndarray, labels: np.ndarray, k: int = LOCAL_CLASSIFIER_K,
+                 threshold: float = LOCAL_CLASSIFIER_THRESHOLD, mean: Optional[np.ndarray] = None):
+        self.mean = features.mean(axis=0) if mean is None else mean
+        self.features = self._normalize(features)
+        self.labels = labels.astype(np.int64)
+        self.k = min(k, len(labels))
+        self.threshold = threshold
+
+    @classmethod
+    def fit(cls, features: np.ndarray, labels: Sequence[str], **kwargs) -> 'LocalClassifier':
+        """labels 為類別代碼 (CLASSES 之一)"""
+        index = {name: i for i, name in enumerate(CLASSES)}
+        return cls(np.asarray(features, dtype=np.float32), np.array([index[label] for label in labels]), **kwargs)
+
+    def _normalize(self, features: np.ndarray) -> np.ndarray:
+        centered = features - self.mean
+        norms = np.linalg.norm(centered, axis=1, keepdims=True)
+        return (centered / np.maximum(norms, 1e-6)).astype(np.float32)
+
+    def predict_features(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批次預測 (向量化：一次矩陣乘法算完所有相似度)
+        返回: (類別編號陣列, 信心陣列)
+        """
+        query = self._normalize(np.atleast_2d(features))
+        sims = query @ self.features.T
+        nearest = np.argpartition(-sims, self.k - 1, axis=1)[:, :self.k]
+        weights = np.maximum(np.take_along_axis(sims, nearest, axis=1), 0.0) + 1e-6
+        votes = np.zeros((len(query), len(CLASSES)), dtype=np.float32)
+        np.add.at(votes, (np.arange(len(query))[:, None], self.labels[nearest]), weights)
+        best = votes.argmax(axis=1)
+        return best, votes[np.arange(len(query)), best] / votes.sum(axis=1)
+
+    def predict(self, images: Sequence[Any]) -> List[Tuple[str, float]]:
+        """多張照片：[(類別代碼, 信心), ...]"""
+        best, confidence = self.predict_features(extract_many(images))
+        return [(CLASSES[i], float(c)) for i, c in zip(best, confidence)]
+
+    def classify(self, image) -> Optional[str]:
+        """
+        掃描用：信心夠高而且不是 unknown 時返回類別代碼，否則返回 None (交給 Gemini)
+        """
+        with LOCAL_SECONDS.time():
+            best, confidence = self.predict_features(extract_features(image))
+        category = CLASSES[best[0]]
+        if category == UNKNOWN or confidence[0] < self.threshold:
+            LOCAL_PREDICTIONS.inc(outcome='escalated')
+            return None
+        LOCAL_PREDICTIONS.inc(outcome='answered')
+        return category
+
+    def save(self, path: str):
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, features=self.features, labels=self.labels, mean=self.mean,
+                            classes=np.array(CLASSES), k=self.k)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'LocalClassifier':
+        with np.load(path) as data:
+            if tuple(data['classes']) != CLASSES:
+                raise ValueError(f"{path} 的類別與 quiz_bank.CATEGORIES 不同，請重新訓練")
+            clf = cls.__new__(cls)
+            clf.mean = data['mean']
+            clf.features = data['features']
+            clf.labels = data['labels']
+            clf.k = int(data['k'])
+        clf.threshold = kwargs.get('threshold', LOCAL_CLASSIFIER_THRESHOLD)
+        return clf
+
+    def __len__(self):
+        return len(self.labels)
+
+
+def describe(category: str) -> str:
+    """本機回答時的辨識結果文字"""
+    item, material = CLASS_DESCRIPTIONS[category]
+    return f"這是一個{item}，材質是{material}。"
+
+
+# ==========================================
+# 訓練資料
+# ==========================================
+
+class LabelStore:
+    """Gemini 辨識出類別的上傳 (sha256 → 檔名、類別)，給離線訓練使用"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with db.transaction(self._conn()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS labels ('
+                ' sha256 TEXT PRIMARY KEY,'
+                ' filename TEXT NOT NULL,'
+                ' category TEXT NOT NULL,'
+                ' created_at REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+
+    def _conn(self):
+        return db.get_connection(self.path)
+
+    def record(self, sha256: str, filename: str, category: str):
+        """記下一張照片的類別 (同一張照片以最新的為準)"""
+        if category not in CATEGORIES:
+            return
+        self._conn().execute(
+            'INSERT OR REPLACE INTO labels (sha256, filename, category, created_at) VALUES (?, ?, ?, ?)',
+            (sha256, filename, category, time.time())
+        )
+
+    def samples(self) -> List[Tuple[str, str]]:
+        """[(檔名, 類別), ...]"""
+        return self._conn().execute('SELECT filename, category FROM labels ORDER BY created_at').fetchall()
+
+
+def load_samples(store: Optional[LabelStore] = None, csv_path: Optional[str] = None) -> Tuple[List[Any], List[str]]:
+    """
+    讀出訓練資料：LabelStore 裡還在的上傳 + CSV (路徑,類別)
+    返回: (照片路徑列表, 類別列表)
+    """
+    from upload_storage import get_upload_storage
+    paths, labels = [], []
+    if store is not None:
+        storage = get_upload_storage()
+        for filename, category in store.samples():
+            path = storage.local_path(filename)
+            if path is not None:  # 已經被清理掉的上傳略過
+                paths.append(path)
+                labels.append(category)
+    if csv_path:
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if len(row) >= 2 and row[1].strip() in CATEGORIES:
+                    paths.append(row[0].strip())
+                    labels.append(row[1].strip())
+    return paths, labels
+
+
+# ==========================================
+# 評估
+# ==========================================
+
+def split(labels: Sequence[str], test_fraction: float = 0.2, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """依類別分層隨機切出評估用的資料，返回 (訓練索引, 評估索引)"""
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    train, test = [], []
+    for category in np.unique(labels):
+        idx = rng.permutation(np.flatnonzero(labels == category))
+        n_test = int(round(len(idx) * test_fraction))
+        test.extend(idx[:n_test])
+        train.extend(idx[n_test:])
+    return np.array(sorted(train)), np.array(sorted(test))
+
+
+def evaluate(clf: LocalClassifier, features: np.ndarray, labels: Sequence[str],
+             thresholds: Iterable[float] = (0.5, 0.6, 0.7, 0.8, 0.9, 1.0)) -> Dict[str, Any]:
+    """
+    準確率與升級 (交給 Gemini) 比例
+    本機回答的條件跟 classify() 一樣：信心 >= 門檻而且不是 unknown
+    """
+    truth = np.array([CLASSES.index(label) for label in labels])
+    t = time.perf_counter()
+    best, confidence = clf.predict_features(features)
+    predict_ms = (time.perf_counter() - t) * 1000 / max(len(truth), 1)
+    correct = best == truth
+    unknown = CLASSES.index(UNKNOWN)
+    report = {
+        'samples': int(len(truth)),
+        'accuracy': float(correct.mean()) if len(truth) else 0.0,
+        'predict_ms_per_image': predict_ms,
+        'per_class': {
+            name: {'samples': int((truth == i).sum()),
+                   'accuracy': float(correct[truth == i].mean()) if (truth == i).any() else None}
+            for i, name in enumerate(CLASSES)
+        },
+        'thresholds': [],
+    }
+    for threshold in thresholds:
+        answered = (confidence >= threshold) & (best != unknown)
+        report['thresholds'].append({
+            'threshold': threshold,
+            'answered': float(answered.mean()) if len(truth) else 0.0,
+            'escalation_rate': 1.0 - float(answered.mean()) if len(truth) else 1.0,
+            'answered_accuracy': float(correct[answered].mean()) if answered.any() else None,
+            # 升級的照片假設 Gemini 答對：整體準確率的上限
+            'overall_accuracy': float((correct | ~answered).mean()) if len(truth) else 0.0,
+        })
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"評估 {report['samples']} 張：準確率 {report['accuracy']:.1%}，"
+          f"分類 {report['predict_ms_per_image']:.3f} ms/張 (不含解碼)"
+          + (f"，特徵 {report['feature_ms_per_image']:.1f} ms/張" if 'feature_ms_per_image' in report else ''))
+    for name, row in report['per_class'].items():
+        if row['samples']:
+            print(f"  {name:15s} {row['samples']:5d} 張  {row['accuracy']:.1%}")
+    print("  門檻   本機回答   升級到 Gemini   本機回答的準確率   整體 (升級的算答對)")
+    for row in report['thresholds']:
+        acc = f"{row['answered_accuracy']:.1%}" if row['answered_accuracy'] is not None else '-'
+        print(f"  {row['threshold']:.2f}   {row['answered']:7.1%}   {row['escalation_rate']:12.1%}"
+              f"   {acc:>15s}   {row['overall_accuracy']:17.1%}")
+
+
+def train_and_evaluate(paths: Sequence[Any], labels: Sequence[str], test_fraction: float = 0.2,
+                       k: int = LOCAL_CLASSIFIER_K) -> Tuple[LocalClassifier, Dict[str, Any]]:
+    """先用一部分資料評估，再用全部資料訓練最後的模型"""
+    t = time.perf_counter()
+    features = extract_many(paths)
+    feature_ms = (time.perf_counter() - t) * 1000 / max(len(paths), 1)
+    train, test = split(labels, test_fraction)
+    labels = np.asarray(labels)
+    report = evaluate(LocalClassifier.fit(features[train], labels[train], k=k), features[test], labels[test])
+    report['feature_ms_per_image'] = feature_ms
+    report['train_samples'] = int(len(train))
+    return LocalClassifier.fit(features, labels, k=k), report
+
+
+# ==========================================
+# 全域共用
+# ==========================================
+
+_classifier = None
+_classifier_loaded = False
+_label_store = None
+_lock = threading.Lock()
+
+
+def get_local_classifier() -> Optional[LocalClassifier]:
+    """取得本機分類器；沒有訓練過 (沒有模型檔) 或關閉時返回 None"""
+    global _classifier, _classifier_loaded
+    if not _classifier_loaded:
+        with _lock:
+            if not _classifier_loaded:
+                path = db.db_path(DEFAULT_MODEL_NAME)
+                if LOCAL_CLASSIFIER_ENABLED and os.path.exists(path):
+                    _classifier = LocalClassifier.load(path)
+                _classifier_loaded = True
+    return _classifier
+
+
+def get_label_store() -> LabelStore:
+    """取得全域共用的訓練資料紀錄 (第一次呼叫時建立)"""
+    global _label_store
+    if _label_store is None:
+        with _lock:
+            if _label_store is None:
+                _label_store = LabelStore(db.db_path(DEFAULT_DB_NAME))
+    return _label_store
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="本機分類器：離線訓練與評估")
+    parser.add_argument('--labels', help="另外的人工標記 CSV (路徑,類別)")
+    parser.add_argument('--no-uploads', action='store_true', help="不使用 data/local_labels.db 記下的上傳")
+    parser.add_argument('--test-fraction', type=float, default=0.2)
+    parser.add_argument('--k', type=int, default=LOCAL_CLASSIFIER_K)
+    parser.add_argument('--report', help="評估報告另存成 JSON")
+    parser.add_argument('--dry-run', action='store_true', help="只評估，不存模型")
+    args = parser.parse_args(argv)
+
+    paths, labels = load_samples(None if args.no_uploads else get_label_store(), args.labels)
+    if len(set(labels)) < 2:
+        print(f"訓練資料不夠 ({len(paths)} 張，{len(set(labels))} 個類別)")
+        return 1
+    clf, report = train_and_evaluate(paths, labels, args.test_fraction, args.k)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if not args.dry_run:
+        path = db.db_path(DEFAULT_MODEL_NAME)
+        clf.save(path)
+        print(f"模型 ({len(clf)} 張) 已存到 {path}，重新啟動後生效")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,396 @@
+"""
+效能指標 - 計數器與延遲直方圖，/metrics 以 Prometheus 文字格式輸出
+
+用法：
+    SCAN_STAGE = metrics.histogram('reborn_scan_stage_seconds', "/scan 各步驟耗時", ('stage',))
+
+    @metrics.timed('reborn_image_hash_seconds', "計算圖片 sha256 的時間")
+    def get_image_hash(...): ...
+
+    with SCAN_STAGE.time(stage='upload'):
+        ...
+
+    metrics.counter('reborn_scan_rejected_total', "被拒絕的掃描", ('reason',)).inc(reason='duplicate')
+
+記錄只改記憶體裡的數字 (一次 1~2µs)。每個行程每 METRICS_FLUSH_INTERVAL 秒
+把自己的數字寫到 data/metrics/<pid>.json，/metrics 把所有行程加總，
+所以不管請求落在哪個 gunicorn worker 都看得到全部的數字。
+已結束的行程 (gunicorn 重開 worker) 的數字併入 data/metrics/dead.json 繼續算，
+計數器與直方圖不會因為 worker 換掉而變小 (跟 prometheus_client 的 multiprocess 模式一樣；
+目前沒有 gauge，以後加的話已結束的行程直接丟掉)。
+"""
+
+import os
+import json
+import time
+import bisect
+import functools
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import db
+
+# 多久把本行程的數字寫到共用資料夾一次 (秒)
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+METRICS_DIR_NAME = 'metrics'
+# 已結束的行程累計的數字
+DEAD_FILE_NAME = 'dead.json'
+
+# 延遲直方圖預設的區間 (秒)：50µs ~ 30s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_perf_counter = time.perf_counter
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """只會增加的計數器"""
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels) if labels or self.labelnames else ()
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), v] for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    """延遲直方圖：每個區間的次數、總和、總次數"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        self._observe(self._key(labels) if labels or self.labelnames else (), value)
+
+    def _observe(self, key: Tuple[str, ...], value: float):
+        # 最後一格是 +Inf
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels) -> '_Timer':
+        """計時的 context manager：with hist.time(stage='upload'): ..."""
+        return _Timer(self, self._key(labels) if labels or self.labelnames else ())
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), [list(v[0]), v[1], v[2]]] for k, v in self._values.items()]
+
+
+class _Timer:
+    __slots__ = ('hist', 'key', 'start')
+
+    def __init__(self, hist: Histogram, key: Tuple[str, ...]):
+        self.hist = hist
+        self.key = key
+
+    def __enter__(self):
+        self.start = _perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.hist._observe(self.key, _perf_counter() - self.start)
+        return False
+
+
+# === 註冊 ===
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, help: str, labelnames: Sequence[str], **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help, labelnames, **kwargs)
+        elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"指標 {name} 已經用不同的型別或標籤註冊過")
+    _ensure_flusher()
+    return metric
+
+
+def counter(name: str, help: str = '', labelnames: Sequence[str] = ()) -> Counter:
+    """取得 (或建立) 計數器"""
+    return _get_or_create(Counter, name, help, labelnames)
+
+
+def histogram(name: str, help: str = '', labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """取得 (或建立) 直方圖"""
+    return _get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+
+def timed(name: str, help: str = '', **labels):
+    """
+    函式計時的 decorator：@timed('reborn_quiz_parse_seconds')
+    標籤值在裝飾時就決定，呼叫時不用再查表
+    """
+    hist = histogram(name, help, tuple(labels))
+    key = hist._key(labels) if labels else ()
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = _perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist._observe(key, _perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# === 多個行程共用 ===
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _metrics_dir() -> str:
+    return db.db_path(METRICS_DIR_NAME)
+
+
+def _ensure_flusher():
+    """每個行程一個背景執行緒定時寫出數字"""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+def _after_fork():
+    """
+    fork 出來的子行程 (gunicorn --preload 的 worker) 從零開始：
+    父行程的數字由父行程自己回報，背景執行緒也要重新開
+    """
+    global _flusher_pid, _flusher_lock, _registry_lock
+    _flusher_lock = threading.Lock()
+    _registry_lock = threading.Lock()
+    for metric in _registry.values():
+        metric._lock = threading.Lock()
+        metric._values.clear()
+    if _flusher_pid is not None:
+        _flusher_pid = None
+        _ensure_flusher()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _flush_loop():
+    pid = os.getpid()
+    while _flusher_pid == pid:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError as e:
+            print(f"[pid {pid}] 指標寫出失敗: {e}")
+
+
+def snapshot() -> Dict[str, dict]:
+    """本行程目前的數字 (可以轉成 JSON)"""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    result = {}
+    for m in metrics:
+        entry = {'type': m.kind, 'help': m.help, 'labelnames': list(m.labelnames), 'values': m.snapshot()}
+        if isinstance(m, Histogram):
+            entry['buckets'] = list(m.buckets)
+        result[m.name] = entry
+    return result
+
+
+def flush():
+    """把本行程的數字寫到 data/metrics/<pid>.json"""
+    directory = _metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path: str) -> Optional[Dict[str, dict]]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _to_snapshot(merged: Dict[str, dict]) -> Dict[str, dict]:
+    """_merge 的結果轉回 snapshot 的格式 (可以轉成 JSON)"""
+    return {name: {**entry, 'values': [[list(k), v] for k, v in entry['values'].items()]}
+            for name, entry in merged.items()}
+
+
+def _fold_dead(directory: str, path: str):
+    """
+    已結束的行程的數字併入 dead.json 之後刪掉它的檔案
+    用 flock 讓同時在收集的行程只有一個會併入 (不會算兩次)
+    """
+    import fcntl  # 需要 Linux/macOS
+    dead_path = os.path.join(directory, DEAD_FILE_NAME)
+    fd = os.open(dead_path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if not os.path.exists(path):
+            return  # 別的行程已經併入了
+        snap = _read(path) or {}  # 寫到一半壞掉的檔案就只刪掉
+        # 只有計數器與直方圖會累加，其他種類 (gauge) 直接丟掉
+        snap = {name: entry for name, entry in snap.items() if entry['type'] in ('counter', 'histogram')}
+        merged = _to_snapshot(_merge([_read(dead_path) or {}, snap]))
+        tmp = dead_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(merged, f, ensure_ascii=False)
+        os.replace(tmp, dead_path)
+        os.remove(path)
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _collect() -> List[Dict[str, dict]]:
+    """
+    所有行程的數字：本行程用記憶體裡最新的，其他行程讀檔案，
+    已結束的行程先併入 dead.json 再一起讀
+    """
+    snapshots = [snapshot()]
+    directory = _metrics_dir()
+    if not os.path.isdir(directory):
+        return snapshots
+    me = os.getpid()
+    dead = []
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            pid = int(name[:-5])
+        except ValueError:
+            continue
+        if pid == me:
+            continue
+        path = os.path.join(directory, name)
+        if not _pid_alive(pid):
+            dead.append(path)
+            continue
+        snap = _read(path)
+        if snap is not None:
+            snapshots.append(snap)
+    for path in dead:
+        _fold_dead(directory, path)
+    total = _read(os.path.join(directory, DEAD_FILE_NAME))
+    if total is not None:
+        snapshots.append(total)
+    return snapshots
+
+
+def _merge(snapshots: Iterable[Dict[str, dict]]) -> Dict[str, dict]:
+    merged: Dict[str, dict] = {}
+    for snap in snapshots:
+        for name, entry in snap.items():
+            target = merged.setdefault(name, {**entry, 'values': {}})
+            if target['type'] != entry['type'] or target.get('buckets') != entry.get('buckets'):
+                continue  # 不同版本的程式定義不一樣，略過
+            for labels, value in entry['values']:
+                key = tuple(labels)
+                if entry['type'] == 'counter':
+                    target['values'][key] = target['values'].get(key, 0) + value
+                else:
+                    current = target['values'].get(key)
+                    if current is None:
+                        target['values'][key] = [list(value[0]), value[1], value[2]]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                        current[2] += value[2]
+    return merged
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_number(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def render() -> str:
+    """所有行程加總後的 Prometheus 文字格式"""
+    lines = []
+    for name, entry in sorted(_merge(_collect()).items()):
+        labelnames = entry['labelnames']
+        lines.append(f"# HELP {name} {entry['help']}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+        for key, value in sorted(entry['values'].items()):
+            if entry['type'] == 'counter':
+                lines.append(f"{name}{_format_labels(labelnames, key)} {_format_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, n in zip(list(entry['buckets']) + ['+Inf'], counts):
+                cumulative += n
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, key)} {repr(float(total))}")
+            lines.append(f"{name}_count{_format_labels(labelnames, key)} {count}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,36 @@
+"""
+把舊的 users.json 匯入新的用戶儲存 (SQLite 或 Postgres)
+
+用法:
+    python migrate_users.py                      # 匯入到預設的 data/users.db
+    python migrate_users.py --target postgresql://user:pw@host/db
+    python migrate_users.py --source 其他/users.json
+
+已存在的帳號會略過，可以重複執行。
+"""
+
+import argparse
+import os
+
+from user_store import open_user_store, read_users_json
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="users.json → 用戶資料庫")
+    parser.add_argument('--source', default=os.path.join(BASE_DIR, 'users.json'),
+                        help="舊版 users.json 路徑")
+    parser.add_argument('--target', default=None,
+                        help="目標儲存網址 (預設讀 USER_STORE_URL，再預設 data/users.db)")
+    args = parser.parse_args()
+
+    rows = read_users_json(args.source)
+    store = open_user_store(args.target)
+    added = store.import_users(rows)
+    print(f"讀取 {len(rows)} 筆，新增 {added} 筆，略過 {len(rows) - added} 筆 (已存在)")
+    print(f"目前用戶總數: {store.count()}")
+
+
+if __name__ == '__main__':
+    main()
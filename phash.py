@@ -0,0 +1,383 @@
+"""
+感知雜湊 (perceptual hash) - 抓出「重新存檔、縮放、HEIC 轉 JPEG」的同一張照片
+
+原本的 QA.get_image_hash 是檔案內容的 sha256，只要重新存檔就會變成不同的值，
+可以一直拿同一張照片賺經驗值。這裡改用縮小後灰階圖的 dHash / pHash (64 位元)，
+兩張圖的漢明距離夠小就視為同一張。
+
+HammingIndex 用「多重索引雜湊」(multi-index hashing) 搜尋：
+64 位元切成 4 段 16 位元，距離 <= r 的兩個雜湊至少有一段距離 <= r // 4，
+所以只要查每段的少數候選值，再用 NumPy 一次算出候選的完整距離。
+"""
+
+import os
+import threading
+from functools import lru_cache
+from itertools import combinations
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+import db
+
+DEFAULT_DB_NAME = 'dedup.db'
+
+# 漢明距離 <= 此值就算是同一張照片 (64 位元中)
+PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE", "6"))
+
+_HASH_BITS = 64
+_CHUNKS = 4
+_CHUNK_BITS = _HASH_BITS // _CHUNKS
+# 新增的雜湊先放在暫存區，累積到這個數量再合併進排序好的索引
+_MERGE_THRESHOLD = 4096
+
+
+# ==========================================
+# 雜湊計算
+# ==========================================
+
+def _load_gray(image, size: Tuple[int, int]) -> np.ndarray:
+    """開啟圖片 (路徑、檔案物件或 PIL 圖片)，轉成縮小後的灰階陣列"""
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    # JPEG 可以在解碼時直接縮小，大照片快很多
+    image.draft('L', (size[0] * 4, size[1] * 4))
+    image = ImageOps.exif_transpose(image).convert('L')
+    image = image.resize(size, Image.Resampling.LANCZOS)
+    return np.asarray(image, dtype=np.float32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    packed = np.packbits(bits.astype(np.uint8).ravel())
+    return int.from_bytes(packed.tobytes(), 'big')
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """差異雜湊：比較每一列相鄰像素的亮度"""
+    pixels = _load_gray(image, (hash_size + 1, hash_size))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0, :] = np.sqrt(1.0 / n)
+    return m.astype(np.float32)
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def phash(image, hash_size: int = 8) -> int:
+    """DCT 感知雜湊：取低頻係數與中位數比較，對縮放與壓縮很穩定"""
+    size = hash_size * 4
+    pixels = _load_gray(image, (size, size))
+    dct = _DCT_32 if size == 32 else _dct_matrix(size)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    return _bits_to_int(low > np.median(low))
+
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(x: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(x)
+else:
+    _POPCOUNT_8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount(x: np.ndarray) -> np.ndarray:
+        return _POPCOUNT_8[x.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+def hamming(a: int, b: int) -> int:
+    """兩個雜湊的漢明距離"""
+    return (a ^ b).bit_count()
+
+
+# ==========================================
+# 漢明距離搜尋索引
+# ==========================================
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius: int) -> np.ndarray:
+    """16 位元中翻轉 0 ~ radius 個位元的所有遮罩"""
+    masks = [sum(1 << b for b in bits)
+             for k in range(radius + 1)
+             for bits in combinations(range(_CHUNK_BITS), k)]
+    return np.array(masks, dtype=np.uint16)
+
+
+class HammingIndex:
+    """64 位元雜湊的近似重複搜尋 (多重索引雜湊)"""
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.ids = np.empty(0, dtype=np.int64)
+        # 每段一組：排序後的 16 位元值，以及對應到 hashes 的位置
+        self._keys: List[np.ndarray] = [np.empty(0, dtype=np.uint16)] * _CHUNKS
+        self._order: List[np.ndarray] = [np.empty(0, dtype=np.int64)] * _CHUNKS
+        self._pending_hashes: List[int] = []
+        self._pending_ids: List[int] = []
+        self._removed = 0
+
+    def __len__(self):
+        return len(self.hashes) + len(self._pending_hashes) - self._removed
+
+    def add(self, value: int, item_id: int):
+        """加入一個雜湊"""
+        self._pending_hashes.append(value)
+        self._pending_ids.append(item_id)
+        if len(self._pending_hashes) >= _MERGE_THRESHOLD:
+            self.merge()
+
+    def add_many(self, values, item_ids):
+        """一次加入很多雜湊 (建立索引時使用)"""
+        self._pending_hashes.extend(int(v) for v in values)
+        self._pending_ids.extend(int(i) for i in item_ids)
+        self.merge()
+
+    def remove(self, value: int, item_id: int) -> bool:
+        """
+        刪除一筆 (value, item_id)，返回是否有找到
+        排序好的索引裡只把 id 標成 -1 (搜尋時略過)，不用重建
+        """
+        for k, (v, i) in enumerate(zip(self._pending_hashes, self._pending_ids)):
+            if v == value and i == item_id:
+                del self._pending_hashes[k], self._pending_ids[k]
+                return True
+        found = np.nonzero((self.hashes == np.uint64(value)) & (self.ids == item_id))[0]
+        if not len(found):
+            return False
+        self.ids[found[0]] = -1
+        self._removed += 1
+        return True
+
+    def merge(self):
+        """把暫存區合併進排序好的索引"""
+        if not self._pending_hashes:
+            return
+        self.hashes = np.concatenate([self.hashes, np.array(self._pending_hashes, dtype=np.uint64)])
+        self.ids = np.concatenate([self.ids, np.array(self._pending_ids, dtype=np.int64)])
+        self._pending_hashes = []
+        self._pending_ids = []
+        for j in range(_CHUNKS):
+            chunk = ((self.hashes >> np.uint64(j * _CHUNK_BITS)) & np.uint64(0xFFFF)).astype(np.uint16)
+            order = np.argsort(chunk, kind='stable')
+            self._keys[j] = chunk[order]
+            self._order[j] = order
+
+    def search(self, value: int, max_distance: int = PHASH_MAX_DISTANCE) -> List[Tuple[int, int]]:
+        """
+        找出距離 <= max_distance 的所有雜湊
+        返回: [(item_id, 距離), ...]，由近到遠
+        """
+        radius = max_distance // _CHUNKS
+        query = np.uint64(value)
+        masks = _flip_masks(radius)
+        results = []
+        seen = set()
+        for j in range(_CHUNKS):
+            keys = self._keys[j]
+            if not len(keys):
+                continue
+            probes = masks ^ np.uint16((value >> (j * _CHUNK_BITS)) & 0xFFFF)
+            lo = np.searchsorted(keys, probes, 'left')
+            hi = np.searchsorted(keys, probes, 'right')
+            # 把所有 [lo, hi) 區間展開成一個位置陣列，不用逐段切片
+            lengths = hi - lo
+            total = int(lengths.sum())
+            if not total:
+                continue
+            starts = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+            idx = self._order[j][starts + np.arange(total)]
+            dist = _popcount(self.hashes[idx] ^ query)
+            # 同一筆可能在好幾段都是候選，只有命中的少數需要去重
+            for k in np.nonzero(dist <= max_distance)[0]:
+                pos = int(idx[k])
+                if pos not in seen and self.ids[pos] >= 0:
+                    seen.add(pos)
+                    results.append((int(self.ids[pos]), int(dist[k])))
+        if self._pending_hashes:
+            pending = np.array(self._pending_hashes, dtype=np.uint64)
+            dist = _popcount(pending ^ query)
+            for k in np.nonzero(dist <= max_distance)[0]:
+                results.append((self._pending_ids[k], int(dist[k])))
+        results.sort(key=lambda r: r[1])
+        return results
+
+    def nbytes(self) -> int:
+        """索引佔用的記憶體 (不含暫存區)"""
+        return (self.hashes.nbytes + self.ids.nbytes
+                + sum(k.nbytes for k in self._keys) + sum(o.nbytes for o in self._order))
+
+
+# ==========================================
+# 持久化的近似重複索引
+# ==========================================
+
+def _to_signed(value: int) -> int:
+    """SQLite 的 INTEGER 是有號 64 位元"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class NearDuplicateIndex:
+    """
+    存在 SQLite 的感知雜湊，啟動時載入記憶體索引
+    查詢前先讀進其他 worker 新增與刪除的資料 (以自動遞增的 id 追蹤；
+    刪除記在 perceptual_hash_removals，只套用在本行程已經載入過的那一筆)
+    """
+
+    def __init__(self, path: str, global_scope: bool = False):
+        self.path = path
+        self.global_scope = global_scope
+        # 索引裡的 item_id 是帳號編號，避免 100 萬筆時每筆都存一個字串
+        self.index = HammingIndex()
+        self._user_codes: Dict[str, int] = {}
+        self._usernames: List[str] = []
+        self._last_id = 0
+        self._last_removal_id = 0
+        self._lock = threading.Lock()
+        with db.transaction(self._conn()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS perceptual_hashes ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' username TEXT NOT NULL,'
+                ' phash INTEGER NOT NULL,'
+                ' created_at TEXT NOT NULL'
+                ')'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS perceptual_hash_removals ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' row_id INTEGER NOT NULL,'
+                ' username TEXT NOT NULL,'
+                ' phash INTEGER NOT NULL'
+                ')'
+            )
+        self._refresh()
+
+    def _conn(self):
+        return db.get_connection(self.path)
+
+    def _refresh(self):
+        conn = self._conn()
+        if not conn.in_transaction:
+            # 新增與刪除要在同一個快照裡讀，才知道被刪掉的那一筆有沒有載入過
+            conn.execute('BEGIN')
+            try:
+                self._refresh()
+            finally:
+                conn.execute('COMMIT')
+            return
+        loaded = self._last_id
+        rows = conn.execute(
+            'SELECT id, username, phash FROM perceptual_hashes WHERE id > ? ORDER BY id',
+            (self._last_id,)
+        ).fetchall()
+        if rows:
+            codes = [self._user_code(r[1]) for r in rows]
+            if self._last_id == 0:
+                # 啟動時一次建立整個索引
+                self.index.add_many([_to_unsigned(r[2]) for r in rows], codes)
+            else:
+                for (_, _, value), code in zip(rows, codes):
+                    self.index.add(_to_unsigned(value), code)
+            self._last_id = rows[-1][0]
+        removals = conn.execute(
+            'SELECT id, row_id, username, phash FROM perceptual_hash_removals WHERE id > ? ORDER BY id',
+            (self._last_removal_id,)
+        ).fetchall()
+        for _, row_id, username, value in removals:
+            # 這次快照之前就被刪掉的，本來就沒有載入
+            if row_id <= loaded:
+                self.index.remove(_to_unsigned(value), self._user_code(username))
+        if removals:
+            self._last_removal_id = removals[-1][0]
+
+    def _user_code(self, username: str) -> int:
+        code = self._user_codes.get(username)
+        if code is None:
+            code = self._user_codes[username] = len(self._usernames)
+            self._usernames.append(username)
+        return code
+
+    def find(self, username: str, value: int,
+             max_distance: int = PHASH_MAX_DISTANCE) -> List[Tuple[str, int]]:
+        """
+        找出相近的照片
+        返回: [(帳號, 距離), ...]，非全域模式只返回同一帳號的
+        """
+        with self._lock:
+            self._refresh()
+            return self._find_loaded(username, value, max_distance)
+
+    def _find_loaded(self, username: str, value: int, max_distance: int) -> List[Tuple[str, int]]:
+        found = [(self._usernames[code], d) for code, d in self.index.search(value, max_distance)]
+        if not self.global_scope:
+            found = [m for m in found if m[0] == username]
+        return found
+
+    def is_near_duplicate(self, username: str, value: int,
+                          max_distance: int = PHASH_MAX_DISTANCE) -> bool:
+        """是否已經有很相似的照片"""
+        return bool(self.find(username, value, max_distance))
+
+    def add(self, username: str, value: int):
+        """記錄一張照片的感知雜湊"""
+        self._conn().execute(
+            'INSERT INTO perceptual_hashes (username, phash, created_at) VALUES (?, ?, ?)',
+            (username, _to_signed(value), datetime.now().isoformat())
+        )
+
+    def check_and_add(self, username: str, value: int,
+                      max_distance: int = PHASH_MAX_DISTANCE) -> bool:
+        """
+        原子地檢查並記錄 (兩個 worker 同時收到很相似的照片，只有一個會通過)
+        收件時用來預留照片，處理失敗時再用 remove() 放掉
+        返回: True 表示近似重複 (這時不會記錄)
+        """
+        conn = self._conn()
+        with self._lock, db.transaction(conn):
+            self._refresh()
+            if self._find_loaded(username, value, max_distance):
+                return True
+            conn.execute(
+                'INSERT INTO perceptual_hashes (username, phash, created_at) VALUES (?, ?, ?)',
+                (username, _to_signed(value), datetime.now().isoformat())
+            )
+            return False
+
+    def remove(self, username: str, value: int) -> bool:
+        """刪除一筆感知雜湊 (預留的照片沒有處理成功時)，返回是否有刪除"""
+        with db.transaction(self._conn()) as conn:
+            row = conn.execute(
+                'SELECT id FROM perceptual_hashes WHERE username = ? AND phash = ? ORDER BY id DESC LIMIT 1',
+                (username, _to_signed(value))
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute('DELETE FROM perceptual_hashes WHERE id = ?', (row[0],))
+            conn.execute('INSERT INTO perceptual_hash_removals (row_id, username, phash) VALUES (?, ?, ?)',
+                         (row[0], username, _to_signed(value)))
+        return True
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index() -> NearDuplicateIndex:
+    """取得全域共用的近似重複索引 (第一次呼叫時建立)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from dedup_index import DEDUP_SCOPE
+                _index = NearDuplicateIndex(db.db_path(DEFAULT_DB_NAME),
+                                            global_scope=(DEDUP_SCOPE == 'global'))
+    return _index
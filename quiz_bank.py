@@ -0,0 +1,297 @@
+"""
+題庫 - 依物品類別事先準備好題目，掃描時直接抽題，不用每次都請 AI 出題
+
+- 類別沿用 web_app/題目.py 的分類 (plastic_bottle、paper_cup ... unknown)，
+  由辨識結果的關鍵字判斷
+- 題目存在 SQLite (data/quiz_bank.db)，第一次啟動時匯入 quiz_bank_seed.json
+- 同一個使用者不會抽到看過的題目；某個類別全部看完才重新開始
+  (呼叫端可以請 AI 出題時不重新開始，改由 AI 出一題新的)
+- 某個類別的題目不夠時，背景請 AI 一次出一批，驗證格式後加入題庫
+  (多個 worker 同時發現不夠時，只有一個會去補)
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import db
+
+DEFAULT_DB_NAME = 'quiz_bank.db'
+SEED_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'quiz_bank_seed.json')
+
+# 與 web_app/題目.py 相同的類別；每個類別的中文名稱與辨識結果裡的關鍵字
+# (順序有意義：「鋁箔包」要比「鋁」先判斷，「紙杯」要比「紙」先判斷)
+CATEGORIES = {
+    'carton': ('鋁箔包、利樂包等飲料紙盒', ['鋁箔包', '利樂包', '新鮮屋', '牛奶盒', '牛奶紙盒', '飲料紙盒', '紙盒包', '紙盒']),
+    'paper_cup': ('紙杯', ['紙杯', '紙碗', '咖啡杯']),
+    'paper_bag': ('紙袋', ['紙袋', '牛皮紙']),
+    'plastic_bottle': ('寶特瓶、塑膠瓶', ['寶特瓶', '塑膠瓶', '保特瓶', 'PET']),
+    'can': ('鋁罐、鐵罐等金屬罐', ['鋁罐', '鐵罐', '金屬罐', '易開罐', '罐頭', '鋁', '鐵']),
+    'glass': ('玻璃瓶', ['玻璃']),
+    'unknown': ('一般資源回收', []),
+}
+UNKNOWN = 'unknown'
+
+# 使用者還沒看過的題目少於這個數量時，背景補題
+QUIZ_BANK_MIN_UNSEEN = int(os.environ.get("QUIZ_BANK_MIN_UNSEEN", "3"))
+# 每個類別題目總數的上限 (到了就不再補)
+QUIZ_BANK_MAX_PER_CATEGORY = int(os.environ.get("QUIZ_BANK_MAX_PER_CATEGORY", "200"))
+# 一次請 AI 出幾題
+QUIZ_BANK_REFILL_BATCH = int(os.environ.get("QUIZ_BANK_REFILL_BATCH", "5"))
+# 同一個類別補題的最短間隔 (秒)，避免 AI 一直出重複的題目時不停重試
+QUIZ_BANK_REFILL_INTERVAL = float(os.environ.get("QUIZ_BANK_REFILL_INTERVAL", "300"))
+
+
+def categorize(item_description: str) -> str:
+    """由辨識結果 (例如「這是一個寶特瓶，材質是塑膠。」) 判斷類別"""
+    text = unicodedata.normalize('NFKC', item_description or '').upper()
+    for category, (_, keywords) in CATEGORIES.items():
+        if any(keyword in text for keyword in keywords):
+            return category
+    return UNKNOWN
+
+
+def validate_quiz(question: str, options: str, answer: str, explanation: str):
+    """檢查題目是否可以使用，不行時丟出 ValueError"""
+    if not question.strip() or not explanation.strip():
+        raise ValueError("題目或解析是空的")
+    letters = re.findall(r'\(([A-D])\)', options)
+    if len(letters) < 2 or len(set(letters)) != len(letters):
+        raise ValueError("選項格式不符")
+    if answer not in letters:
+        raise ValueError("答案不在選項中")
+    if len(question) > 200 or len(options) > 400 or len(explanation) > 400:
+        raise ValueError("題目太長")
+
+
+def _fingerprint(question: str) -> str:
+    """題目去掉空白與標點後的雜湊，用來擋掉重複的題目"""
+    text = re.sub(r'[\s\W_]+', '', unicodedata.normalize('NFKC', question))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def build_refill_prompt(category: str, count: int, existing: List[str]) -> str:
+    """請 AI 一次出 count 題的提示詞 (附上現有題目避免重複)"""
+    name = CATEGORIES[category][0]
+    avoid = '\n'.join(f'- {q}' for q in existing[-30:])
+    return (f"針對【{name}】出 {count} 個不同的回收知識選擇題，適合一般民眾，內容要符合台灣的資源回收規定。\n"
+            f"不要和以下題目重複：\n{avoid}\n"
+            "每一題的格式必須嚴格遵守，題目之間空一行：\n"
+            "QUESTION_START 題目 QUESTION_END \nOPTIONS_START (A)選項 (B)選項 (C)選項 (D)選項 OPTIONS_END \n"
+            "ANSWER_START 答案字母 ANSWER_END \nEXPLANATION_START 解析 EXPLANATION_END")
+
+
+def parse_quizzes(text: str) -> List[Tuple[str, str, str, str]]:
+    """從 AI 回傳的文字解析出所有格式正確的題目 (格式不符的略過)"""
+    import QA
+    quizzes = []
+    for block in re.findall(r'QUESTION_START.*?EXPLANATION_END', text, re.S):
+        try:
+            quiz = QA.parse_quiz(block)
+            validate_quiz(*quiz)
+        except ValueError:
+            continue
+        quizzes.append(quiz)
+    return quizzes
+
+
+class QuizBank:
+    """存在 SQLite 的題庫，題目內容在每個行程的記憶體中保留一份"""
+
+    def __init__(self, path: str, seed_path: Optional[str] = SEED_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # {類別: {題目編號: (題目, 選項, 答案, 解析)}}
+        self._pools: Dict[str, Dict[int, Tuple[str, str, str, str]]] = {c: {} for c in CATEGORIES}
+        self._last_id = 0
+        self._refilling = set()
+        with db.transaction(self._conn()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS quiz_questions ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' category TEXT NOT NULL,'
+                ' question TEXT NOT NULL,'
+                ' options TEXT NOT NULL,'
+                ' answer TEXT NOT NULL,'
+                ' explanation TEXT NOT NULL,'
+                ' source TEXT NOT NULL,'
+                ' fingerprint TEXT NOT NULL UNIQUE,'
+                ' created_at REAL NOT NULL'
+                ')'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS quiz_served ('
+                ' username TEXT NOT NULL,'
+                ' category TEXT NOT NULL,'
+                ' question_id INTEGER NOT NULL,'
+                ' PRIMARY KEY (username, category, question_id)'
+                ') WITHOUT ROWID'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS quiz_refills ('
+                ' category TEXT PRIMARY KEY,'
+                ' next_allowed REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            empty = conn.execute('SELECT 1 FROM quiz_questions LIMIT 1').fetchone() is None
+        if empty and seed_path and os.path.exists(seed_path):
+            self.import_seed(seed_path)
+        self._refresh()
+
+    def _conn(self):
+        return db.get_connection(self.path)
+
+    # === 題目 ===
+
+    def import_seed(self, path: str) -> int:
+        """匯入題庫 JSON ({類別: [{question, options, answer, explanation}, ...]})，返回新增題數"""
+        with open(path, 'r', encoding='utf-8') as f:
+            seed = json.load(f)
+        added = 0
+        for category, items in seed.items():
+            quizzes = [(q['question'], q['options'], q['answer'], q['explanation']) for q in items]
+            added += self.add(category, quizzes, source='seed')
+        return added
+
+    def add(self, category: str, quizzes, source: str = 'model') -> int:
+        """加入題目 (重複或格式不符的略過)，返回新增題數"""
+        if category not in CATEGORIES:
+            raise ValueError(f"未知的類別: {category}")
+        rows = []
+        for quiz in quizzes:
+            try:
+                validate_quiz(*quiz)
+            except ValueError:
+                continue
+            rows.append((category, *quiz, source, _fingerprint(quiz[0]), time.time()))
+        with db.transaction(self._conn()) as conn:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO quiz_questions'
+                ' (category, question, options, answer, explanation, source, fingerprint, created_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            added = conn.total_changes - before
+        self._refresh()
+        return added
+
+    def _refresh(self):
+        """載入其他行程新增的題目"""
+        with self._lock:
+            rows = self._conn().execute(
+                'SELECT id, category, question, options, answer, explanation'
+                ' FROM quiz_questions WHERE id > ? ORDER BY id', (self._last_id,)
+            ).fetchall()
+            for qid, category, *quiz in rows:
+                self._pools.setdefault(category, {})[qid] = tuple(quiz)
+                self._last_id = qid
+
+    def size(self, category: str) -> int:
+        with self._lock:
+            return len(self._pools.get(category, ()))
+
+    # === 抽題 ===
+
+    def pick(self, username: str, category: str,
+             recycle: bool = True) -> Optional[Tuple[int, Tuple[str, str, str, str]]]:
+        """
+        幫使用者抽一題沒看過的題目
+        返回: (題目編號, (題目, 選項, 答案, 解析))，這個類別沒有題目時返回 None
+        recycle 為 False 時，全部看過也返回 None (不重新開始)
+        """
+        if category not in CATEGORIES:
+            category = UNKNOWN
+        self._refresh()
+        conn = self._conn()
+        with db.transaction(conn):
+            seen = {row[0] for row in conn.execute(
+                'SELECT question_id FROM quiz_served WHERE username = ? AND category = ?',
+                (username, category)
+            )}
+            with self._lock:
+                pool = self._pools.get(category, {})
+                unseen = [qid for qid in pool if qid not in seen]
+                if not unseen and pool and recycle:
+                    # 全部看過了：重新開始 (題庫同時在背景補題)
+                    conn.execute('DELETE FROM quiz_served WHERE username = ? AND category = ?',
+                                 (username, category))
+                    unseen = list(pool)
+                if not unseen:
+                    picked = None
+                else:
+                    qid = random.choice(unseen)
+                    picked = (qid, pool[qid])
+            if picked is not None:
+                conn.execute('INSERT OR IGNORE INTO quiz_served (username, category, question_id)'
+                             ' VALUES (?, ?, ?)', (username, category, picked[0]))
+        if len(unseen) - 1 < QUIZ_BANK_MIN_UNSEEN:
+            self.refill_async(category)
+        return picked
+
+    # === 補題 ===
+
+    def _claim_refill(self, category: str) -> bool:
+        """取得補題的權利 (所有行程共用，同一個類別一段時間內只補一次)"""
+        if self.size(category) >= QUIZ_BANK_MAX_PER_CATEGORY:
+            return False
+        now = time.time()
+        with db.transaction(self._conn()) as conn:
+            row = conn.execute('SELECT next_allowed FROM quiz_refills WHERE category = ?',
+                               (category,)).fetchone()
+            if row is not None and row[0] > now:
+                return False
+            conn.execute('INSERT OR REPLACE INTO quiz_refills (category, next_allowed) VALUES (?, ?)',
+                         (category, now + QUIZ_BANK_REFILL_INTERVAL))
+        return True
+
+    def refill(self, category: str, count: int = QUIZ_BANK_REFILL_BATCH) -> int:
+        """請 AI 出一批題目加入題庫，返回新增題數 (沒有 API 或被其他行程搶先時返回 0)"""
+        from async_client import get_client
+        client = get_client()
+        if not client.model or not self._claim_refill(category):
+            return 0
+        with self._lock:
+            existing = [quiz[0] for quiz in self._pools.get(category, {}).values()]
+        prompt = build_refill_prompt(category, count, existing)
+        try:
+            response = client.run(client.generate(prompt))
+        except Exception as e:
+            print(f"題庫補題失敗 ({category}): {e}")
+            return 0
+        return self.add(category, parse_quizzes(response.text))
+
+    def refill_async(self, category: str):
+        """在背景執行緒補題 (同一個行程同一個類別同時只有一個)"""
+        with self._lock:
+            if category in self._refilling:
+                return
+            self._refilling.add(category)
+
+        def run():
+            try:
+                self.refill(category)
+            finally:
+                with self._lock:
+                    self._refilling.discard(category)
+
+        threading.Thread(target=run, name=f'quiz-refill-{category}', daemon=True).start()
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+
+def get_quiz_bank() -> QuizBank:
+    """取得全域共用的題庫 (第一次呼叫時建立)"""
+    global _bank
+    if _bank is None:
+        with _bank_lock:
+            if _bank is None:
+                _bank = QuizBank(db.db_path(DEFAULT_DB_NAME))
+    return _bank
@@ -0,0 +1,226 @@
+"""
+頻率限制 - 每日上傳張數、每分鐘掃描請求數 (所有 gunicorn worker 共用 data/rate_limits.db)
+
+取代 app.py 記憶體裡的 daily_usage (每個 worker 各算各的、重新啟動就歸零)
+與 auth.py 另外一套上限不同的 daily_upload 計數器。
+
+- gemini_requests：所有行程加總的 Gemini API 請求數 (key 固定為 GLOBAL)，
+  async_client 每次呼叫前扣一次，開幾個 worker 都不會超過 GEMINI_RATE_PER_MINUTE
+- 滑動視窗：每次使用記一筆 (時間, 數量)，每個視窗內的總數不能超過上限；
+  同一個限制可以有好幾個視窗 (例如 24 小時 10 張 + 每分鐘 3 張)
+- acquire：在同一個寫入交易 (BEGIN IMMEDIATE) 裡檢查並扣除，多個行程同時搶也不會超過上限
+- refund：失敗的掃描退還 (用 acquire 返回的編號；整筆退還時重複呼叫不會多退)
+- remaining / used：讀本行程的快取，不碰資料庫 (只有快取裡沒有這個帳號時讀一次)；
+  本行程的 acquire / refund 在交易裡重新讀取並更新快取，所以每次寫入都會跟資料庫對齊。
+  其他 worker 的修改要等本行程下一次幫這個帳號 acquire / refund 才看到
+  (只影響顯示，扣除一定在交易裡檢查)；需要定時重讀的話設定 RATE_LIMIT_CACHE_TTL 秒數。
+  快取最多 RATE_LIMIT_CACHE_ENTRIES 個帳號，超過時丟掉最久沒用到的
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import db
+import metrics
+
+DEFAULT_DB_NAME = 'rate_limits.db'
+
+MINUTE = 60
+DAY = 24 * 60 * 60
+
+UPLOADS = 'uploads'              # 掃描的照片張數 (批次掃描一張算一次)
+SCAN_REQUESTS = 'scan_requests'  # /scan、/scan/batch 的請求次數
+GEMINI_REQUESTS = 'gemini_requests'  # Gemini API 請求數 (所有行程共用一個配額)
+GLOBAL = ''                      # 不分帳號的限制用的 key
+
+# 24 小時內最多掃描幾張
+UPLOAD_DAILY_LIMIT = int(os.environ.get("UPLOAD_DAILY_LIMIT", "10"))
+# 每分鐘最多送出幾次掃描請求 (0 表示不限制)
+SCAN_REQUESTS_PER_MINUTE = int(os.environ.get("SCAN_REQUESTS_PER_MINUTE", "20"))
+# Gemini API 每分鐘配額 (所有 worker 加總；0 表示不限制)
+GEMINI_RATE_PER_MINUTE = int(os.environ.get("GEMINI_RATE_PER_MINUTE", "60"))
+# 快取多久後讀取時重讀資料庫 (秒)；沒有設定時讀取不碰資料庫，只在 acquire / refund 時更新
+_CACHE_TTL = os.environ.get("RATE_LIMIT_CACHE_TTL")
+RATE_LIMIT_CACHE_TTL = float(_CACHE_TTL) if _CACHE_TTL else None
+# 每個行程最多快取幾組 (名稱, 帳號) 的使用紀錄
+RATE_LIMIT_CACHE_ENTRIES = int(os.environ.get("RATE_LIMIT_CACHE_ENTRIES", "10000"))
+
+Rule = Tuple[float, int]  # (視窗秒數, 上限)
+
+LIMITS: Dict[str, Tuple[Rule, ...]] = {
+    UPLOADS: ((DAY, UPLOAD_DAILY_LIMIT),),
+    SCAN_REQUESTS: tuple(rule for rule in ((MINUTE, SCAN_REQUESTS_PER_MINUTE),) if rule[1] > 0),
+    GEMINI_REQUESTS: tuple(rule for rule in ((MINUTE, GEMINI_RATE_PER_MINUTE),) if rule[1] > 0),
+}
+
+RATE_LIMIT_DECISIONS = metrics.counter('reborn_rate_limit_total', "頻率限制的結果 (granted / denied / refunded)",
+                                       ('name', 'outcome'))
+
+Event = Tuple[int, float, int]  # (編號, 時間, 數量)
+
+
+class Grant(NamedTuple):
+    """acquire 扣除的結果，refund 時要用到 id"""
+    id: int
+    amount: int
+
+
+class RateLimiter:
+    """以 SQLite 為底的滑動視窗頻率限制"""
+
+    def __init__(self, path: str, limits: Optional[Dict[str, Sequence[Rule]]] = None,
+                 cache_ttl: Optional[float] = RATE_LIMIT_CACHE_TTL, cache_entries: int = RATE_LIMIT_CACHE_ENTRIES):
+        self.path = path
+        # {名稱: ((視窗秒數, 上限), ...)}；沒有規則的名稱不限制
+        self.limits = dict(LIMITS if limits is None else limits)
+        self.cache_ttl = cache_ttl
+        self.cache_entries = cache_entries
+        # {(名稱, key): (讀取時間, 視窗內的使用紀錄)}，最近用到的在後面
+        self._cache: 'OrderedDict[Tuple[str, str], Tuple[float, List[Event]]]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+        with db.transaction(self._conn()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_events ('
+                ' id INTEGER PRIMARY KEY,'
+                ' name TEXT NOT NULL,'
+                ' key TEXT NOT NULL,'
+                ' at REAL NOT NULL,'
+                ' amount INTEGER NOT NULL'
+                ')'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS rate_events_key ON rate_events (name, key, at)')
+
+    def _conn(self):
+        return db.get_connection(self.path)
+
+    def _horizon(self, name: str) -> float:
+        return max((window for window, _ in self.limits.get(name, ())), default=0)
+
+    def _load(self, conn, name: str, key: str, now: float) -> List[Event]:
+        events = conn.execute(
+            'SELECT id, at, amount FROM rate_events WHERE name = ? AND key = ? AND at > ?',
+            (name, key, now - self._horizon(name))
+        ).fetchall()
+        with self._cache_lock:
+            self._cache[(name, key)] = (time.monotonic(), events)
+            self._cache.move_to_end((name, key))
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return events
+
+    def _cached_events(self, name: str, key: str, now: float) -> List[Event]:
+        """快取的使用紀錄，沒有 (或設定了 cache_ttl 而且已經超過) 時重新讀取"""
+        with self._cache_lock:
+            cached = self._cache.get((name, key))
+            if cached is not None and (self.cache_ttl is None or time.monotonic() - cached[0] < self.cache_ttl):
+                self._cache.move_to_end((name, key))
+                return cached[1]
+        return self._load(self._conn(), name, key, now)
+
+    def _available(self, name: str, events: List[Event], now: float) -> Optional[int]:
+        """還可以用多少 (沒有任何規則時為 None，表示不限制)"""
+        available = None
+        for window, limit in self.limits.get(name, ()):
+            used = sum(amount for _, at, amount in events if at > now - window)
+            available = limit - used if available is None else min(available, limit - used)
+        return None if available is None else max(available, 0)
+
+    # === 扣除與退還 ===
+
+    def acquire(self, name: str, key: str, amount: int = 1, partial: bool = False,
+                now: Optional[float] = None) -> Optional[Grant]:
+        """
+        檢查並扣除 amount (原子操作)
+        partial=True 時不夠就扣剩下的 (至少 1)，否則不夠就整筆拒絕
+        返回: Grant (實際扣除的數量)，被拒絕時為 None
+        """
+        now = time.time() if now is None else now
+        with db.transaction(self._conn()) as conn:
+            # 順便清掉已經超出所有視窗的紀錄
+            conn.execute('DELETE FROM rate_events WHERE name = ? AND key = ? AND at <= ?',
+                         (name, key, now - self._horizon(name)))
+            events = self._load(conn, name, key, now)
+            available = self._available(name, events, now)
+            if available is None or available >= amount:
+                granted = amount
+            else:
+                granted = available if partial else 0
+            if granted <= 0:
+                RATE_LIMIT_DECISIONS.inc(name=name, outcome='denied')
+                return None
+            cur = conn.execute('INSERT INTO rate_events (name, key, at, amount) VALUES (?, ?, ?, ?)',
+                               (name, key, now, granted))
+            events.append((cur.lastrowid, now, granted))
+        RATE_LIMIT_DECISIONS.inc(name=name, outcome='granted')
+        return Grant(cur.lastrowid, granted)
+
+    def refund(self, name: str, key: str, grant_id: int, amount: Optional[int] = None) -> bool:
+        """
+        退還 acquire 扣除的數量 (amount 為 None 時整筆退還)
+        返回: 是否有退還 (已經整筆退還過、或已經超出視窗被清掉時為 False)
+        """
+        now = time.time()
+        with db.transaction(self._conn()) as conn:
+            if amount is None:
+                cur = conn.execute('DELETE FROM rate_events WHERE id = ?', (grant_id,))
+            else:
+                cur = conn.execute('UPDATE rate_events SET amount = MAX(amount - ?, 0) WHERE id = ? AND amount > 0',
+                                   (amount, grant_id))
+            refunded = cur.rowcount > 0
+            self._load(conn, name, key, now)
+        if refunded:
+            RATE_LIMIT_DECISIONS.inc(name=name, outcome='refunded')
+        return refunded
+
+    # === 讀取 ===
+
+    def remaining(self, name: str, key: str) -> Optional[int]:
+        """還可以用多少 (讀快取，不碰資料庫)；沒有限制時為 None"""
+        if not self.limits.get(name):
+            return None
+        now = time.time()
+        return self._available(name, self._cached_events(name, key, now), now)
+
+    def used(self, name: str, key: str) -> int:
+        """最長的視窗內用了多少"""
+        if not self.limits.get(name):
+            return 0
+        now = time.time()
+        since = now - self._horizon(name)
+        return sum(amount for _, at, amount in self._cached_events(name, key, now) if at > since)
+
+    def retry_after(self, name: str, key: str, amount: int = 1) -> float:
+        """
+        被 acquire 拒絕之後，最快幾秒後會有 amount 的空間
+        (依本行程的快取估計；acquire 剛讀過資料庫，其他行程搶先的話再等一次)
+        """
+        now = time.time()
+        events = sorted(self._cached_events(name, key, now), key=lambda e: e[1])
+        wait = 0.0
+        for window, limit in self.limits.get(name, ()):
+            inside = [(at, n) for _, at, n in events if at > now - window]
+            excess = sum(n for _, n in inside) + amount - limit
+            # 最舊的紀錄一筆一筆離開視窗，直到空出 amount
+            for at, n in inside:
+                if excess <= 0:
+                    break
+                excess -= n
+                wait = max(wait, at + window - now)
+        return wait
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """取得全域共用的頻率限制 (第一次呼叫時建立)"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(db.db_path(DEFAULT_DB_NAME))
+    return _limiter
@@ -1,29 +1,20 @@
-from PIL import Image
-import os
-
-# Open the original cat image
-img_path = r"C:\Users\huang\OneDrive\桌面\資處科專題\coffee\static\cat.png"
-img = Image.open(img_path)
+"""
+把 static/cat.png 的白色背景變透明 (R、G、B 都大於 250 的像素)
+其他圖片或參數請直接用 asset_tools.py：
+    python asset_tools.py key static/cat.png --mode white --threshold 250
+"""
 
-# Convert to RGBA if not already
-img = img.convert("RGBA")
+import os
 
-# Get pixel data
-datas = img.getdata()
+from PIL import Image
 
-# Replace white pixels with transparent
-newData = []
-for item in datas:
-    # If pixel is white or near-white (R, G, B all > 250)
-    if item[0] > 250 and item[1] > 250 and item[2] > 250:
-        # Make it transparent
-        newData.append((255, 255, 255, 0))
-    else:
-        newData.append(item)
+from asset_tools import key_background, save_image
 
-img.putdata(newData)
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
-# Save with transparency
-output_path = r"C:\Users\huang\OneDrive\桌面\資處科專題\coffee\static\cat.png"
-img.save(output_path, "PNG")
-print("Done! White background removed.")
+if __name__ == '__main__':
+    img_path = os.path.join(BASE_DIR, 'static', 'cat.png')
+    with Image.open(img_path) as img:
+        result = key_background(img, mode='white', threshold=250)
+    save_image(result, img_path)
+    print("Done! White background removed.")
@@ -0,0 +1,118 @@
+"""
+頁面輸出快取 - 同一個模板 + 同樣的參數 → 同一份 HTML 與 ETag
+
+index.html 的內容只跟帳號、今日剩餘次數、錯誤訊息有關，result.html 在工作完成後就不會變，
+所以整頁輸出可以依參數快取：
+- 命中時不用再跑 Jinja，瀏覽器帶 If-None-Match 時直接返回 304
+- 每個帳號的頁面記在一起，經驗值或上傳次數改變時 invalidate_user() 一次清掉
+  (參數本身就是 key 的一部分，就算其他 worker 沒收到清除也不會送出舊的內容)
+- 模板編譯結果存在 data/jinja_cache，gunicorn worker 重新啟動時不用重新編譯
+
+回應用 Cache-Control: private, no-cache：瀏覽器每次都要來確認，但內容沒變時只收到 304。
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+from flask import make_response, render_template, request
+from jinja2 import FileSystemBytecodeCache
+
+import db
+
+# 每個行程最多快取幾頁 (0 = 不快取)
+RENDER_CACHE_ENTRIES = int(os.environ.get("RENDER_CACHE_ENTRIES", "4096"))
+JINJA_CACHE_DIR = 'jinja_cache'
+
+
+class RenderCache:
+    """依 (模板, 參數) 快取整頁 HTML，LRU"""
+
+    def __init__(self, max_entries: int = RENDER_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._pages: 'OrderedDict[tuple, Tuple[str, str]]' = OrderedDict()
+        self._by_user: Dict[Optional[str], Set[tuple]] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+    @staticmethod
+    def _key(template: str, user: Optional[str], context: Dict[str, Hashable]) -> tuple:
+        return (template, user) + tuple(sorted(context.items()))
+
+    def render(self, template: str, user: Optional[str] = None, shared: Optional[Dict] = None,
+               **context) -> Tuple[str, str]:
+        """
+        返回 (HTML, ETag)
+        context 的值必須可以當 dict key (字串、數字、tuple ...)；
+        shared 是每個請求都一樣的參數 (模組層級的資料)，不算進 key
+        """
+        key = self._key(template, user, context)
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                self.stats['hits'] += 1
+                return page
+        body = render_template(template, **(shared or {}), **context)
+        page = (body, hashlib.blake2b(body.encode('utf-8'), digest_size=16).hexdigest())
+        self.stats['misses'] += 1
+        if self.max_entries <= 0:
+            return page
+        with self._lock:
+            self._pages[key] = page
+            self._by_user.setdefault(user, set()).add(key)
+            while len(self._pages) > self.max_entries:
+                old, _ = self._pages.popitem(last=False)
+                keys = self._by_user.get(old[1])
+                if keys is not None:
+                    keys.discard(old)
+                    if not keys:
+                        del self._by_user[old[1]]
+        return page
+
+    def respond(self, template: str, user: Optional[str] = None, status: int = 200,
+                shared: Optional[Dict] = None, **context):
+        """輸出頁面的回應 (GET 帶相同 ETag 時為 304)"""
+        body, etag = self.render(template, user, shared, **context)
+        response = make_response(body, status)
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+        if response.status_code == 304:
+            self.stats['not_modified'] += 1
+        return response
+
+    def invalidate_user(self, user: Optional[str]):
+        """清掉某個帳號的所有頁面 (經驗值、上傳次數改變時)"""
+        with self._lock:
+            for key in self._by_user.pop(user, ()):
+                self._pages.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._by_user.clear()
+
+
+def init_app(app):
+    """模板編譯結果存到 data/jinja_cache (所有 worker 共用)"""
+    directory = db.db_path(JINJA_CACHE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> RenderCache:
+    """取得全域共用的頁面快取 (第一次呼叫時建立)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RenderCache()
+    return _cache
@@ -0,0 +1,142 @@
+"""
+AI 結果快取 - 同一張照片、同一個物品不用再問一次 Gemini
+
+兩層：
+- 記憶體 LRU (每個行程各一份，有 TTL)：最快，命中只要幾微秒
+- SQLite (所有 worker 共用)：其他 worker 問過的結果也能直接使用
+
+key 由呼叫端決定：辨識用圖片 sha256，出題用正規化後的物品描述。
+值必須能轉成 JSON。
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import db
+import metrics
+
+DEFAULT_DB_NAME = 'result_cache.db'
+
+# 快取保存時間 (秒)，預設 7 天
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+# 每個行程記憶體中最多保留幾筆
+RESULT_CACHE_MEMORY_ENTRIES = int(os.environ.get("RESULT_CACHE_MEMORY_ENTRIES", "1024"))
+# 每寫入這麼多次，順便清掉資料庫裡過期的資料
+_PURGE_EVERY = 500
+
+CACHE_REQUESTS = metrics.counter('reborn_result_cache_requests_total', "結果快取查詢次數",
+                                 ('namespace', 'outcome'))
+
+
+class ResultCache:
+    """記憶體 LRU + SQLite 的兩層快取"""
+
+    def __init__(self, path: Optional[str], ttl: float = RESULT_CACHE_TTL,
+                 max_entries: int = RESULT_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        # {namespace: {'memory_hit': n, 'disk_hit': n, 'miss': n}}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        if path is not None:
+            with db.transaction(self._conn()) as conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS cache_entries ('
+                    ' namespace TEXT NOT NULL,'
+                    ' key TEXT NOT NULL,'
+                    ' value TEXT NOT NULL,'
+                    ' expires_at REAL NOT NULL,'
+                    ' PRIMARY KEY (namespace, key)'
+                    ') WITHOUT ROWID'
+                )
+
+    def _conn(self):
+        return db.get_connection(self.path)
+
+    def _count(self, namespace: str, outcome: str):
+        with self._lock:
+            counts = self._stats.setdefault(namespace, {'memory_hit': 0, 'disk_hit': 0, 'miss': 0})
+            counts[outcome] += 1
+        CACHE_REQUESTS.inc(namespace=namespace, outcome=outcome)
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """讀取快取，沒有或已過期返回 None"""
+        now = time.time()
+        mkey = (namespace, key)
+        with self._lock:
+            entry = self._memory.get(mkey)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(mkey)
+                else:
+                    del self._memory[mkey]
+                    entry = None
+        if entry is not None:
+            self._count(namespace, 'memory_hit')
+            return entry[1]
+
+        if self.path is not None:
+            row = self._conn().execute(
+                'SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?',
+                (namespace, key)
+            ).fetchone()
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                self._remember(mkey, row[1], value)
+                self._count(namespace, 'disk_hit')
+                return value
+
+        self._count(namespace, 'miss')
+        return None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        """寫入快取 (兩層都寫)"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._remember((namespace, key), expires_at, value)
+        if self.path is None:
+            return
+        self._conn().execute(
+            'INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+            (namespace, key, json.dumps(value, ensure_ascii=False), expires_at)
+        )
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def _remember(self, mkey, expires_at, value):
+        with self._lock:
+            self._memory[mkey] = (expires_at, value)
+            self._memory.move_to_end(mkey)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        """刪除資料庫中已過期的資料，返回刪除筆數"""
+        cur = self._conn().execute('DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),))
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各 namespace 的命中 / 未命中次數 (本行程)"""
+        with self._lock:
+            return {ns: dict(counts) for ns, counts in self._stats.items()}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """取得全域共用的結果快取 (第一次呼叫時建立)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(db.db_path(DEFAULT_DB_NAME))
+    return _cache
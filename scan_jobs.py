@@ -0,0 +1,229 @@
+"""
+掃描工作流水線 - /scan 收到照片後只負責存檔、排入佇列，馬上返回工作編號
+
+階段：
+    recognize：算感知雜湊、檢查近似重複、辨識
+               (本機分類器有把握時直接用它的類別，否則呼叫 AI，AI 沒有回答就失敗；
+                GEMINI_FUSED_SCAN：同一次請求也回傳類別代碼與題目，類別記下來給本機分類器訓練)
+    quiz：優先用辨識時一起出的題目 (針對這個物品)，沒有時依類別從題庫抽題，
+          題庫沒有沒看過的題目時請 AI 出題 (沒有 AI 才重複出看過的題目)；寫入上傳紀錄
+          請 AI 出題時用串流模式，題目、選項一收到就寫進工作結果 ('partial')，
+          結果頁透過 SSE 馬上顯示 (答案與解析要等作答後才給)
+    done / failed
+
+辨識和出題分成兩個階段：一張照片辨識完就放回佇列等出題，
+worker 可以馬上去辨識下一張，不同照片的兩個階段同時進行。
+(後面階段優先認領，已經辨識好的照片不會被新照片插隊)
+
+單獨執行 worker (不跟網頁同一個行程)：
+    python scan_jobs.py
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from PIL import UnidentifiedImageError
+
+import QA
+import auth
+import db
+import metrics
+import rate_limit
+from async_client import get_client
+from local_classifier import describe, get_label_store, get_local_classifier
+from quiz_bank import categorize, get_quiz_bank
+from upload_storage import get_upload_storage
+from jobs import JobQueue, WorkerPool, JobFailed, DEFAULT_DB_NAME, JOB_WORKERS, DONE, FAILED
+
+RECOGNIZE = 'recognize'
+QUIZ = 'quiz'
+
+# 工作的標記位元
+FLAG_ANSWERED = 1   # 已經作答過 (經驗值只能拿一次)
+FLAG_REFUNDED = 2   # 失敗的掃描已經退還每日次數、放掉預留的照片
+
+# 單獨執行 worker 時調低優先權，CPU 不夠時讓網頁行程先處理請求
+JOB_WORKER_NICE = int(os.environ.get("JOB_WORKER_NICE", "10"))
+
+# 出題還沒完成時就可以給前端看的段落
+PUBLIC_SECTIONS = ('question', 'options')
+
+# 被拒絕的掃描 (rate_limit / daily_limit / duplicate 在 app.py 收件時，
+# near_duplicate / invalid_image / recognition_failed 在 worker)
+SCAN_REJECTED = metrics.counter('reborn_scan_rejected_total', "被拒絕的掃描", ('reason',))
+
+
+def enqueue_scan(username: str, upload, quota: Optional[int] = None) -> str:
+    """把已存好的上傳排入佇列，返回工作編號 (quota：扣每日次數的 rate_limit.Grant 編號，失敗時退還用)"""
+    return get_scan_queue().enqueue(username, RECOGNIZE, {
+        'filename': upload.filename,
+        'sha256': upload.sha256,
+        'quota': quota,
+    })
+
+
+def run_recognize(job: Dict[str, Any]):
+    """感知雜湊 (檢查並預留) + AI 辨識"""
+    payload = job['payload']
+    user = job['username']
+    storage = get_upload_storage()
+    try:
+        image = storage.open(payload['filename'])
+    except FileNotFoundError:
+        raise JobFailed('missing_file')
+    try:
+        try:
+            perceptual_hash = QA.get_perceptual_hash(image)
+        except (UnidentifiedImageError, OSError, ValueError):
+            image.close()
+            storage.delete(payload['filename'])
+            SCAN_REJECTED.inc(reason='invalid_image')
+            raise JobFailed('invalid_image')
+
+        # 預留感知雜湊 (重試時上一次已經預留過就不用再檢查)；
+        # 記在結果裡，工作失敗時 refund_failed 才知道要放掉哪一個
+        if job['result'].get('perceptual_hash') != perceptual_hash:
+            if auth.reserve_near_duplicate_for_user(user, perceptual_hash):
+                SCAN_REJECTED.inc(reason='near_duplicate')
+                raise JobFailed('duplicate')
+            get_scan_queue().report_progress(job['id'], RECOGNIZE, {'perceptual_hash': perceptual_hash})
+
+        image.seek(0)
+        local = get_local_classifier()
+        category = local.classify(image) if local is not None else None
+        image.seek(0)
+        if category is not None:
+            result = {'item_result': describe(category), 'category': category}
+        elif QA.GEMINI_FUSED_SCAN:
+            result = get_client().scan_sync(image, image_hash=payload['sha256'])
+        else:
+            result = {'item_result': get_client().recognize_sync(image, image_hash=payload['sha256'])}
+    finally:
+        image.close()
+    if QA.is_recognize_failure(result['item_result']):
+        # 沒有辨識結果：工作失敗 (退還每日次數、不寫上傳紀錄，使用者可以重新掃描)
+        SCAN_REJECTED.inc(reason='recognition_failed')
+        raise JobFailed('recognition_failed')
+    if category is None and result.get('category'):
+        # 只記 Gemini 的答案 (本機分類器自己的答案拿來訓練只會強化錯誤)
+        get_label_store().record(payload['sha256'], payload['filename'], result['category'])
+    result = {k: result[k] for k in ('item_result', 'category', 'quiz') if result.get(k) is not None}
+    result['perceptual_hash'] = perceptual_hash
+    return QUIZ, result
+
+
+def run_quiz(job: Dict[str, Any]):
+    """出題，完成後寫入上傳紀錄 (sha256 在收件時、感知雜湊在辨識時就已經預留)"""
+    result = dict(job['result'])
+    # 辨識時一起拿到的類別比關鍵字判斷準
+    category = result.get('category') or categorize(result['item_result'])
+    fused_quiz = result.pop('quiz', None)
+    # 辨識時一起出的題目是針對這個物品的，比題庫的通用題目好
+    # 題庫的題目都看過了就請 AI 出題 (串流)，不重複出舊題目；沒有 AI 時才從頭再抽
+    picked = None
+    if fused_quiz is None:
+        picked = get_quiz_bank().pick(job['username'], category, recycle=not get_client().model)
+    if fused_quiz is not None:
+        quiz_id = None
+        question, options, answer, explanation = fused_quiz
+    elif picked is not None:
+        quiz_id, (question, options, answer, explanation) = picked
+    else:
+        quiz_id = None
+        partial = {}
+
+        def on_section(name, value):
+            if name in PUBLIC_SECTIONS:
+                partial[name] = value
+                get_scan_queue().report_progress(job['id'], QUIZ, dict(result, partial=dict(partial)))
+
+        question, options, answer, explanation = get_client().quiz_sync(
+            result['item_result'], on_section if QA.GEMINI_STREAM_QUIZ else None)
+    auth.save_to_history_for_user(job['username'], job['payload']['sha256'])
+    result.update(category=category, quiz_id=quiz_id,
+                  question=question, options=options, answer=answer, explanation=explanation)
+    return DONE, result
+
+
+HANDLERS = {RECOGNIZE: run_recognize, QUIZ: run_quiz}
+
+
+def refund_failed(job: Dict[str, Any]) -> bool:
+    """
+    失敗的掃描退還每日次數、放掉預留的照片 (收件時的 sha256、辨識時的感知雜湊)
+    (worker 標記 failed 之後呼叫，使用者不用回來看結果)
+    用 FLAG_REFUNDED 確保只做一次，返回這次有沒有退還
+    """
+    if job['stage'] != FAILED or not get_scan_queue().set_flag(job['id'], FLAG_REFUNDED):
+        return False
+    auth.release_image_for_user(job['username'], job['payload']['sha256'])
+    perceptual_hash = job['result'].get('perceptual_hash')
+    if perceptual_hash is not None:
+        auth.release_near_duplicate_for_user(job['username'], perceptual_hash)
+    quota = job['payload'].get('quota')
+    if quota is None:
+        return False
+    return rate_limit.get_rate_limiter().refund(rate_limit.UPLOADS, job['username'], quota)
+
+
+def public_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """給前端看的工作狀態 (不含答案)"""
+    status = {'job_id': job['id'], 'status': job['stage']}
+    if job['error']:
+        status['error'] = job['error']
+    result = job['result']
+    if 'item_result' in result:
+        status['item_result'] = result['item_result']
+    if job['stage'] == DONE:
+        status['question'] = result['question']
+        status['options'] = result['options']
+    else:
+        status.update(result.get('partial', {}))
+    return status
+
+
+_queue = None
+_queue_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+_pool_pid = None
+
+
+def get_scan_queue() -> JobQueue:
+    """取得全域共用的掃描佇列 (第一次呼叫時建立)"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(db.db_path(DEFAULT_DB_NAME))
+    return _queue
+
+
+def start_workers(threads: int = JOB_WORKERS) -> Optional[WorkerPool]:
+    """
+    啟動本行程的 worker 執行緒 (每個行程一次；fork 後的子行程會重新啟動)
+    threads 為 0 時不啟動，由另外執行的 scan_jobs.py 處理
+    """
+    global _pool, _pool_pid
+    if threads <= 0:
+        return None
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                pool = WorkerPool(get_scan_queue(), HANDLERS, threads, on_failed=refund_failed)
+                pool.start()
+                _pool, _pool_pid = pool, os.getpid()
+    return _pool
+
+
+if __name__ == '__main__':
+    import time
+    os.nice(JOB_WORKER_NICE)
+    start_workers(max(JOB_WORKERS, 1))
+    print(f"掃描 worker 已啟動 ({max(JOB_WORKERS, 1)} 個執行緒)，Ctrl+C 結束")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,313 @@
+"""
+伺服器端 session - cookie 只放隨機的 session id，內容存在伺服器
+
+- MemorySessionStore：存在行程記憶體 (單一行程、開發時使用)
+- SQLiteSessionStore：data/sessions.db，多個 gunicorn worker 共用 (預設)
+兩者都是依 session id 直接查一筆 (dict / 主鍵)。
+
+- 滑動期限：每次請求都把期限往後延 SESSION_LIFETIME 秒，
+  但最多每 SESSION_REFRESH_INTERVAL 秒寫一次，不會每個請求都寫資料庫
+- 登入時換一個新的 session id (regenerate)，避免 session fixation
+- 使用者摘要 (經驗值、等級、今日剩餘次數) 快取在 session 裡，
+  app.py 修改這些數值時呼叫 invalidate_summary()，其他裝置的 session 最多舊 SUMMARY_TTL 秒
+
+用法：
+    app.secret_key = sessions.load_secret_key()
+    sessions.init_app(app)
+"""
+
+import os
+import json
+import time
+import secrets
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import db
+
+DEFAULT_DB_NAME = 'sessions.db'
+SECRET_KEY_FILE = 'secret_key'
+
+# memory 或 sqlite
+SESSION_STORE = os.environ.get("SESSION_STORE", "sqlite")
+# 多久沒有任何請求就登出 (秒)，預設 7 天
+SESSION_LIFETIME = float(os.environ.get("SESSION_LIFETIME", str(7 * 24 * 3600)))
+# 沒有修改內容時，最多多久延長一次期限 (秒)
+SESSION_REFRESH_INTERVAL = float(os.environ.get("SESSION_REFRESH_INTERVAL", "60"))
+# 使用者摘要快取多久 (秒)
+SUMMARY_TTL = float(os.environ.get("SESSION_SUMMARY_TTL", "30"))
+
+SESSION_COOKIE_NAME = 'reborn_sid'
+SUMMARY_KEY = '_summary'
+
+_PURGE_EVERY = 500
+
+
+class SessionStore(ABC):
+    """session 儲存的共同介面 (expires_at 為 time.time() 的秒數)"""
+
+    @abstractmethod
+    def load(self, sid: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """返回 (內容, 期限)，不存在或已過期返回 None"""
+
+    @abstractmethod
+    def save(self, sid: str, data: Dict[str, Any], expires_at: float):
+        """寫入內容並設定期限 (不存在時新增)"""
+
+    @abstractmethod
+    def touch(self, sid: str, expires_at: float):
+        """只延長期限，不改內容"""
+
+    @abstractmethod
+    def delete(self, sid: str):
+        """刪除 session (登出、換 session id)"""
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """刪除已過期的 session，返回刪除筆數"""
+
+
+class MemorySessionStore(SessionStore):
+    """存在本行程記憶體的 session (多個 worker 之間不共用)"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def load(self, sid):
+        entry = self._data.get(sid)
+        if entry is None or entry[0] <= time.time():
+            return None
+        # 存 JSON 字串：每個請求拿到自己的一份，跟 SQLite 版本行為一致
+        return json.loads(entry[1]), entry[0]
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._data[sid] = (expires_at, json.dumps(data, ensure_ascii=False))
+            self._writes += 1
+            purge = self._writes % _PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is not None:
+                self._data[sid] = (expires_at, entry[1])
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (expires_at, _) in self._data.items() if expires_at <= now]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """存在 SQLite 的 session，所有 worker 行程共用"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writes = 0
+        with db.transaction(self._conn()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                ' sid TEXT PRIMARY KEY,'
+                ' data TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires_at)')
+
+    def _conn(self):
+        return db.get_connection(self.path)
+
+    def load(self, sid):
+        row = self._conn().execute(
+            'SELECT data, expires_at FROM sessions WHERE sid = ?', (sid,)
+        ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def save(self, sid, data, expires_at):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+            (sid, json.dumps(data, ensure_ascii=False), expires_at)
+        )
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def touch(self, sid, expires_at):
+        self._conn().execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (expires_at, sid))
+
+    def delete(self, sid):
+        self._conn().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def purge_expired(self):
+        cur = self._conn().execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+        return cur.rowcount
+
+
+def open_session_store(kind: Optional[str] = None) -> SessionStore:
+    """依設定建立 session 儲存 (memory / sqlite)"""
+    kind = kind or SESSION_STORE
+    if kind == 'memory':
+        return MemorySessionStore()
+    if kind == 'sqlite':
+        return SQLiteSessionStore(db.db_path(DEFAULT_DB_NAME))
+    raise ValueError(f"不支援的 SESSION_STORE: {kind}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """取得全域共用的 session 儲存 (第一次呼叫時建立)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = open_session_store()
+    return _store
+
+
+# === Flask ===
+
+class ServerSession(CallbackDict, SessionMixin):
+    """內容存在伺服器的 session (用法跟 flask.session 一樣)"""
+
+    def __init__(self, initial: Optional[Dict[str, Any]] = None, sid: Optional[str] = None,
+                 expires_at: float = 0.0):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        self.discarded_sid: Optional[str] = None
+
+    def regenerate(self):
+        """換一個新的 session id (登入時呼叫)，舊的在回應時刪除"""
+        if self.sid is not None and self.discarded_sid is None:
+            self.discarded_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """把 Flask 的 session 換成伺服器端儲存"""
+
+    def __init__(self, store: Optional[SessionStore] = None, lifetime: float = SESSION_LIFETIME,
+                 refresh_interval: float = SESSION_REFRESH_INTERVAL):
+        self._store = store
+        self.lifetime = lifetime
+        self.refresh_interval = refresh_interval
+
+    @property
+    def store(self) -> SessionStore:
+        # 第一次用到才開資料庫 (gunicorn fork 之後)
+        if self._store is None:
+            self._store = get_session_store()
+        return self._store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            loaded = self.store.load(sid)
+            if loaded is not None:
+                return ServerSession(loaded[0], sid, loaded[1])
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.discarded_sid is not None:
+            self.store.delete(session.discarded_sid)
+
+        if not session:
+            # 登出 (或從來沒用過)：刪掉伺服器端資料與 cookie
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        now = time.time()
+        expires_at = now + self.lifetime
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            self.store.save(session.sid, dict(session), expires_at)
+        elif session.modified:
+            self.store.save(session.sid, dict(session), expires_at)
+        elif session.expires_at - now < self.lifetime - self.refresh_interval:
+            self.store.touch(session.sid, expires_at)
+        else:
+            return  # 內容沒變，期限也剛延長過，不用再送 cookie
+        response.set_cookie(name, session.sid, expires=expires_at, httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path, secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app) or 'Lax')
+
+
+def init_app(app, store: Optional[SessionStore] = None):
+    """讓 app 使用伺服器端 session"""
+    app.config['SESSION_COOKIE_NAME'] = SESSION_COOKIE_NAME
+    app.session_interface = ServerSessionInterface(store)
+
+
+def load_secret_key() -> str:
+    """
+    Flask 的 secret_key：有設定 FLASK_SECRET_KEY 就用它，
+    否則第一次啟動時產生隨機金鑰存到 data/secret_key (所有 worker 與重新啟動後都用同一把)
+    """
+    key = os.environ.get("FLASK_SECRET_KEY")
+    if key:
+        return key
+    path = db.db_path(SECRET_KEY_FILE)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # 別的 worker 剛建立：等它寫完
+        for _ in range(50):
+            with open(path, encoding='ascii') as f:
+                key = f.read().strip()
+            if key:
+                return key
+            time.sleep(0.1)
+        raise RuntimeError(f"{path} 是空的")
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        key = secrets.token_hex(32)
+        f.write(key)
+    return key
+
+
+# === 使用者摘要 ===
+
+def cached_summary(session, load: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """session 裡快取的使用者摘要，沒有或超過 SUMMARY_TTL 秒時呼叫 load() 重新計算"""
+    cached = session.get(SUMMARY_KEY)
+    now = time.time()
+    if cached is not None and now - cached['at'] < SUMMARY_TTL:
+        return cached['data']
+    data = load()
+    session[SUMMARY_KEY] = {'at': now, 'data': data}
+    return data
+
+
+def invalidate_summary(session):
+    """經驗值或上傳次數改變時呼叫，下一次重新計算"""
+    session.pop(SUMMARY_KEY, None)
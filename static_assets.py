@@ -0,0 +1,490 @@
+"""
+靜態檔案建置 - 壓縮圖片、產生 WebP / AVIF 縮圖、CSS 壓縮，檔名加上內容雜湊
+
+建置 (部署前執行一次，輸出到 static/dist/)：
+    python static_assets.py            # 建置並印出每個檔案、每個頁面的前後大小
+    python static_assets.py --report   # 只印報告，不重新建置
+
+- 圖片：原尺寸重新壓縮 (變大就保留原檔)，另外產生 ASSET_WIDTHS 寬度的 WebP / AVIF
+- CSS：把 @import 的本地檔案併進來、去掉註解和空白，url() 改指向建置後的 WebP
+- 每個輸出檔的檔名都含內容雜湊 (baby.3f2a9c1b0e.png)，內容變了網址就變，
+  所以可以讓瀏覽器快取一年 (Cache-Control: immutable)
+- static/dist/manifest.json 記錄 原始路徑 → 建置後的檔案；來源沒變的檔案下次建置直接沿用
+
+網頁使用 (init_app 之後)：
+    url_for('static', filename='baby.png')                           → dist/baby.<hash>.png
+    url_for('static', filename='baby.png', format='webp', width=640) → 640 寬以上最小的 WebP
+沒有建置過 (沒有 manifest) 時照舊使用原始檔案。
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+STATIC_DIR = 'static'
+TEMPLATE_DIR = 'templates'
+DIST_NAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# 要產生的寬度 (比原圖小的才產生；原寬度一定會有)
+ASSET_WIDTHS = (320, 640, 1280)
+WEBP_QUALITY = int(os.environ.get("ASSET_WEBP_QUALITY", "80"))
+AVIF_QUALITY = int(os.environ.get("ASSET_AVIF_QUALITY", "60"))
+# 指紋檔案的快取時間 (秒)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# 不建置的子資料夾 (上傳的照片、建置結果本身)
+SKIP_DIRS = ('dist', 'uploads')
+_HASH_LENGTH = 10
+
+
+def _avif_supported() -> bool:
+    """Pillow 11.2 以上內建 AVIF；舊版靠 pillow_heif (沒有安裝就不產生 AVIF)"""
+    if '.avif' in Image.registered_extensions():
+        return True
+    try:
+        import pillow_heif
+    except ImportError:
+        return False
+    with warnings.catch_warnings():
+        # pillow_heif 新版提醒改用 Pillow 內建的 AVIF，舊版 Pillow 沒有，照用
+        warnings.simplefilter('ignore', DeprecationWarning)
+        pillow_heif.register_avif_opener()
+    return '.avif' in Image.registered_extensions()
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _fingerprinted(rel_path: str, data: bytes, suffix: str = '', ext: Optional[str] = None) -> str:
+    """images/cup.png → dist/images/cup<suffix>.<hash>.<ext>"""
+    stem, orig_ext = os.path.splitext(rel_path)
+    return f"{DIST_NAME}/{stem}{suffix}.{_digest(data)[:_HASH_LENGTH]}{ext or orig_ext}"
+
+
+def _write(static_dir: str, rel_path: str, data: bytes):
+    path = os.path.join(static_dir, rel_path)
+    if os.path.exists(path):
+        return  # 檔名含雜湊，存在就表示內容一樣
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _encode(img: Image.Image, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == 'png':
+        img.save(buf, 'PNG', optimize=True)
+    elif fmt == 'jpeg':
+        img.convert('RGB').save(buf, 'JPEG', quality=85, optimize=True, progressive=True)
+    elif fmt == 'webp':
+        img.save(buf, 'WEBP', quality=WEBP_QUALITY, method=6)
+    else:
+        img.save(buf, 'AVIF', quality=AVIF_QUALITY)
+    return buf.getvalue()
+
+
+# === 圖片 ===
+
+def build_image(task) -> Tuple[str, Dict[str, Any], Dict[str, bytes]]:
+    """
+    建置一張圖 (在子行程執行)
+    返回: (原始路徑, manifest 項目, {輸出路徑: 內容})
+    """
+    rel_path, source, formats = task
+    if 'avif' in formats:
+        _avif_supported()  # 子行程也要註冊
+    with Image.open(source) as img:
+        img.load()
+    with open(source, 'rb') as f:
+        original = f.read()
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+
+    outputs = {}
+    base_fmt = 'jpeg' if rel_path.lower().endswith(('.jpg', '.jpeg')) else 'png'
+    data = _encode(img, base_fmt)
+    if len(data) >= len(original):
+        data = original
+    file = _fingerprinted(rel_path, data)
+    outputs[file] = data
+    entry = {
+        'file': file, 'bytes': len(data),
+        'source_sha256': _digest(original), 'source_bytes': len(original),
+        'width': img.width, 'height': img.height, 'variants': {},
+    }
+
+    widths = sorted({w for w in ASSET_WIDTHS if w < img.width} | {img.width})
+    for fmt in formats:
+        variants = []
+        for width in widths:
+            resized = img if width == img.width else img.resize(
+                (width, max(round(img.height * width / img.width), 1)), Image.LANCZOS)
+            data = _encode(resized, fmt)
+            file = _fingerprinted(rel_path, data, f'.{width}w', f'.{fmt}')
+            outputs[file] = data
+            variants.append({'width': width, 'file': file, 'bytes': len(data)})
+        entry['variants'][fmt] = variants
+    return rel_path, entry, outputs
+
+
+# === CSS ===
+
+_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_STRING = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''')
+_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+_IMPORT = re.compile(r'''@import\s+(?:url\(\s*)?(['"]?)([^'")\s;]+)\1\s*\)?\s*;''')
+
+
+def minify_css(css: str) -> str:
+    """去掉註解和多餘的空白 (字串裡的內容不動)"""
+    parts = _STRING.split(_COMMENT.sub('', css))
+    for i in range(0, len(parts), 2):  # 偶數位置不是字串
+        text = re.sub(r'\s+', ' ', parts[i])
+        text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+        text = re.sub(r':\s+', ':', text)
+        parts[i] = text.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def _is_local(ref: str) -> bool:
+    return not re.match(r'^(?:[a-z]+:|//|#|data:)', ref, re.I)
+
+
+def _static_path(base_rel: str, ref: str) -> str:
+    """CSS 裡的相對路徑 → static/ 底下的路徑"""
+    ref = ref.split('?')[0].split('#')[0]
+    if ref.startswith('/static/'):
+        return ref[len('/static/'):]
+    return os.path.normpath(os.path.join(os.path.dirname(base_rel), ref)).replace(os.sep, '/')
+
+
+def bundle_css(static_dir: str, rel_path: str, seen=None) -> str:
+    """讀取 CSS，把 @import 的本地檔案直接併進來 (少一個請求)"""
+    seen = set() if seen is None else seen
+    seen.add(rel_path)
+    with open(os.path.join(static_dir, rel_path), encoding='utf-8') as f:
+        css = f.read()
+
+    def inline(m):
+        ref = m.group(2)
+        if not _is_local(ref):
+            return m.group(0)
+        target = _static_path(rel_path, ref)
+        if target in seen or not os.path.isfile(os.path.join(static_dir, target)):
+            return m.group(0)
+        return _relocate_urls(bundle_css(static_dir, target, seen), target, rel_path)
+
+    return _IMPORT.sub(inline, css)
+
+
+def _relocate_urls(css: str, from_rel: str, to_rel: str) -> str:
+    """被併進別的檔案時，url() 的相對路徑改成相對於新檔案"""
+    def fix(m):
+        ref = m.group(2)
+        if not _is_local(ref) or ref.startswith('/'):
+            return m.group(0)
+        target = _static_path(from_rel, ref)
+        return f"url('{os.path.relpath(target, os.path.dirname(to_rel) or '.')}')"
+    return _URL.sub(fix, css)
+
+
+def build_css(static_dir: str, rel_path: str, images: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+    """合併、壓縮 CSS，url() 指向建置後的圖片 (原尺寸的 WebP)"""
+    with open(os.path.join(static_dir, rel_path), 'rb') as f:
+        original = f.read()
+    css = minify_css(bundle_css(static_dir, rel_path))
+    out_dir = os.path.dirname(_fingerprinted(rel_path, b''))
+
+    def rewrite(m):
+        ref = m.group(2)
+        if not _is_local(ref):
+            return m.group(0)
+        if ref.startswith('/'):
+            return m.group(0)
+        target = _static_path(rel_path, ref)
+        entry = images.get(target)
+        if entry is not None:
+            target = resolve(entry, 'webp')
+        # 沒有建置結果的檔案仍指向原本的位置 (CSS 本身搬到了 dist/)
+        return f"url({os.path.relpath(target, out_dir)})"
+
+    data = _URL.sub(rewrite, css).encode('utf-8')
+    file = _fingerprinted(rel_path, data)
+    return {
+        'file': file, 'bytes': len(data),
+        'source_sha256': _digest(original), 'source_bytes': len(original),
+    }, {file: data}
+
+
+# === 找出要建置的檔案 ===
+
+_STATIC_REF = re.compile(r'''url_for\(\s*['"]static['"]\s*,\s*filename\s*=\s*['"]([^'"]+)['"]([^)]*)\)''')
+_REF_OPTION = re.compile(r'''(format|width)\s*=\s*['"]?(\w+)''')
+
+
+def find_sources(static_dir: str) -> Tuple[List[str], List[str]]:
+    """static/ 底下所有的圖片和 CSS (不含 dist/、uploads/)，返回相對路徑"""
+    images, styles = [], []
+    for root, dirs, files in os.walk(static_dir):
+        rel_root = os.path.relpath(root, static_dir)
+        if rel_root == '.':
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in sorted(files):
+            rel = os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, '/')
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(rel)
+            elif name.lower().endswith('.css'):
+                styles.append(rel)
+    return sorted(images), sorted(styles)
+
+
+def template_refs(template_dir: str) -> Dict[str, List[Tuple[str, Dict[str, str]]]]:
+    """每個模板用到的靜態檔案: {模板: [(路徑, {'format': ..., 'width': ...}), ...]}"""
+    refs = {}
+    for name in sorted(os.listdir(template_dir)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(template_dir, name), encoding='utf-8') as f:
+            html = f.read()
+        refs[name] = [(m.group(1), dict(_REF_OPTION.findall(m.group(2))))
+                      for m in _STATIC_REF.finditer(html)]
+    return refs
+
+
+# === 建置 ===
+
+def load_manifest(static_dir: str = STATIC_DIR) -> Dict[str, Any]:
+    """讀取 manifest，沒有建置過時返回空的"""
+    try:
+        with open(os.path.join(static_dir, DIST_NAME, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'assets': {}}
+
+
+def _unchanged(static_dir: str, rel_path: str, entry: Optional[Dict[str, Any]]) -> bool:
+    """上次建置的結果還能用嗎 (來源內容一樣、輸出檔都還在)"""
+    if entry is None:
+        return False
+    with open(os.path.join(static_dir, rel_path), 'rb') as f:
+        if _digest(f.read()) != entry['source_sha256']:
+            return False
+    files = [entry['file']] + [v['file'] for vs in entry.get('variants', {}).values() for v in vs]
+    return all(os.path.exists(os.path.join(static_dir, p)) for p in files)
+
+
+def _build_images(tasks, jobs: Optional[int]):
+    """多張圖時分散到多個 CPU 核心"""
+    if len(tasks) <= 1 or jobs == 1:
+        yield from map(build_image, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        yield from pool.map(build_image, tasks)
+
+
+def build(static_dir: str = STATIC_DIR, jobs: Optional[int] = None,
+          formats: Optional[List[str]] = None) -> Dict[str, Any]:
+    """建置所有靜態檔案，寫入 manifest，刪掉用不到的舊檔案；返回新的 manifest"""
+    if formats is None:
+        formats = ['webp'] + (['avif'] if _avif_supported() else [])
+    old = load_manifest(static_dir)['assets']
+    images, styles = find_sources(static_dir)
+    assets = {}
+
+    tasks = []
+    for rel in images:
+        entry = old.get(rel)
+        if _unchanged(static_dir, rel, entry) and set(entry['variants']) == set(formats):
+            assets[rel] = entry
+        else:
+            tasks.append((rel, os.path.join(static_dir, rel), formats))
+    for rel, entry, outputs in _build_images(tasks, jobs):
+        for path, data in outputs.items():
+            _write(static_dir, path, data)
+        assets[rel] = entry
+        print(f"{rel} → {entry['file']}")
+
+    image_assets = {k: assets[k] for k in images}
+    for rel in styles:
+        entry, outputs = build_css(static_dir, rel, image_assets)
+        for path, data in outputs.items():
+            _write(static_dir, path, data)
+        assets[rel] = entry
+
+    manifest = {'assets': {k: assets[k] for k in sorted(assets)}}
+    dist = os.path.join(static_dir, DIST_NAME)
+    tmp = os.path.join(dist, MANIFEST_NAME + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(dist, MANIFEST_NAME))
+    _clean(static_dir, manifest)
+    return manifest
+
+
+def _clean(static_dir: str, manifest: Dict[str, Any]):
+    """刪掉 manifest 裡沒有的舊建置結果"""
+    keep = {MANIFEST_NAME}
+    for entry in manifest['assets'].values():
+        keep.add(entry['file'])
+        keep.update(v['file'] for vs in entry.get('variants', {}).values() for v in vs)
+    keep = {os.path.normpath(os.path.join(static_dir, p)) for p in keep} | \
+           {os.path.normpath(os.path.join(static_dir, DIST_NAME, MANIFEST_NAME))}
+    dist = os.path.join(static_dir, DIST_NAME)
+    for root, dirs, files in os.walk(dist, topdown=False):
+        for name in files:
+            path = os.path.normpath(os.path.join(root, name))
+            if path not in keep:
+                os.remove(path)
+        if root != dist and not os.listdir(root):
+            os.rmdir(root)
+
+
+# === 網頁使用 ===
+
+def resolve(entry: Dict[str, Any], fmt: Optional[str] = None, width: Optional[int] = None) -> str:
+    """
+    挑出最適合的建置結果
+    fmt：webp / avif (沒有指定或沒有這個格式時用原格式、原尺寸)
+    width：需要的寬度，挑寬度 >= width 的最小一張 (都不夠寬就用最大的)
+    """
+    variants = entry.get('variants', {}).get(fmt) if fmt else None
+    if not variants:
+        return entry['file']
+    if width is None:
+        return variants[-1]['file']
+    for variant in variants:
+        if variant['width'] >= width:
+            return variant['file']
+    return variants[-1]['file']
+
+
+def init_app(app, static_dir: Optional[str] = None):
+    """
+    讓 url_for('static', ...) 指向建置後的檔案，並讓這些檔案可以快取一年
+    (沒有 manifest 時什麼都不改)
+    """
+    static_dir = static_dir or app.static_folder
+    assets = load_manifest(static_dir)['assets']
+    dist_prefix = DIST_NAME + '/'
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint != 'static':
+            return
+        fmt = values.pop('format', None)
+        width = values.pop('width', None)
+        entry = assets.get(values.get('filename'))
+        if entry is not None:
+            values['filename'] = resolve(entry, fmt, int(width) if width else None)
+
+    @app.after_request
+    def cache_fingerprinted(response):
+        from flask import request
+        filename = (request.view_args or {}).get('filename', '')
+        if request.endpoint == 'static' and filename.startswith(dist_prefix) \
+                and filename != dist_prefix + MANIFEST_NAME and response.status_code in (200, 206, 304):
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
+
+    return assets
+
+
+# === 報告 ===
+
+def _format_bytes(n: int) -> str:
+    return f"{n / 1024:.1f}KB" if n >= 1024 else f"{n}B"
+
+
+def _css_images(static_dir: str, rel_path: str) -> List[str]:
+    """CSS 用到的本地圖片 (static/ 底下的路徑)"""
+    css = _COMMENT.sub('', bundle_css(static_dir, rel_path))
+    return [p for p in (_static_path(rel_path, m.group(2)) for m in _URL.finditer(css) if _is_local(m.group(2)))
+            if os.path.isfile(os.path.join(static_dir, p))]
+
+
+def report(static_dir: str = STATIC_DIR, template_dir: str = TEMPLATE_DIR,
+           manifest: Optional[Dict[str, Any]] = None):
+    """印出每個檔案、每個頁面建置前後的大小"""
+    assets = (manifest or load_manifest(static_dir))['assets']
+    if not assets:
+        print("還沒有建置過 (找不到 manifest)")
+        return
+
+    print("=== 檔案 ===")
+    total_before = total_after = 0
+    for rel, entry in assets.items():
+        line = f"{rel:<36} {_format_bytes(entry['source_bytes']):>9} → {_format_bytes(entry['bytes']):>9}"
+        for fmt, variants in entry.get('variants', {}).items():
+            line += f"  {fmt} {_format_bytes(variants[-1]['bytes'])}"
+        print(line)
+        total_before += entry['source_bytes']
+        total_after += entry['bytes']
+    print(f"{'合計 (原格式)':<32} {_format_bytes(total_before):>9} → {_format_bytes(total_after):>9}")
+
+    print("\n=== 頁面 (模板 + 用到的靜態檔案，不含上傳照片和外部字型) ===")
+    used = set()
+    for name, refs in template_refs(template_dir).items():
+        html = os.path.getsize(os.path.join(template_dir, name))
+        before = after = html
+        for rel, options in refs:
+            entry = assets.get(rel)
+            if entry is None:
+                continue
+            used.add(rel)
+            fmt, width = options.get('format'), options.get('width')
+            built = resolve(entry, fmt, int(width) if width else None)
+            before += entry['source_bytes']
+            after += os.path.getsize(os.path.join(static_dir, built))
+            if rel.endswith('.css'):
+                for image in _css_images(static_dir, rel):
+                    used.add(image)
+                    before += assets[image]['source_bytes'] if image in assets else 0
+                    after += os.path.getsize(os.path.join(static_dir, resolve(assets[image], 'webp'))) \
+                        if image in assets else 0
+        cached = f"，再次造訪 {_format_bytes(html)} (其餘已快取)" if after > html else ""
+        print(f"{name:<24} {_format_bytes(before):>9} → {_format_bytes(after):>9}{cached}")
+
+    unused = [rel for rel in assets if rel.endswith('.css') and rel not in used]
+    if unused:
+        print(f"\n沒有任何模板使用的 CSS ({len(unused)} 個)：{', '.join(unused)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="建置靜態檔案：壓縮圖片、WebP / AVIF、CSS，檔名加上內容雜湊")
+    parser.add_argument('--static', default=STATIC_DIR, help="靜態檔案資料夾")
+    parser.add_argument('--templates', default=TEMPLATE_DIR, help="模板資料夾 (報告用)")
+    parser.add_argument('--formats', default=None, help="要產生的格式，例如 webp,avif (預設兩種都產生)")
+    parser.add_argument('--report', action='store_true', help="只印報告，不重新建置")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="同時處理的行程數 (預設 CPU 核心數)")
+    args = parser.parse_args(argv)
+
+    manifest = None
+    if not args.report:
+        formats = args.formats.split(',') if args.formats else None
+        if formats and 'avif' in formats and not _avif_supported():
+            print("這個環境不支援 AVIF，只產生其他格式")
+            formats.remove('avif')
+        manifest = build(args.static, args.jobs, formats)
+        print()
+    report(args.static, args.templates, manifest)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
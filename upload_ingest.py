@@ -0,0 +1,134 @@
+"""
+上傳接收 - 邊收邊寫入硬碟、邊算 sha256，不把整個檔案放進記憶體
+
+Werkzeug 解析 multipart 時會一小段一小段地呼叫 write()，
+這裡讓那些資料直接寫進 uploads/ 的暫存檔，同時更新 sha256 並檢查大小上限。
+收完之後檔案改名成「sha256.副檔名」，辨識時直接把開好的檔案交給 Pillow，
+整個流程只從網路讀一次、寫一次硬碟，不會再把檔案整個讀進記憶體。
+"""
+
+import os
+import hashlib
+import tempfile
+from typing import Dict, Optional
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+# 單一上傳的大小上限 (預設 20MB)
+MAX_UPLOAD_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.heif', '.gif', '.bmp'}
+
+
+class HashingFile:
+    """
+    上傳用的檔案：寫入時同時計算 sha256 與大小，超過上限立刻中止
+    Werkzeug 之後會 seek(0) 再讀取，所以其他方法都交給底下的暫存檔
+    """
+
+    def __init__(self, upload_dir: str, max_bytes: int = MAX_UPLOAD_BYTES):
+        os.makedirs(upload_dir, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=upload_dir, prefix='.upload-', delete=False)
+        self.path = self._file.name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self.final_path: Optional[str] = None
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.close()
+            raise RequestEntityTooLarge()
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def close(self):
+        """關閉檔案；沒有完成 (改名) 的暫存檔一併刪除"""
+        self._file.close()
+        if self.final_path is None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def finalize(self, filename: Optional[str] = None, storage=None) -> 'IngestedUpload':
+        """
+        上傳完成：改名成「sha256.副檔名」
+        同樣內容的檔案已經存在時直接沿用，不重複佔空間
+        有 storage (upload_storage.UploadStorage) 時交給它存放 (分層資料夾 + 索引)
+        """
+        self._file.flush()
+        self._file.close()
+        ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            ext = ''
+        if storage is not None:
+            key = storage.put_file(self.path, self.sha256, ext)
+            self.final_path = storage.local_path(key)
+            return IngestedUpload(self.final_path, self.sha256, self.size)
+        name = self.sha256 + ext
+        final_path = os.path.join(os.path.dirname(self.path), name)
+        if os.path.exists(final_path):
+            os.unlink(self.path)
+        else:
+            os.replace(self.path, final_path)
+        self.final_path = final_path
+        return IngestedUpload(final_path, self.sha256, self.size)
+
+
+class IngestedUpload:
+    """已經存好的上傳檔案"""
+
+    def __init__(self, path: str, sha256: str, size: int):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+
+    @property
+    def filename(self) -> str:
+        return os.path.basename(self.path)
+
+    def open(self):
+        """
+        開啟已存好的檔案，可以直接交給 Image.open
+        Pillow 會一段一段讀取，不會先把整個檔案變成 bytes
+        (不用 mmap：解碼時摸過的頁面都會算進行程的常駐記憶體)
+        """
+        return open(self.path, 'rb')
+
+
+def make_request_class(upload_dir: str, max_bytes: int = MAX_UPLOAD_BYTES,
+                       endpoint_limits: Optional[Dict[str, int]] = None):
+    """
+    建立 Flask Request 類別：上傳的檔案直接串流到 upload_dir
+    (整個請求的大小上限另外用 app.config['MAX_CONTENT_LENGTH'] 在讀取前擋掉，
+    endpoint_limits 可以讓個別路由 (例如批次上傳) 用不同的上限；單一檔案一樣是 max_bytes)
+    """
+    endpoint_limits = endpoint_limits or {}
+
+    class StreamingUploadRequest(Request):
+        @property
+        def max_content_length(self):
+            limit = endpoint_limits.get(self.endpoint) if self.url_rule is not None else None
+            return limit if limit is not None else super().max_content_length
+
+        def _get_file_stream(self, total_content_length, content_type,
+                             filename=None, content_length=None):
+            return HashingFile(upload_dir, max_bytes)
+
+    return StreamingUploadRequest
+
+
+def ingest_file(file_storage, storage=None) -> IngestedUpload:
+    """把 request.files 裡的檔案完成存檔，返回存好的上傳"""
+    stream = file_storage.stream
+    if isinstance(stream, HashingFile):
+        return stream.finalize(file_storage.filename, storage)
+    raise TypeError("上傳未經過 StreamingUploadRequest 處理")
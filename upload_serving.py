@@ -0,0 +1,113 @@
+"""
+上傳照片的提供 - 縮圖快取、強 ETag / 304、Range、sendfile
+
+上傳的檔案名稱就是內容的 sha256 (upload_ingest.py)，內容不會變，所以：
+- ETag 直接用 sha256 (強 ETag)，瀏覽器帶 If-None-Match 時返回 304
+- 可以讓瀏覽器快取一年 (immutable)
+- 縮圖是原檔的衍生檔案 (upload_storage.derived_path)，第一次請求時產生，
+  之後直接從硬碟送出；原檔被清理時縮圖一起刪除
+
+送檔案一律交給 send_file(路徑)：Werkzeug 會用 WSGI 伺服器提供的 wsgi.file_wrapper，
+gunicorn 的 sync worker 會用 sendfile() 從核心直接送出 (零複製)；
+Range 請求 (206) 與 304 由 conditional=True 處理。
+前面有 nginx 時可以設定 UPLOAD_X_SENDFILE=1，改由 nginx 送檔案 (X-Sendfile)。
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+
+from flask import abort, send_file
+
+from image_preprocess import prepare_for_model
+from upload_storage import UploadStorage, parse_key
+
+# 允許的縮圖最長邊 (像素)，只產生這幾種，避免被要求產生任意尺寸
+THUMBNAIL_SIZES = (240, 480)
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY", "75"))
+# 內容不會變的檔案快取一年
+UPLOAD_MAX_AGE = 365 * 24 * 3600
+
+
+class ThumbnailCache:
+    """存在硬碟的縮圖 (上傳檔案的衍生檔案，種類為 thumb<尺寸>)"""
+
+    def __init__(self, storage: UploadStorage):
+        self.storage = storage
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def path_for(self, key: str, size: int) -> str:
+        return self.storage.derived_path(key, f'thumb{size}', '.webp')
+
+    def _lock(self, name: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def get(self, source: str, key: str, size: int) -> str:
+        """
+        取得縮圖路徑，沒有時產生 (同一張縮圖同時被要求時只產生一次)
+        圖片無法解碼時丟出 OSError / ValueError
+        """
+        path = self.path_for(key, size)
+        if os.path.exists(path):
+            return path
+        name = f'{size}/{key}'
+        lock = self._lock(name)
+        with lock:
+            if not os.path.exists(path):
+                prepared = prepare_for_model(source, max_edge=size, fmt='WEBP', quality=THUMBNAIL_QUALITY)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(prepared.data)
+                os.replace(tmp, path)
+        with self._locks_guard:
+            self._locks.pop(name, None)
+        return path
+
+
+def _send(path: str, etag: Optional[str], mimetype: Optional[str] = None):
+    """
+    送出檔案：有內容雜湊時用它當強 ETag 並長期快取
+    (舊的上傳沒有雜湊，交給 Werkzeug 依修改時間與大小產生 ETag)
+    """
+    # 絕對路徑：相對路徑會被 Flask 當成相對於程式所在的資料夾
+    response = send_file(os.path.abspath(path), mimetype=mimetype, conditional=True,
+                         etag=etag if etag is not None else True,
+                         max_age=UPLOAD_MAX_AGE if etag is not None else None)
+    if etag is not None:
+        # 使用者自己的照片，不給共用快取 (CDN、代理伺服器) 保存
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.immutable = True
+    return response
+
+
+def _find(storage: UploadStorage, filename: str) -> str:
+    path = storage.local_path(filename)
+    if path is None:
+        abort(404)
+    storage.touch(filename)
+    return path
+
+
+def send_upload(storage: UploadStorage, filename: str):
+    """送出原始上傳檔案"""
+    path = _find(storage, filename)
+    return _send(path, parse_key(filename))
+
+
+def send_thumbnail(cache: ThumbnailCache, filename: str, size: int):
+    """送出縮圖 (第一次請求時產生)；無法產生縮圖時改送原檔"""
+    if size not in THUMBNAIL_SIZES:
+        abort(404)
+    path = _find(cache.storage, filename)
+    sha256 = parse_key(filename)
+    if sha256 is None:
+        return _send(path, None)
+    try:
+        thumbnail = cache.get(path, filename, size)
+    except (OSError, ValueError):
+        return _send(path, sha256)
+    return _send(thumbnail, f'{sha256}-{size}', 'image/webp')
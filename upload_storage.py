@@ -0,0 +1,351 @@
+"""
+上傳檔案儲存 - 依 sha256 分資料夾存放，內容相同只存一份，超過期限或容量就清掉最久沒用的
+
+uploads/ 原本是一個平的資料夾，檔案到幾萬個以後建檔、列目錄都會變慢，硬碟也只會越用越滿。
+- 對外的檔名 (key) 仍是「sha256.副檔名」，實際放在 uploads/ab/<key> (跟 git 的物件一樣)，
+  256 個資料夾，一百萬個檔案平均每個資料夾約四千個
+  (容量預算先限制了檔案數，不需要 ab/cd/ 兩層、多建六萬多個資料夾)
+- 同樣內容的 key 相同，天生不會重複存
+- 每個檔案的大小、建立時間、最後使用時間記在 SQLite (data/uploads.db)，
+  清理時不用掃資料夾：超過保存期限、或總大小超過預算時，從最久沒用的開始刪
+- 從原檔產生的檔案 (縮圖等) 放在 derived_path()，原檔刪掉時一起刪
+- UploadStorage 定義介面與索引；LocalUploadStorage 存本機硬碟。
+  之後要換成 S3 相容的儲存 (例如 MinIO)，實作 _store / _remove / exists / open / local_path 即可
+
+把舊的平面資料夾整理成分層並建立索引：
+    python upload_storage.py migrate
+手動執行一次清理 (平常每存 _RETENTION_EVERY 個檔案會自動執行)：
+    python upload_storage.py retention
+"""
+
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from typing import BinaryIO, List, Optional, Tuple
+
+from werkzeug.security import safe_join
+
+import db
+
+DEFAULT_DB_NAME = 'uploads.db'
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+# 所有上傳檔案加起來的容量上限 (bytes)，預設 5GB
+UPLOAD_STORAGE_BUDGET = int(os.environ.get("UPLOAD_STORAGE_BUDGET", str(5 * 1024 ** 3)))
+# 多久沒有被使用就刪除 (秒)，預設 30 天；0 = 只看容量
+UPLOAD_RETENTION_SECONDS = float(os.environ.get("UPLOAD_RETENTION_SECONDS", str(30 * 24 * 3600)))
+# 剛上傳的檔案至少保留多久 (秒)，避免還在辨識的照片被刪掉
+UPLOAD_MIN_AGE = float(os.environ.get("UPLOAD_MIN_AGE", "3600"))
+
+DERIVED_DIR_NAME = '.derived'
+# 同一個檔案多久內只更新一次「最後使用時間」(秒)，避免每次讀取都寫資料庫
+_TOUCH_INTERVAL = 600
+# 每存這麼多個檔案，順便執行一次清理
+_RETENTION_EVERY = 500
+_DELETE_BATCH = 500
+
+_KEY = re.compile(r'^([0-9a-f]{64})(\.[a-z0-9]{1,8})?$')
+
+
+def parse_key(key: str) -> Optional[str]:
+    """key 是「sha256.副檔名」時返回 sha256，否則返回 None"""
+    m = _KEY.match(key)
+    return m.group(1) if m else None
+
+
+def shard(sha256: str) -> Tuple[str, ...]:
+    """sha256 → 分層資料夾名稱 (前兩個字元)"""
+    return (sha256[0:2],)
+
+
+class UploadStorage(ABC):
+    """上傳檔案儲存的共用部分：key 的規則、索引、清理"""
+
+    def __init__(self, index_path: str, budget_bytes: int = UPLOAD_STORAGE_BUDGET,
+                 retention_seconds: float = UPLOAD_RETENTION_SECONDS,
+                 min_age: float = UPLOAD_MIN_AGE):
+        self.index_path = index_path
+        self.budget_bytes = budget_bytes
+        self.retention_seconds = retention_seconds
+        self.min_age = min_age
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._puts = 0
+        with db.transaction(self._conn()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS uploads ('
+                ' key TEXT PRIMARY KEY,'
+                ' size INTEGER NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' accessed_at REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS uploads_accessed ON uploads (accessed_at)')
+
+    def _conn(self):
+        return db.get_connection(self.index_path)
+
+    # === 各種儲存方式要實作的部分 ===
+
+    @abstractmethod
+    def _store(self, temp_path: str, key: str) -> bool:
+        """把暫存檔搬進儲存 (暫存檔之後不再存在)；已經有同樣的 key 時返回 False"""
+
+    @abstractmethod
+    def _remove(self, key: str):
+        """刪除檔案與它的衍生檔案 (不存在時忽略)"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """檔案是否存在"""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """開啟檔案讀取，不存在時丟出 FileNotFoundError"""
+
+    @abstractmethod
+    def local_path(self, key: str) -> Optional[str]:
+        """本機上的路徑 (給 sendfile、Pillow 用)；不存在或不在本機時返回 None"""
+
+    @abstractmethod
+    def derived_path(self, key: str, variant: str, ext: str) -> str:
+        """從原檔產生的檔案 (例如縮圖) 要放的本機路徑，原檔刪除時一起刪除"""
+
+    # === 共用 ===
+
+    def put_file(self, temp_path: str, sha256: str, ext: str = '') -> str:
+        """
+        存入已經算好 sha256 的暫存檔，返回 key
+        內容相同的檔案已經存在時直接沿用 (暫存檔刪除)
+        """
+        key = sha256 + ext
+        if parse_key(key) is None:
+            raise ValueError(f"無效的上傳檔名: {key}")
+        size = os.path.getsize(temp_path)
+        self._store(temp_path, key)
+        now = time.time()
+        self._conn().execute(
+            'INSERT INTO uploads (key, size, created_at, accessed_at) VALUES (?, ?, ?, ?)'
+            ' ON CONFLICT (key) DO UPDATE SET accessed_at = excluded.accessed_at',
+            (key, size, now, now)
+        )
+        with self._lock:
+            self._touched[key] = now
+            self._puts += 1
+            run_retention = self._puts % _RETENTION_EVERY == 0
+        if run_retention:
+            self.enforce_retention()
+        return key
+
+    def touch(self, key: str):
+        """記錄檔案被使用 (每個行程每 _TOUCH_INTERVAL 秒最多寫一次資料庫)"""
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(key, 0) < _TOUCH_INTERVAL:
+                return
+            self._touched[key] = now
+            if len(self._touched) > 100000:
+                self._touched.clear()
+        self._conn().execute('UPDATE uploads SET accessed_at = ? WHERE key = ?', (now, key))
+
+    def delete(self, key: str):
+        """刪除檔案 (包含衍生檔案) 與索引"""
+        self._remove(key)
+        self._conn().execute('DELETE FROM uploads WHERE key = ?', (key,))
+        with self._lock:
+            self._touched.pop(key, None)
+
+    def usage(self) -> Tuple[int, int]:
+        """返回: (檔案數, 總大小 bytes)"""
+        count, total = self._conn().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM uploads').fetchone()
+        return count, total
+
+    def _delete_rows(self, rows) -> int:
+        for key, _ in rows:
+            self._remove(key)
+        with db.transaction(self._conn()) as conn:
+            conn.executemany('DELETE FROM uploads WHERE key = ?', [(key,) for key, _ in rows])
+        with self._lock:
+            for key, _ in rows:
+                self._touched.pop(key, None)
+        return sum(size for _, size in rows)
+
+    def enforce_retention(self, now: Optional[float] = None) -> Tuple[int, int]:
+        """
+        清理：先刪超過保存期限沒用的，總大小還超過預算就從最久沒用的繼續刪
+        (UPLOAD_MIN_AGE 內剛上傳的不刪)
+        返回: (刪除的檔案數, 釋放的 bytes)
+        """
+        now = time.time() if now is None else now
+        newest_created = now - self.min_age
+        conn = self._conn()
+        deleted = freed = 0
+
+        if self.retention_seconds > 0:
+            while True:
+                rows = conn.execute(
+                    'SELECT key, size FROM uploads WHERE accessed_at < ? AND created_at < ?'
+                    ' ORDER BY accessed_at LIMIT ?',
+                    (now - self.retention_seconds, newest_created, _DELETE_BATCH)
+                ).fetchall()
+                if not rows:
+                    break
+                freed += self._delete_rows(rows)
+                deleted += len(rows)
+
+        _, total = self.usage()
+        while total > self.budget_bytes:
+            rows = conn.execute(
+                'SELECT key, size FROM uploads WHERE created_at < ? ORDER BY accessed_at LIMIT ?',
+                (newest_created, _DELETE_BATCH)
+            ).fetchall()
+            if not rows:
+                break
+            picked = []
+            for key, size in rows:
+                if total <= self.budget_bytes:
+                    break
+                picked.append((key, size))
+                total -= size
+            freed += self._delete_rows(picked)
+            deleted += len(picked)
+        return deleted, freed
+
+
+class LocalUploadStorage(UploadStorage):
+    """存在本機硬碟：<root>/ab/<sha256>.<ext>，衍生檔案在 <root>/.derived/<種類>/ab/"""
+
+    def __init__(self, root: str, index_path: str, **kwargs):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        super().__init__(index_path, **kwargs)
+
+    def shard_path(self, key: str) -> str:
+        sha256 = parse_key(key)
+        if sha256 is None:
+            raise ValueError(f"無效的上傳檔名: {key}")
+        return os.path.join(self.root, *shard(sha256), key)
+
+    def _store(self, temp_path: str, key: str) -> bool:
+        path = self.shard_path(key)
+        if os.path.exists(path):
+            os.unlink(temp_path)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return True
+
+    def _remove(self, key: str):
+        paths = [self.local_path(key)]
+        sha256 = parse_key(key)
+        if sha256 is not None:
+            derived_root = os.path.join(self.root, DERIVED_DIR_NAME)
+            for variant in (os.listdir(derived_root) if os.path.isdir(derived_root) else ()):
+                paths.extend(glob.glob(os.path.join(derived_root, variant, *shard(sha256), sha256 + '.*')))
+        for path in paths:
+            if path is None:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        if parse_key(key) is not None:
+            path = self.shard_path(key)
+            if os.path.isfile(path):
+                return path
+        # 分層之前的舊檔案還放在最上層 (只找最上層的一般檔名：
+        # 點開頭的是 upload_ingest 還在寫的暫存檔 (.upload-*) 或其他內部檔案，不能給人下載)
+        if key.startswith('.') or '/' in key or os.sep in key:
+            return None
+        path = safe_join(self.root, key)
+        return path if path is not None and os.path.isfile(path) else None
+
+    def exists(self, key: str) -> bool:
+        return self.local_path(key) is not None
+
+    def open(self, key: str) -> BinaryIO:
+        path = self.local_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        return open(path, 'rb')
+
+    def derived_path(self, key: str, variant: str, ext: str) -> str:
+        sha256 = parse_key(key)
+        if sha256 is None:
+            raise ValueError(f"無效的上傳檔名: {key}")
+        return os.path.join(self.root, DERIVED_DIR_NAME, variant, *shard(sha256), sha256 + ext)
+
+    def migrate(self) -> Tuple[int, int]:
+        """
+        最上層的舊檔案搬進分層資料夾，並把還沒有索引的檔案加進索引
+        返回: (搬移的檔案數, 新加入索引的檔案數)
+        """
+        moved = indexed = 0
+        conn = self._conn()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if parse_key(name) is None or not os.path.isfile(path):
+                continue
+            target = self.shard_path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                os.unlink(path)
+            else:
+                os.replace(path, target)
+            moved += 1
+        for level1 in os.listdir(self.root):
+            if not re.match(r'^[0-9a-f]{2}$', level1):
+                continue
+            rows = []
+            for path in glob.glob(os.path.join(self.root, level1, '*')):
+                name = os.path.basename(path)
+                if parse_key(name) is not None:
+                    st = os.stat(path)
+                    rows.append((name, st.st_size, st.st_mtime, max(st.st_atime, st.st_mtime)))
+            with db.transaction(conn):
+                before = conn.total_changes
+                conn.executemany('INSERT OR IGNORE INTO uploads (key, size, created_at, accessed_at)'
+                                 ' VALUES (?, ?, ?, ?)', rows)
+                indexed += conn.total_changes - before
+        return moved, indexed
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_upload_storage() -> LocalUploadStorage:
+    """取得全域共用的上傳儲存 (第一次呼叫時建立)"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = LocalUploadStorage(UPLOAD_DIR, db.db_path(DEFAULT_DB_NAME))
+    return _storage
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="上傳檔案儲存：整理舊資料夾、執行清理")
+    parser.add_argument('command', choices=('migrate', 'retention', 'usage'))
+    args = parser.parse_args(argv)
+
+    storage = get_upload_storage()
+    if args.command == 'migrate':
+        moved, indexed = storage.migrate()
+        print(f"搬移 {moved} 個檔案，新加入索引 {indexed} 個")
+    elif args.command == 'retention':
+        deleted, freed = storage.enforce_retention()
+        print(f"刪除 {deleted} 個檔案，釋放 {freed / 1024 ** 2:.1f} MB")
+    count, total = storage.usage()
+    print(f"目前 {count} 個檔案，共 {total / 1024 ** 2:.1f} MB (預算 {storage.budget_bytes / 1024 ** 2:.0f} MB)")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+用戶資料儲存 - 取代整包讀寫 users.json 的作法
+
+- SQLiteUserStore：內嵌資料庫，username 為主鍵 (有索引)，查詢只讀一筆
+- PostgresUserStore：多台機器共用時使用 (requirements 已有 psycopg2-binary)
+
+兩者都用「INSERT ... 衝突就忽略」做註冊，
+多個 gunicorn worker 同時註冊也不會互相覆蓋。
+"""
+
+import os
+import json
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterable, Tuple
+
+import db
+
+# 預設的 SQLite 檔名 (放在 data/ 之下)
+DEFAULT_SQLITE_NAME = 'users.db'
+
+# 批次匯入時每次寫入的筆數
+IMPORT_BATCH_SIZE = 10000
+
+UserRow = Tuple[str, str, str]  # (username, password_hash, created_at)
+
+
+class UserStore(ABC):
+    """用戶儲存的共同介面"""
+
+    @abstractmethod
+    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """依帳號查詢單一用戶，不存在時返回 None"""
+
+    @abstractmethod
+    def add_user(self, username: str, password_hash: str, created_at: str) -> bool:
+        """
+        新增用戶 (原子操作)
+        返回: True 表示新增成功，False 表示帳號已存在
+        """
+
+    @abstractmethod
+    def update_password_hash(self, username: str, old_hash: str, new_hash: str) -> bool:
+        """
+        更換密碼雜湊 (登入時升級舊格式)
+        只有目前的雜湊還是 old_hash 時才更新，同時有兩個登入在升級也不會互相覆蓋
+        返回: True 表示已更新
+        """
+
+    @abstractmethod
+    def import_users(self, rows: Iterable[UserRow]) -> int:
+        """批次匯入用戶，已存在的帳號略過，返回實際新增筆數"""
+
+    @abstractmethod
+    def is_empty(self) -> bool:
+        """是否還沒有任何用戶"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """用戶總數"""
+
+
+class SQLiteUserStore(UserStore):
+    """內嵌 SQLite 用戶儲存"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with db.transaction(db.get_connection(path)) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS users ('
+                ' username TEXT PRIMARY KEY,'
+                ' password_hash TEXT NOT NULL,'
+                ' created_at TEXT NOT NULL'
+                ') WITHOUT ROWID'
+            )
+
+    def _conn(self):
+        return db.get_connection(self.path)
+
+    def get_user(self, username):
+        row = self._conn().execute(
+            'SELECT password_hash, created_at FROM users WHERE username = ?',
+            (username,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'password_hash': row[0], 'created_at': row[1]}
+
+    def add_user(self, username, password_hash, created_at):
+        cur = self._conn().execute(
+            'INSERT OR IGNORE INTO users (username, password_hash, created_at) VALUES (?, ?, ?)',
+            (username, password_hash, created_at)
+        )
+        return cur.rowcount == 1
+
+    def update_password_hash(self, username, old_hash, new_hash):
+        cur = self._conn().execute(
+            'UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?',
+            (new_hash, username, old_hash)
+        )
+        return cur.rowcount == 1
+
+    def import_users(self, rows):
+        conn = self._conn()
+        added = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                added += self._insert_batch(conn, batch)
+                batch = []
+        if batch:
+            added += self._insert_batch(conn, batch)
+        return added
+
+    @staticmethod
+    def _insert_batch(conn, batch) -> int:
+        with db.transaction(conn):
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO users (username, password_hash, created_at) VALUES (?, ?, ?)',
+                batch
+            )
+            return conn.total_changes - before
+
+    def is_empty(self):
+        return self._conn().execute('SELECT 1 FROM users LIMIT 1').fetchone() is None
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+
+class PostgresUserStore(UserStore):
+    """PostgreSQL 用戶儲存 (每個行程一個連線池)"""
+
+    def __init__(self, dsn: str, max_connections: int = 10):
+        import psycopg2.pool  # 只有使用 Postgres 時才需要
+        self._pool_cls = psycopg2.pool.ThreadedConnectionPool
+        self.dsn = dsn
+        self.max_connections = max_connections
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        with self._cursor() as cur:
+            cur.execute(
+                'CREATE TABLE IF NOT EXISTS users ('
+                ' username TEXT PRIMARY KEY,'
+                ' password_hash TEXT NOT NULL,'
+                ' created_at TEXT NOT NULL'
+                ')'
+            )
+
+    def _get_pool(self):
+        # fork 之後要重建連線池，不能沿用父行程的 socket
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = self._pool_cls(1, self.max_connections, self.dsn)
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    @contextmanager
+    def _cursor(self):
+        pool = self._get_pool()
+        conn = pool.getconn()
+        try:
+            with conn:  # 離開時自動 commit / rollback
+                with conn.cursor() as cur:
+                    yield cur
+        finally:
+            pool.putconn(conn)
+
+    def get_user(self, username):
+        with self._cursor() as cur:
+            cur.execute('SELECT password_hash, created_at FROM users WHERE username = %s', (username,))
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return {'password_hash': row[0], 'created_at': row[1]}
+
+    def add_user(self, username, password_hash, created_at):
+        with self._cursor() as cur:
+            cur.execute(
+                'INSERT INTO users (username, password_hash, created_at) VALUES (%s, %s, %s) '
+                'ON CONFLICT (username) DO NOTHING',
+                (username, password_hash, created_at)
+            )
+            return cur.rowcount == 1
+
+    def update_password_hash(self, username, old_hash, new_hash):
+        with self._cursor() as cur:
+            cur.execute(
+                'UPDATE users SET password_hash = %s WHERE username = %s AND password_hash = %s',
+                (new_hash, username, old_hash)
+            )
+            return cur.rowcount == 1
+
+    def import_users(self, rows):
+        added = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                added += self._insert_batch(batch)
+                batch = []
+        if batch:
+            added += self._insert_batch(batch)
+        return added
+
+    def _insert_batch(self, batch) -> int:
+        from psycopg2.extras import execute_values
+        with self._cursor() as cur:
+            execute_values(
+                cur,
+                'INSERT INTO users (username, password_hash, created_at) VALUES %s '
+                'ON CONFLICT (username) DO NOTHING',
+                batch
+            )
+            return cur.rowcount
+
+    def is_empty(self):
+        with self._cursor() as cur:
+            cur.execute('SELECT 1 FROM users LIMIT 1')
+            return cur.fetchone() is None
+
+    def count(self):
+        with self._cursor() as cur:
+            cur.execute('SELECT COUNT(*) FROM users')
+            return cur.fetchone()[0]
+
+
+def open_user_store(url: Optional[str] = None) -> UserStore:
+    """
+    依網址建立用戶儲存
+    - postgres://... 或 postgresql://... → PostgresUserStore
+    - sqlite:///路徑 或 未設定 → SQLiteUserStore (預設 data/users.db)
+    """
+    if url is None:
+        url = os.environ.get("USER_STORE_URL", "")
+    if url.startswith(('postgres://', 'postgresql://')):
+        return PostgresUserStore(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteUserStore(db.db_path(url[len('sqlite:///'):]))
+    return SQLiteUserStore(db.db_path(DEFAULT_SQLITE_NAME))
+
+
+def read_users_json(path: str) -> Iterable[UserRow]:
+    """讀取舊版 users.json，轉成可以批次匯入的資料列"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        users = json.load(f)
+    return [
+        (name, info['password_hash'], info.get('created_at', ''))
+        for name, info in users.items()
+    ]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_user_store() -> UserStore:
+    """取得全域共用的用戶儲存 (第一次呼叫時建立)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = open_user_store()
+    return _store